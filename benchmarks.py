@@ -0,0 +1,694 @@
+"""Benchmarks for the SSIM pretty printer.
+
+Usage: python benchmarks.py <benchmark> [--copies N] [--json FILE]
+       python benchmarks.py <benchmark> --synthetic [--carriers N]
+                            [--flights N] [--variations N] [--legs N]
+                            [--deis N] [--seed N] [--gzip] [--json FILE]
+
+The sample schedule is tiny, so each benchmark works on a scratch copy of
+it with the flight records repeated --copies times, or on a schedule made
+by ssim_generator with --synthetic.  --json saves the results so runs of
+different versions can be compared.
+"""
+import Queue
+import argparse
+import bz2
+import datetime
+import gzip
+import json
+import multiprocessing
+import os
+import platform
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import zipfile
+
+import columnar
+import compact
+import connections
+import ingest
+import operating_dates
+import parallel
+import schedule_stats
+import ssim_generator
+import ssim_pprint
+import ssim_split
+import utils
+from flight_classes import RecordTwo, RecordThree, RecordFour, classify_record
+
+
+SAMPLE_SSIM = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'sample_data', 'hr.ssim.dat.gz')
+
+
+def make_large_ssim(directory, copies):
+    """Write a plain SSIM made of the sample flight records repeated.
+
+    Args:
+      directory: str.  Where to write the file.
+      copies: int.  How many times to repeat the record 3/4 block.
+    Returns:
+      The name of the file written.
+    """
+    lines = list(utils.read_lines(SAMPLE_SSIM))
+    lines[-1] = lines[-1].rstrip('\r\n') + '\r\n'
+    header = [l for l in lines if l[:1] in '12']
+    body = ''.join(l for l in lines if l[:1] in '34')
+    trailer = [l for l in lines if l[:1] == '5']
+    filename = os.path.join(directory, 'bench.ssim.dat')
+    with open(filename, 'wb') as f:
+        f.writelines(header)
+        for _ in range(copies):
+            f.write(body)
+        f.writelines(trailer)
+    return filename
+
+
+def first_flight(filename):
+    """Return (carrier, flight number) of the first record 3 in a file."""
+    for line in utils.read_lines(filename):
+        if line[:1] == '3':
+            return line[2:5].strip(), line[5:9].strip()
+    raise ValueError('No flights in {!r}'.format(filename))
+
+
+def timed(func, *args):
+    """Call func with args and return (seconds taken, result)."""
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+def count_lines(lines):
+    """Consume an iterable of lines and return how many there were."""
+    count = 0
+    for _ in lines:
+        count += 1
+    return count
+
+
+def compress_copies(filename):
+    """Write gz, bz2, zip and (if available) xz copies of filename.
+
+    Returns:
+      A list of (filetype, compressed file name) tuples.
+    """
+    copies = []
+    with open(filename, 'rb') as f_in:
+        f_out = gzip.open(filename + '.gz', 'wb')
+        shutil.copyfileobj(f_in, f_out)
+        f_out.close()
+    copies.append(('gz', filename + '.gz'))
+    with open(filename, 'rb') as f_in:
+        f_out = bz2.BZ2File(filename + '.bz2', 'wb')
+        shutil.copyfileobj(f_in, f_out)
+        f_out.close()
+    copies.append(('bz2', filename + '.bz2'))
+    with zipfile.ZipFile(filename + '.zip', 'w', zipfile.ZIP_DEFLATED) as z:
+        z.write(filename, os.path.basename(filename))
+    copies.append(('zip', filename + '.zip'))
+    if utils.lzma is not None:
+        with open(filename, 'rb') as f_in:
+            f_out = utils.lzma.LZMAFile(filename + '.xz', 'wb')
+            shutil.copyfileobj(f_in, f_out)
+            f_out.close()
+        copies.append(('xz', filename + '.xz'))
+    return copies
+
+
+def bench_reader(filename):
+    """Time utils.read_lines against naive reads of the same data.
+
+    Returns:
+      A list of (label, seconds, lines read) tuples.
+    """
+    results = []
+    with open(filename, 'rb') as f:
+        seconds, lines = timed(count_lines, f)
+    results.append(('open() plain', seconds, lines))
+    seconds, lines = timed(count_lines, utils.read_lines(filename))
+    results.append(('read_lines plain', seconds, lines))
+    for filetype, compressed in compress_copies(filename):
+        if filetype == 'gz':
+            f = gzip.open(compressed, 'rb')
+            seconds, lines = timed(count_lines, f)
+            f.close()
+            results.append(('gzip.open() gz', seconds, lines))
+        seconds, lines = timed(count_lines, utils.read_lines(compressed))
+        results.append(('read_lines ' + filetype, seconds, lines))
+    return results
+
+
+def regex_parse_records(carrier, filename):
+    """The per-line regex parse_records loop that classify_record replaced."""
+    carrier_regex = '^2.' + carrier.upper()
+    leg_regex = '^3.' + carrier.upper()
+    seg_regex = '^4.' + carrier.upper()
+    carrier_record = []
+    leg_records = []
+    seg_records = []
+    for line in utils.read_lines(filename):
+        if re.search(carrier_regex, line):
+            carrier_record.append(RecordTwo(line))
+        if re.search(leg_regex, line):
+            leg_records.append(RecordThree(line))
+        if re.search(seg_regex, line):
+            seg_records.append(RecordFour(line))
+    return carrier_record, leg_records, seg_records
+
+
+def bench_classifier(filename):
+    """Time classify_record dispatch against the old regex matching.
+
+    Both the bare classification loop and full parse_records are timed.
+
+    Returns:
+      A list of (label, seconds, lines read) tuples.
+    """
+    carrier = first_flight(filename)[0]
+    carrier_regexes = ['^{}.{}'.format(record_type, carrier)
+                       for record_type in '234']
+
+    def regex_classify(lines):
+        count = 0
+        for line in lines:
+            count += 1
+            for regex in carrier_regexes:
+                re.search(regex, line)
+        return count
+
+    def dispatch_classify(lines):
+        count = 0
+        for line in lines:
+            count += 1
+            classify_record(line, carrier)
+        return count
+
+    lines = list(utils.read_lines(filename))
+    results = []
+    seconds, count = timed(regex_classify, lines)
+    results.append(('regex classify', seconds, count))
+    seconds, count = timed(dispatch_classify, lines)
+    results.append(('classify_record', seconds, count))
+    seconds, records = timed(regex_parse_records, carrier, filename)
+    results.append(('regex parse_records', seconds, len(lines)))
+    seconds, records = timed(ssim_pprint.parse_records, carrier, filename)
+    results.append(('parse_records', seconds, len(lines)))
+    return results
+
+
+def record_size(record):
+    """Approximate bytes held by a record object, its line and its cache."""
+    size = sys.getsizeof(record) + sys.getsizeof(record.original_record)
+    if record._fields:
+        size += sys.getsizeof(record._fields)
+        size += sum(sys.getsizeof(v) for v in record._fields.values())
+    return size
+
+
+def bench_records(filename):
+    """Time lazy record parsing against splitting the file into lines.
+
+    Also reports the approximate size of a record 3 before and after all
+    of its fields have been decoded.
+
+    Returns:
+      A list of (label, seconds, lines read) tuples.
+    """
+    results = []
+    seconds, lines = timed(count_lines, utils.read_lines(filename))
+    results.append(('split lines', seconds, lines))
+    seconds, records = timed(ssim_pprint.parse_records,
+                             first_flight(filename)[0], filename)
+    results.append(('parse_records', seconds, lines))
+    leg_records = records[1]
+    seconds, count = timed(count_lines,
+                           (r.departure_station for r in leg_records))
+    results.append(('decode one field', seconds, count))
+    print('record 3 size: {} bytes undecoded'.format(
+        record_size(leg_records[0])))
+    leg_records[0].as_dict()
+    print('record 3 size: {} bytes fully decoded'.format(
+        record_size(leg_records[0])))
+    return results
+
+
+def build_flights_decoded(filename):
+    """Flight objects with every record 3 and 4 field decoded."""
+    flights = parallel.parse_flights(filename, 1)
+    for flight in flights.values():
+        for variation in flight.ivi.values():
+            for leg in variation.legs.values():
+                if leg.record is not None:
+                    leg.record.as_dict()
+    return flights
+
+
+def build_leg_table(filename):
+    columnar.require_numpy()
+    return columnar.LegTable.from_file(filename)
+
+
+# Models of a whole schedule compared by the memory benchmark.
+MODELS = (
+    ('Flight objects', lambda filename: parallel.parse_flights(filename, 1)),
+    ('Flight objects, decoded', build_flights_decoded),
+    ('CompactSchedule', compact.CompactSchedule.from_file),
+    ('LegTable (record 3 only)', build_leg_table),
+    ('ScheduleStats (aggregates only)', schedule_stats.schedule_stats),
+    )
+
+
+def _child_main(target, args, queue):
+    """Child process entry point for run_in_child."""
+    try:
+        queue.put(('result', target(*args)))
+    except BaseException:
+        queue.put(('error', traceback.format_exc()))
+
+
+def run_in_child(target, *args):
+    """Call target(*args) in a fresh process and return its result.
+
+    Raises:
+      RuntimeError: if target raised, or the process died without
+        reporting a result, e.g. when it was killed for running out of
+        memory.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_child_main,
+                                      args=(target, args, queue))
+    process.start()
+    try:
+        while True:
+            alive = process.is_alive()
+            try:
+                status, value = queue.get(timeout=1)
+                break
+            except Queue.Empty:
+                if not alive:
+                    raise RuntimeError(
+                        '{} exited with code {} without a result'.format(
+                            target.__name__, process.exitcode))
+    finally:
+        process.join()
+    if status == 'error':
+        raise RuntimeError('{} failed in a child process:\n{}'.format(
+                target.__name__, value))
+    return value
+
+
+def _measure_model(build, filename):
+    """Child process entry point: build a model and report its growth."""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    model = build(filename)
+    seconds = time.time() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return seconds, after - before
+
+
+def bench_memory(filename):
+    """Measure the memory each schedule model needs per leg.
+
+    Every model is built in a fresh process and charged with the growth of
+    its peak resident size, which includes anything held while building.
+
+    Returns:
+      A list of (label, seconds, legs, peak growth in KB) tuples.
+    """
+    legs = count_lines(line for line in utils.read_lines(filename)
+                       if line[:1] == '3')
+    results = []
+    for label, build in MODELS:
+        if build is build_leg_table and columnar.np is None:
+            continue
+        seconds, growth = run_in_child(_measure_model, build, filename)
+        print('{}: {} bytes per leg'.format(label,
+                                            growth * 1024 // max(legs, 1)))
+        results.append((label, seconds, legs, growth))
+    return results
+
+
+def bench_columnar(filename):
+    """Time LegTable loading and queries against a loop over record objects.
+
+    Returns:
+      A list of (label, seconds, legs) tuples.
+    """
+    results = []
+    seconds, legs = timed(columnar.LegTable.from_file, filename)
+    results.append(('LegTable.from_file', seconds, len(legs)))
+    seconds, records = timed(ssim_pprint.parse_records, 'HR', filename)
+    leg_records = records[1]
+    results.append(('parse_records', seconds, len(leg_records)))
+
+    def loop_query(records):
+        return [r for r in records
+                if r.departure_station == 'DUS' and r.aircraft_type == 'CNJ']
+
+    seconds, matches = timed(loop_query, leg_records)
+    results.append(('station query, loop', seconds, len(matches)))
+    legs.filter(departure_station='LUX')
+    seconds, matches = timed(lambda: legs.filter(departure_station='DUS',
+                                                 aircraft_type='CNJ'))
+    results.append(('station query, LegTable', seconds, len(matches)))
+    seconds, matches = timed(lambda: legs.filter(operating_on='2015-01-02'))
+    results.append(('date query, LegTable', seconds, len(matches)))
+
+    def loop_block_times(records):
+        return [schedule_stats.ScheduleStats.block_time(r.original_record)
+                for r in records]
+
+    seconds, blocks = timed(loop_block_times, leg_records)
+    results.append(('block times, loop', seconds, len(blocks)))
+    seconds, blocks = timed(lambda: columnar.LegTable(
+            legs.records, legs.time_modes).block_minutes)
+    results.append(('block times, LegTable', seconds, len(blocks)))
+    return results
+
+
+def bench_operating(filename):
+    """Time building the operating date index and querying it.
+
+    Returns:
+      A list of (label, seconds, legs or flights found) tuples.
+    """
+    results = []
+    legs = columnar.LegTable.from_file(filename)
+    seconds, index = timed(operating_dates.OperatingIndex, legs)
+    results.append(('OperatingIndex', seconds, len(legs)))
+    day = index.first_day + (index.last_day - index.first_day) // 2
+    for label, query, args in (
+            ('legs_on', index.legs_on, (day,)),
+            ('flights_on', index.flights_on, (day,)),
+            ('flights_between, 7 days', index.flights_between,
+             (day, day + 6))):
+        seconds, found = timed(query, *args)
+        results.append((label, seconds, len(found)))
+    seconds, matches = timed(lambda: legs.filter(operating_on=day))
+    results.append(('LegTable.filter', seconds, len(matches)))
+    return results
+
+
+def bench_connections(filename):
+    """Time building the route index and searching for itineraries.
+
+    The search runs between the two stations with the most departures.
+
+    Returns:
+      A list of (label, seconds, legs or itineraries) tuples.
+    """
+    results = []
+    legs = columnar.LegTable.from_file(filename)
+    seconds, routes = timed(connections.RouteIndex, legs)
+    results.append(('RouteIndex', seconds, len(legs)))
+    busiest = columnar.np.argsort(columnar.np.bincount(routes.departure_ids))
+    origin, destination = [routes.stations[i] for i in busiest[-2:]]
+    operating = routes.operating
+    day = operating.first_day + (operating.last_day -
+                                 operating.first_day) // 2
+    for stops in range(connections.MAX_STOPS + 1):
+        seconds, found = timed(routes.connections, origin, destination, day,
+                               stops)
+        results.append(('{} stop(s)'.format(stops), seconds, len(found)))
+    return results
+
+
+def bench_split(filename):
+    """Time splitting a file by carrier in one pass against one
+    makeSingleCarrierSSIM pass per carrier.
+
+    Returns:
+      A list of (label, seconds, files written) tuples.
+    """
+    carriers = []
+    for line in utils.read_lines(filename):
+        if line[:1] == '2' and line[2:5].strip() not in carriers:
+            carriers.append(line[2:5].strip())
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        def one_per_carrier():
+            for carrier in carriers:
+                utils.makeSingleCarrierSSIM(
+                    carrier, filename,
+                    os.path.join(directory, carrier + '.dat'))
+        seconds, _ = timed(one_per_carrier)
+        results.append(('makeSingleCarrierSSIM x{}'.format(len(carriers)),
+                        seconds, len(carriers)))
+        seconds, outputs = timed(ssim_split.split_ssim, filename, directory)
+        results.append(('split_ssim', seconds, len(outputs)))
+        seconds, outputs = timed(ssim_split.split_ssim, filename, directory,
+                                 ssim_split.DEFAULT_TEMPLATE, None, 1)
+        results.append(('split_ssim, 1 open file', seconds, len(outputs)))
+        seconds, outputs = timed(ssim_split.split_ssim, filename, directory,
+                                 ssim_split.DEFAULT_TEMPLATE, None,
+                                 ssim_split.DEFAULT_MAX_OPEN, True)
+        results.append(('split_ssim, gzip', seconds, len(outputs)))
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def bench_ingest(filename):
+    """Time loading one gzip file per carrier, made by splitting the input,
+    one file after another and with ingest.
+
+    Returns:
+      A list of (label, seconds, flights) tuples.
+    """
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        outputs = ssim_split.split_ssim(filename, directory, compress=True)
+        filenames = [output for output, records in outputs.values()]
+
+        def one_at_a_time():
+            flights = {}
+            for name in filenames:
+                flights.update(parallel.parse_flights(name, 1))
+            return flights
+        seconds, flights = timed(one_at_a_time)
+        results.append(('parse_flights x{}'.format(len(filenames)), seconds,
+                        len(flights)))
+        cpus = multiprocessing.cpu_count()
+        for threads, workers in ((1, 1), (ingest.DEFAULT_THREADS, 1),
+                                 (ingest.DEFAULT_THREADS, cpus)):
+            seconds, (flights, reports) = timed(ingest.ingest, [directory],
+                                                threads, workers)
+            results.append(('ingest, {} threads, {} workers'.format(
+                        threads, workers), seconds, len(flights)))
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def bench_parallel(filename):
+    """Time parallel.parse_flights with a growing number of workers.
+
+    Returns:
+      A list of (label, seconds, flights) tuples.
+    """
+    results = []
+    workers = 1
+    while True:
+        seconds, flights = timed(parallel.parse_flights, filename, workers)
+        results.append(('{} worker(s)'.format(workers), seconds,
+                        len(flights)))
+        if workers >= multiprocessing.cpu_count():
+            break
+        workers = min(workers * 2, multiprocessing.cpu_count())
+    compressed = compress_copies(filename)[0][1]
+    seconds, flights = timed(parallel.parse_flights, compressed)
+    results.append(('gz, all workers', seconds, len(flights)))
+    return results
+
+
+def stage_read(filename, carrier, flight_num):
+    return count_lines(utils.read_lines(filename))
+
+
+def stage_parse_records(filename, carrier, flight_num):
+    carrier_record, leg_records, seg_records = ssim_pprint.parse_records(
+        carrier, filename)
+    return len(leg_records) + len(seg_records)
+
+
+def stage_flight_lines(filename, carrier, flight_num):
+    return count_lines(utils.flight_lines(utils.read_lines(filename),
+                                          carrier, flight_num))
+
+
+def stage_flights(filename, carrier, flight_num):
+    carrier_record, leg_records, seg_records = ssim_pprint.parse_records(
+        carrier, filename)
+    flights = ssim_pprint.create_flights(carrier_record[0], leg_records, {})
+    ssim_pprint.update_flights(leg_records, flights)
+    ssim_pprint.update_flights(seg_records, flights)
+    return len(flights)
+
+
+def stage_cli(filename, carrier, flight_num):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'ssim_pprint.py')
+    with open(os.devnull, 'wb') as devnull:
+        return subprocess.call([sys.executable, script, 'lookup',
+                                '-c', carrier, '-f', flight_num,
+                                '-s', filename], stdout=devnull)
+
+
+# Stages of a lookup, in pipeline order.
+STAGES = (
+    ('read_lines', stage_read),
+    ('parse_records', stage_parse_records),
+    ('flight_lines', stage_flight_lines),
+    ('create/update_flights', stage_flights),
+    ('ssim_pprint lookup', stage_cli),
+    )
+
+
+def _run_stage(stage, args):
+    """Child process entry point: run one stage and report its cost.
+
+    ru_maxrss is a high water mark for the whole process, so every stage
+    gets a fresh process.  The CLI stage runs in a grandchild, whose peak
+    shows up in RUSAGE_CHILDREN.
+    """
+    sys.stdout = open(os.devnull, 'w')
+    start = time.time()
+    stage(*args)
+    seconds = time.time() - start
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return seconds, peak
+
+
+def bench_stages(filename):
+    """Time every stage of a flight lookup in its own process.
+
+    Each stage reads the whole file, so throughput is given against the
+    file's line count.
+
+    Returns:
+      A list of (label, seconds, lines, peak resident memory in KB)
+      tuples.
+    """
+    carrier, flight_num = first_flight(filename)
+    lines = count_lines(utils.read_lines(filename))
+    results = []
+    for label, stage in STAGES:
+        seconds, peak = run_in_child(_run_stage, stage,
+                                     (filename, carrier, flight_num))
+        results.append((label, seconds, lines, peak))
+    return results
+
+
+BENCHMARKS = {
+    'classifier': bench_classifier,
+    'columnar': bench_columnar,
+    'connections': bench_connections,
+    'ingest': bench_ingest,
+    'memory': bench_memory,
+    'operating': bench_operating,
+    'parallel': bench_parallel,
+    'records': bench_records,
+    'reader': bench_reader,
+    'split': bench_split,
+    'stages': bench_stages,
+    }
+
+
+def save_results(filename, benchmark, ssim, options, results):
+    """Write benchmark results as JSON for comparison between versions.
+
+    Args:
+      filename: str.  The JSON file to write.
+      benchmark: str.  The benchmark that was run.
+      ssim: str.  The SSIM file it ran against.
+      options: dict.  The command line options used.
+      results: list.  (label, seconds, count[, peak KB]) tuples.
+    """
+    megabytes = os.path.getsize(ssim) / float(1024 * 1024)
+    rows = []
+    for result in results:
+        label, seconds, count = result[:3]
+        peak = result[3] if len(result) > 3 else None
+        rows.append({
+            'label': label,
+            'seconds': seconds,
+            'count': count,
+            'mb_per_second': megabytes / max(seconds, 1e-9),
+            'peak_rss_kb': peak,
+            })
+    with open(filename, 'w') as f:
+        json.dump({
+            'benchmark': benchmark,
+            'created': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'megabytes': megabytes,
+            'options': options,
+            'results': rows,
+            }, f, indent=2, sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run SSIM benchmarks')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--copies', type=int, default=5000,
+                        help='Times to repeat the sample flight records')
+    parser.add_argument('--synthetic', action='store_true',
+                        help='Benchmark a generated schedule instead')
+    parser.add_argument('--carriers', type=int, default=5)
+    parser.add_argument('--flights', type=int, default=1000,
+                        help='Flights per carrier')
+    parser.add_argument('--variations', type=int, default=5,
+                        help='Variations per flight')
+    parser.add_argument('--legs', type=int, default=2,
+                        help='Legs per variation')
+    parser.add_argument('--deis', type=int, default=2,
+                        help='Record 4s per leg')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--gzip', action='store_true',
+                        help='Gzip the generated schedule')
+    parser.add_argument('--json', metavar='FILE',
+                        help='Also save the results to FILE as JSON')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        if args.synthetic:
+            filename = os.path.join(directory, 'synthetic.ssim.dat')
+            if args.gzip:
+                filename += '.gz'
+            ssim_generator.generate_ssim(
+                filename, args.gzip, carriers=args.carriers,
+                flights=args.flights, variations=args.variations,
+                legs=args.legs, deis=args.deis, seed=args.seed)
+        else:
+            filename = make_large_ssim(directory, args.copies)
+        megabytes = os.path.getsize(filename) / float(1024 * 1024)
+        print('{}: {:.1f} MB of SSIM data'.format(args.benchmark, megabytes))
+        results = BENCHMARKS[args.benchmark](filename)
+        for result in results:
+            label, seconds, lines = result[:3]
+            line = '{:<24} {:8.3f}s {:10d} lines {:8.1f} MB/s'.format(
+                label, seconds, lines, megabytes / max(seconds, 1e-9))
+            if len(result) > 3:
+                line += ' {:8.1f} MB peak'.format(result[3] / 1024.0)
+            print(line)
+        if args.json:
+            save_results(args.json, args.benchmark, filename, vars(args),
+                         results)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+"""Columnar access to record 3 data using NumPy.
+
+NumPy is optional; everything else in the package works without it.
+"""
+import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import utils
+from flight_classes import RecordThree
+
+
+RECORD_LENGTH = 200
+# Columns shown for each leg by the search command.
+SUMMARY_COLUMNS = ('carrier_code', 'flight', 'ivi', 'leg_sequence',
+                   'departure_station', 'passenger_std', 'arrival_station',
+                   'passenger_sta', 'aircraft_type',
+                   'period_of_operation_start', 'period_of_operation_end',
+                   'days_of_operation')
+# Computed columns of each leg, see LegTable.
+TIME_COLUMNS = ('departure_utc', 'arrival_utc', 'block_minutes', 'overnight',
+                'times_valid')
+MONTHS = ('APR', 'AUG', 'DEC', 'FEB', 'JAN', 'JUL',
+          'JUN', 'MAR', 'MAY', 'NOV', 'OCT', 'SEP')
+# Month number for each entry of MONTHS, which is sorted for searchsorted.
+MONTH_NUMBERS = (4, 8, 12, 2, 1, 7, 6, 3, 5, 11, 10, 9)
+
+
+def require_numpy():
+    """Raise a helpful error when NumPy is not installed."""
+    if np is None:
+        raise ImportError('The columnar engine requires NumPy, '
+                          'install it with "pip install numpy"')
+
+
+def record_three_dtype():
+    """Build a structured dtype over a raw record 3 from RecordThree.LAYOUT.
+
+    Returns:
+      A numpy dtype with one fixed-width string field per layout entry plus
+      'record_type', laid out at the same offsets as the SSIM columns.
+    """
+    require_numpy()
+    layout = (('record_type', 0, 1),) + RecordThree.LAYOUT
+    return np.dtype({
+        'names': [name for name, start, end in layout],
+        'formats': ['S{}'.format(end - start) for name, start, end in layout],
+        'offsets': [start for name, start, end in layout],
+        'itemsize': RECORD_LENGTH,
+        })
+
+
+def ssim_dates(column):
+    """Convert a column of SSIM 'DDMONYY' dates to datetime64[D].
+
+    Dates that cannot be read, such as the open ended '00XXX00', become
+    NaT.
+
+    Args:
+      column: numpy array of 7 byte strings.
+    Returns:
+      A numpy datetime64[D] array of the same length.
+    """
+    require_numpy()
+    raw = np.frombuffer(np.ascontiguousarray(column, 'S7').tobytes(),
+                        'S1').reshape(-1, 7)
+    digits = raw.view(np.uint8).astype(np.int64) - 48
+    day = digits[:, 0] * 10 + digits[:, 1]
+    year = 2000 + digits[:, 5] * 10 + digits[:, 6]
+    month_names = np.ascontiguousarray(raw[:, 2:5]).view('S3').ravel()
+    months = np.array(MONTHS, 'S3')
+    position = np.searchsorted(months, month_names).clip(0, len(months) - 1)
+    valid = months[position] == month_names
+    month = np.array(MONTH_NUMBERS, np.int64)[position]
+    valid &= (day >= 1) & (day <= 31)
+    base = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    dates = base.astype('datetime64[D]') + (day - 1)
+    dates[~valid] = np.datetime64('NaT')
+    return dates
+
+
+def to_datetime64(date):
+    """Accept a datetime.date, 'YYYY-MM-DD' or 'DDMONYY' and return a day."""
+    require_numpy()
+    if isinstance(date, np.datetime64):
+        return date.astype('datetime64[D]')
+    if isinstance(date, datetime.date):
+        return np.datetime64(date.isoformat(), 'D')
+    if len(date) == 7 and date[2:5].isalpha():
+        day = ssim_dates(np.array([date.upper()], 'S7'))[0]
+        if np.isnat(day):
+            raise ValueError('Unrecognised date {!r}'.format(date))
+        return day
+    return np.datetime64(date, 'D')
+
+
+def iso_weekdays(dates):
+    """Return ISO weekday numbers (Monday is 1) for datetime64[D] values."""
+    return (dates.astype('datetime64[D]').astype(np.int64) + 3) % 7 + 1
+
+
+def date_variation_days(column):
+    """Convert a column of SSIM date variation characters to day offsets.
+
+    '0' to '9' are that many days later, 'A' is the day before and a blank
+    is the same day.
+
+    Args:
+      column: numpy array of 1 byte strings.
+    Returns:
+      A numpy int64 array of the same length.
+    """
+    raw = np.frombuffer(np.ascontiguousarray(column, 'S1').tobytes(),
+                        np.uint8).astype(np.int64)
+    days = raw - ord('0')
+    days[(raw < ord('0')) | (raw > ord('9'))] = 0
+    days[raw == ord('A')] = -1
+    return days
+
+
+def ssim_minutes(column):
+    """Convert a column of SSIM 'HHMM' times to minutes after midnight.
+
+    Args:
+      column: numpy array of 4 byte strings.
+    Returns:
+      A numpy int64 array of the same length, 0 where the time is blank.
+    """
+    raw = np.frombuffer(np.ascontiguousarray(column, 'S4').tobytes(),
+                        np.uint8).reshape(-1, 4).astype(np.int64) - ord('0')
+    raw[(raw < 0) | (raw > 9)] = 0
+    return (raw[:, 0] * 10 + raw[:, 1]) * 60 + raw[:, 2] * 10 + raw[:, 3]
+
+
+def valid_times(column):
+    """True where an SSIM 'HHMM' time is four digits with minutes below 60.
+
+    Args:
+      column: numpy array of 4 byte strings.
+    Returns:
+      A numpy boolean array of the same length.
+    """
+    raw = np.frombuffer(np.ascontiguousarray(column, 'S4').tobytes(),
+                        np.uint8).reshape(-1, 4)
+    digits = (raw >= ord('0')) & (raw <= ord('9'))
+    return digits.all(axis=1) & (raw[:, 2] < ord('6'))
+
+
+def valid_utc_offsets(column):
+    """True where an SSIM UTC variation is a sign followed by 'HHMM'.
+
+    Args:
+      column: numpy array of 5 byte strings.
+    Returns:
+      A numpy boolean array of the same length.
+    """
+    raw = np.ascontiguousarray(column, 'S5')
+    pairs = np.frombuffer(raw.tobytes(), 'S1').reshape(-1, 5)
+    return (((pairs[:, 0] == '+') | (pairs[:, 0] == '-')) &
+            valid_times(np.ascontiguousarray(pairs[:, 1:]).view('S4')
+                        .ravel()))
+
+
+def utc_offset_minutes(column):
+    """Convert a column of SSIM '+HHMM' UTC variations to signed minutes.
+
+    Args:
+      column: numpy array of 5 byte strings.
+    Returns:
+      A numpy int64 array of the same length, 0 where the field is blank.
+    """
+    raw = np.ascontiguousarray(column, 'S5')
+    pairs = np.frombuffer(raw.tobytes(), 'S1').reshape(-1, 5)
+    minutes = ssim_minutes(np.ascontiguousarray(pairs[:, 1:]).view('S4')
+                           .ravel())
+    return np.where(pairs[:, 0] == '-', -minutes, minutes)
+
+
+class LegTable(object):
+    """All record 3s of a schedule held as a NumPy structured array.
+
+    Each column is a fixed-width byte string at the RecordThree offsets;
+    use column() for stripped values and filter() for vectorized queries.
+    The TIME_COLUMNS are computed for every leg at once on first use.
+
+    Args:
+      records: numpy array of record_three_dtype().
+      time_modes: dict.  Carrier code -> record 2 time mode, 'U' when the
+        carrier's times are UTC.  Carriers not in it keep local times.
+    """
+
+    def __init__(self, records, time_modes=None):
+        self.records = records
+        self.time_modes = dict(time_modes or {})
+        self._period_start = None
+        self._period_end = None
+        self._days = None
+        self._variations = None
+        self._times = None
+        self._times_valid = None
+
+    @classmethod
+    def from_file(cls, filename, carrier=None):
+        """Load every record 3 of an SSIM file, optionally for one carrier.
+
+        Args:
+          filename: str.  Plain or compressed SSIM file.
+          carrier: str.  Only keep this carrier's legs.
+        Returns:
+          A LegTable.
+        """
+        require_numpy()
+        prefix = None
+        if carrier:
+            prefix = carrier.upper().ljust(3)
+        time_modes = {}
+        legs = []
+        for line in utils.read_lines(filename):
+            if prefix is not None and line[2:5] != prefix:
+                continue
+            if line[:1] == '3':
+                legs.append(line[:RECORD_LENGTH].ljust(RECORD_LENGTH))
+            elif line[:1] == '2':
+                time_modes.setdefault(line[2:5].strip(), line[1])
+        return cls(np.frombuffer(''.join(legs), record_three_dtype()),
+                   time_modes)
+
+    def __len__(self):
+        return len(self.records)
+
+    def rows(self, names):
+        """Yield a tuple of the raw fixed-width values of names per leg."""
+        columns = [self.records[name] for name in names]
+        for i in range(len(self.records)):
+            yield tuple(column[i] for column in columns)
+
+    def column(self, name):
+        """Return a column with the SSIM padding stripped.
+
+        The TIME_COLUMNS are returned as computed.
+        """
+        if name in TIME_COLUMNS:
+            return getattr(self, name)
+        return np.char.strip(self.records[name])
+
+    @property
+    def period_start(self):
+        """First day of each leg's period of operation, as datetime64[D]."""
+        if self._period_start is None:
+            self._period_start = ssim_dates(
+                self.records['period_of_operation_start'])
+        return self._period_start
+
+    @property
+    def period_end(self):
+        """Last day of each leg's period of operation, as datetime64[D].
+
+        Open ended periods are reported as the latest representable day.
+        """
+        if self._period_end is None:
+            end = ssim_dates(self.records['period_of_operation_end'])
+            end[np.isnat(end)] = np.datetime64('9999-12-31')
+            self._period_end = end
+        return self._period_end
+
+    @property
+    def days_of_operation(self):
+        """Boolean (legs, 7) array, column 0 is Monday."""
+        if self._days is None:
+            raw = np.frombuffer(
+                np.ascontiguousarray(self.records['days_of_operation'],
+                                     'S7').tobytes(), np.uint8)
+            digits = np.arange(ord('1'), ord('8'), dtype=np.uint8)
+            self._days = raw.reshape(-1, 7) == digits
+        return self._days
+
+    @property
+    def fortnightly(self):
+        """True for legs with a frequency rate of 2, every other week."""
+        return self.records['frequency_rate'] == '2'
+
+    def _date_variations(self):
+        if self._variations is None:
+            raw = np.ascontiguousarray(self.records['date_variation'], 'S2')
+            pairs = np.frombuffer(raw.tobytes(), 'S1').reshape(-1, 2)
+            self._variations = (date_variation_days(pairs[:, 0]),
+                                date_variation_days(pairs[:, 1]))
+        return self._variations
+
+    @property
+    def departure_variation(self):
+        """Days from each flight date to the leg's local departure date."""
+        return self._date_variations()[0]
+
+    @property
+    def arrival_variation(self):
+        """Days from each flight date to the leg's local arrival date."""
+        return self._date_variations()[1]
+
+    @property
+    def utc_times(self):
+        """True for legs whose carrier's record 2 gives times in UTC."""
+        carriers = [code.ljust(3) for code, mode in self.time_modes.items()
+                    if mode == 'U']
+        if not carriers:
+            return np.zeros(len(self.records), bool)
+        return np.in1d(self.records['carrier_code'],
+                       np.array(carriers, 'S3'))
+
+    def _utc_minutes(self):
+        if self._times is None:
+            records = self.records
+            departure_offset = utc_offset_minutes(
+                records['departure_utc_variation'])
+            arrival_offset = utc_offset_minutes(
+                records['arrival_utc_variation'])
+            utc = self.utc_times
+            departure_offset[utc] = 0
+            arrival_offset[utc] = 0
+            self._times = (
+                ssim_minutes(records['passenger_std']) - departure_offset +
+                self.departure_variation * 1440,
+                ssim_minutes(records['passenger_sta']) - arrival_offset +
+                self.arrival_variation * 1440)
+        return self._times
+
+    @property
+    def times_valid(self):
+        """True for legs whose times can be put in UTC.
+
+        A leg needs a passenger STD and STA, UTC variations unless its
+        schedule is in UTC, and must not arrive before it departs;
+        ScheduleStats.block_time gives None for the same legs.
+        """
+        if self._times_valid is None:
+            records = self.records
+            offsets = (valid_utc_offsets(records['departure_utc_variation']) &
+                       valid_utc_offsets(records['arrival_utc_variation']))
+            departures, arrivals = self._utc_minutes()
+            self._times_valid = (valid_times(records['passenger_std']) &
+                                 valid_times(records['passenger_sta']) &
+                                 (offsets | self.utc_times) &
+                                 (arrivals >= departures))
+        return self._times_valid
+
+    @property
+    def departure_utc(self):
+        """Minutes from 00:00 UTC on each flight date to departure, in UTC.
+
+        Local times are corrected by the leg's UTC variation; times of a
+        UTC schedule are taken as they are.  Only meaningful where
+        times_valid is True.
+        """
+        return self._utc_minutes()[0]
+
+    @property
+    def arrival_utc(self):
+        """Minutes from 00:00 UTC on each flight date to arrival, in UTC.
+
+        Only meaningful where times_valid is True.
+        """
+        return self._utc_minutes()[1]
+
+    @property
+    def block_minutes(self):
+        """Minutes from departure to arrival of each leg.
+
+        -1 where times_valid is False.
+        """
+        departures, arrivals = self._utc_minutes()
+        return np.where(self.times_valid, arrivals - departures, -1)
+
+    @property
+    def overnight(self):
+        """True for legs arriving on a later date than they depart.
+
+        Dates are local, or UTC for a UTC schedule, as the record 3 date
+        variations give them.
+        """
+        return self.arrival_variation > self.departure_variation
+
+    def operates(self, flight_dates):
+        """Check whether each leg's flight operates on a flight date.
+
+        The period and days of operation of a record 3 describe the flight
+        date, the local departure date of its first leg.  Fortnightly legs
+        operate in the first week of their period, counted from Monday,
+        and every second week after it.
+
+        Args:
+          flight_dates: datetime64[D] value, or array with one per leg.
+        Returns:
+          A numpy boolean array with one entry per leg.
+        """
+        dates = np.broadcast_to(np.asarray(flight_dates, 'datetime64[D]'),
+                                (len(self.records),))
+        mask = (self.period_start <= dates) & (self.period_end >= dates)
+        mask &= self.days_of_operation[np.arange(len(self.records)),
+                                       iso_weekdays(dates) - 1]
+        fortnightly = self.fortnightly
+        if fortnightly.any():
+            start = self.period_start
+            monday = start - (iso_weekdays(start) - 1)
+            weeks = (dates - monday).astype(np.int64) // 7
+            mask &= ~fortnightly | (weeks % 2 == 0)
+        return mask
+
+    def mask(self, carrier=None, departure_station=None,
+             arrival_station=None, aircraft_type=None, service_type=None,
+             days=None, operating_on=None, period=None):
+        """Build a boolean mask of the legs matching every given criterion.
+
+        Args:
+          carrier: str.  IATA carrier code.
+          departure_station: str or list of str.  Departure airport(s).
+          arrival_station: str or list of str.  Arrival airport(s).
+          aircraft_type: str or list of str.  IATA aircraft type(s).
+          service_type: str or list of str.  Service type code(s).
+          days: iterable of int.  ISO weekdays, legs operating on any match.
+          operating_on: date.  Legs departing on that local date, after
+            frequency rate and date variation are taken into account.
+          period: tuple of dates.  Legs whose period of operation overlaps
+            the inclusive (first, last) range.
+        Returns:
+          A numpy boolean array with one entry per leg.
+        """
+        mask = np.ones(len(self.records), bool)
+        for name, value in (('carrier_code', carrier),
+                            ('departure_station', departure_station),
+                            ('arrival_station', arrival_station),
+                            ('aircraft_type', aircraft_type),
+                            ('service_type', service_type)):
+            if value is None:
+                continue
+            if isinstance(value, basestring):
+                value = [value]
+            width = self.records.dtype[name].itemsize
+            wanted = np.array([v.upper().ljust(width) for v in value],
+                              'S{}'.format(width))
+            mask &= np.in1d(self.records[name], wanted)
+        if days is not None:
+            columns = [day - 1 for day in days]
+            mask &= self.days_of_operation[:, columns].any(axis=1)
+        if operating_on is not None:
+            day = to_datetime64(operating_on)
+            mask &= self.operates(day - self.departure_variation)
+        if period is not None:
+            first, last = [to_datetime64(d) for d in period]
+            mask &= (self.period_start <= last) & (self.period_end >= first)
+        return mask
+
+    def filter(self, **criteria):
+        """Return a new LegTable holding only the legs matching criteria.
+
+        Takes the same keyword arguments as mask().
+        """
+        return LegTable(self.records[self.mask(**criteria)], self.time_modes)
@@ -0,0 +1,400 @@
+"""A compact, dictionary-encoded schedule for loading whole networks.
+
+Flight objects keep every record as its 200 byte line plus a dict of the
+fields decoded so far, and every copy of 'FRA' or '320' is a separate
+string.  A CompactSchedule keeps one row per leg and one per DEI in
+array columns instead:
+
+  - codes such as stations, aircraft types and DEI data are numbers into
+    one CodeTable shared by every column, so each distinct value is
+    stored once;
+  - times and UTC variations are minutes, dates are day ordinals, the
+    days of operation are a bitmask and sequence numbers are small ints;
+  - carrier metadata is the carrier's single RecordTwo.
+
+Values that do not fit their column, such as the open ended '00XXX00'
+date, are kept as strings on the side, so every field reads back exactly
+as RecordThree and RecordFour return it.  Needs no third party packages.
+"""
+import array
+import bisect
+import datetime
+
+import dei
+import utils
+from flight_classes import RecordFour, RecordThree, RecordTwo
+
+
+MONTHS = ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN',
+          'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC')
+MONTH_NUMBERS = dict((month, number) for number, month in enumerate(MONTHS, 1))
+
+# Column encodings of the record 3 and 4 fields; the rest are codes.
+FIELD_KINDS = {
+    'ivi': 'sequence',
+    'leg_sequence': 'sequence',
+    'period_of_operation_start': 'date',
+    'period_of_operation_end': 'date',
+    'days_of_operation': 'days',
+    'passenger_std': 'time',
+    'aircraft_std': 'time',
+    'aircraft_sta': 'time',
+    'passenger_sta': 'time',
+    'departure_utc_variation': 'utc',
+    'arrival_utc_variation': 'utc',
+    'record_serial_number': 'serial',
+    }
+# Record 4 fields a DEI row takes from its leg instead of storing.
+LEG_KEY_FIELDS = ('carrier_code', 'flight', 'ivi', 'leg_sequence')
+
+
+def time_minutes(raw):
+    """Minutes after midnight of an 'HHMM' time, None if it is not one."""
+    if raw.isdigit() and len(raw) == 4 and raw[2:] < '60':
+        return int(raw[:2]) * 60 + int(raw[2:])
+
+
+def _format_time(minutes):
+    return '{:02d}{:02d}'.format(*divmod(minutes, 60))
+
+
+def utc_minutes(raw):
+    """Signed minutes of a '+HHMM' UTC variation, None if it is not one."""
+    if raw[:1] in '+-' and len(raw) == 5:
+        minutes = time_minutes(raw[1:])
+        if minutes is not None:
+            return -minutes if raw[0] == '-' else minutes
+
+
+def _format_utc(minutes):
+    return ('-' if minutes < 0 else '+') + _format_time(abs(minutes))
+
+
+def date_ordinal(raw):
+    """Proleptic Gregorian ordinal of a 'DDMONYY' date, None if invalid."""
+    month = MONTH_NUMBERS.get(raw[2:5])
+    if month and raw[:2].isdigit() and raw[5:].isdigit():
+        try:
+            return datetime.date(2000 + int(raw[5:]), month,
+                                 int(raw[:2])).toordinal()
+        except ValueError:
+            return None
+
+
+def _format_date(ordinal):
+    date = datetime.date.fromordinal(ordinal)
+    return '{:02d}{}{:02d}'.format(date.day, MONTHS[date.month - 1],
+                                   date.year % 100)
+
+
+def days_mask(raw):
+    """Bitmask of a days of operation field, bit 0 for Monday."""
+    mask = 0
+    for day, value in enumerate(raw):
+        if value == str(day + 1):
+            mask |= 1 << day
+        elif value != ' ':
+            return None
+    return mask
+
+
+def _format_days(mask):
+    return ''.join(str(day + 1) if mask & 1 << day else ' '
+                   for day in range(7))
+
+
+def _sequence(raw):
+    if raw.isdigit():
+        return int(raw)
+
+
+def _format_sequence(number):
+    return '{:02d}'.format(number)
+
+
+def _serial(raw):
+    if raw.isdigit():
+        return int(raw)
+
+
+def _format_serial(number):
+    return '{:06d}'.format(number)
+
+
+# kind -> (array typecode, sentinel for a blank field, sentinel for a
+#          value kept on the side, encoder from the raw slice, formatter
+#          back to the raw slice).
+KINDS = {
+    'time': ('h', -1, -2, time_minutes, _format_time),
+    'utc': ('h', -32768, -32767, utc_minutes, _format_utc),
+    'date': ('i', -1, -2, date_ordinal, _format_date),
+    'days': ('B', 0, 255, days_mask, _format_days),
+    'sequence': ('h', -1, -2, _sequence, _format_sequence),
+    'serial': ('i', -1, -2, _serial, _format_serial),
+    }
+
+
+class CodeTable(object):
+    """Number distinct strings; 0 is always the empty string."""
+
+    def __init__(self):
+        self.values = ['']
+        self.ids = {'': 0}
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, value):
+        code = self.ids.get(value)
+        if code is None:
+            code = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class ColumnTable(object):
+    """Rows of fixed-width fields stored column by column.
+
+    Args:
+      layout: tuple.  (name, start, end) entries, as RecordThree.LAYOUT.
+      codes: CodeTable.  Shared table for the code columns.
+    """
+
+    def __init__(self, layout, codes):
+        self.layout = layout
+        self.codes = codes
+        self.kinds = dict((name, FIELD_KINDS.get(name, 'code'))
+                          for name, start, end in layout)
+        self.columns = dict(
+            (name, array.array(KINDS[kind][0] if kind in KINDS else 'i'))
+            for name, kind in self.kinds.items())
+        # (name, row) -> stripped value, for values a column cannot hold.
+        self.other = {}
+        # Encoded numbers by raw value for the numeric fields; serial
+        # numbers are unique so are not worth remembering.
+        self._fields = [(name, start, end, self.columns[name],
+                         KINDS.get(self.kinds[name]),
+                         {} if self.kinds[name] in KINDS and
+                         self.kinds[name] != 'serial' else None)
+                        for name, start, end in layout]
+
+    def __len__(self):
+        return len(self.columns[self.layout[0][0]]) if self.layout else 0
+
+    def append(self, line):
+        """Encode the layout fields of one record as a new row."""
+        row = len(self)
+        ids = self.codes.ids
+        encode_code = self.codes.encode
+        for name, start, end, column, kind, known in self._fields:
+            raw = line[start:end]
+            if known is not None:
+                number = known.get(raw)
+                if number is not None:
+                    column.append(number)
+                    continue
+            value = raw.strip()
+            if kind is None:
+                code = ids.get(value)
+                column.append(encode_code(value) if code is None else code)
+                continue
+            typecode, blank, other, encode, format_raw = kind
+            if not value:
+                number = blank
+            else:
+                number = encode(raw)
+                if (number is None or number in (blank, other) or
+                        format_raw(number).strip() != value):
+                    number = other
+                    self.other[(name, row)] = value
+            if known is not None and number != other:
+                known[raw] = number
+            column.append(number)
+        return row
+
+    def value(self, row, name):
+        """Decode one field, stripped like RecordField values."""
+        number = self.columns[name][row]
+        kind = self.kinds[name]
+        if kind == 'code':
+            return self.codes.values[number]
+        typecode, blank, other, encode, format_raw = KINDS[kind]
+        if number == blank:
+            return ''
+        if number == other:
+            return self.other[(name, row)]
+        return format_raw(number).strip()
+
+    def nbytes(self):
+        """Bytes held by the columns, not counting the shared codes."""
+        return (sum(column.itemsize * len(column)
+                    for column in self.columns.values()) +
+                sum(len(value) for value in self.other.values()))
+
+
+class RowView(object):
+    """Read the fields of one row of a ColumnTable as attributes."""
+
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getattr__(self, name):
+        table = object.__getattribute__(self, 'table')
+        if name not in table.kinds:
+            raise AttributeError(name)
+        return table.value(object.__getattribute__(self, 'row'), name)
+
+    def as_dict(self):
+        fields = dict((name, self.table.value(self.row, name))
+                      for name, start, end in self.table.layout)
+        fields['name'] = self.name
+        return fields
+
+
+class LegView(RowView):
+    """One leg of a CompactSchedule, read like a RecordThree."""
+
+    __slots__ = ('schedule',)
+
+    def __init__(self, schedule, row):
+        super(LegView, self).__init__(schedule.legs, row)
+        self.schedule = schedule
+
+    @property
+    def name(self):
+        return self.carrier_code + self.flight + self.ivi + "_r3"
+
+    @property
+    def carrier(self):
+        """The carrier's RecordTwo, shared by all of its legs."""
+        return self.schedule.carriers.get(self.carrier_code)
+
+    def deis(self):
+        """The leg's DEIs as DeiViews, in file order."""
+        return [DeiView(self.schedule, row)
+                for row in self.schedule.dei_rows(self.row)]
+
+    def dei(self, board_point, off_point, number):
+        """DEI data for a segment of the leg, like FlightVariation.dei."""
+        return [dei.dei_data for dei in self.deis()
+                if (dei.board_point, dei.off_point, dei.number) ==
+                (board_point, off_point, number)]
+
+
+class DeiView(RowView):
+    """One record 4 of a CompactSchedule, read like a RecordFour."""
+
+    __slots__ = ('schedule',)
+
+    def __init__(self, schedule, row):
+        super(DeiView, self).__init__(schedule.deis, row)
+        self.schedule = schedule
+
+    def __getattr__(self, name):
+        if name in LEG_KEY_FIELDS:
+            schedule = object.__getattribute__(self, 'schedule')
+            leg = schedule.dei_legs[object.__getattribute__(self, 'row')]
+            return schedule.legs.value(leg, name)
+        return RowView.__getattr__(self, name)
+
+    @property
+    def name(self):
+        return self.carrier_code + self.flight + self.ivi + "_r4"
+
+    @property
+    def segment(self):
+        return self.board_point + self.off_point
+
+    @property
+    def number(self):
+        """The DEI as an int where it is numeric, like dei_number()."""
+        return int(self.dei) if self.dei.isdigit() else self.dei
+
+    @property
+    def decoded(self):
+        """The DEI data as a typed value, like RecordFour.decoded."""
+        return dei.decode(self.number, self.dei_data)
+
+
+class CompactSchedule(object):
+    """Every leg and DEI of a schedule in dictionary-encoded columns.
+
+    Record 4s are stored against the leg read just before them, as SSIM
+    orders them; a record 4 without a preceding leg is counted in
+    orphans and dropped.
+    """
+
+    def __init__(self):
+        self.codes = CodeTable()
+        self.legs = ColumnTable(RecordThree.LAYOUT, self.codes)
+        self.deis = ColumnTable(
+            tuple(entry for entry in RecordFour.LAYOUT
+                  if entry[0] not in LEG_KEY_FIELDS + ('segment',)),
+            self.codes)
+        # Leg row of every DEI row, in ascending order.
+        self.dei_legs = array.array('i')
+        # Carrier code -> RecordTwo.
+        self.carriers = {}
+        # Flight name, e.g. 'HR330' -> leg rows in file order.
+        self.flights = {}
+        self.orphans = 0
+
+    @classmethod
+    def from_lines(cls, lines, carrier=None):
+        """Build a schedule from SSIM records, optionally for one carrier."""
+        schedule = cls()
+        if carrier is not None:
+            carrier = carrier.upper()
+        leg_key = leg_row = None
+        for line in lines:
+            record_type = line[:1]
+            if record_type not in '234' or not record_type:
+                continue
+            carrier_code = line[2:5].strip()
+            if carrier is not None and carrier_code != carrier:
+                continue
+            if record_type == '2':
+                schedule.carriers.setdefault(carrier_code, RecordTwo(line))
+            elif record_type == '3':
+                leg_row = schedule.legs.append(line)
+                leg_key = line[2:13]
+                name = carrier_code + line[5:9].strip()
+                rows = schedule.flights.get(name)
+                if rows is None:
+                    rows = schedule.flights[name] = array.array('i')
+                rows.append(leg_row)
+            elif line[2:13] == leg_key:
+                schedule.deis.append(line)
+                schedule.dei_legs.append(leg_row)
+            else:
+                schedule.orphans += 1
+        return schedule
+
+    @classmethod
+    def from_file(cls, filename, carrier=None):
+        return cls.from_lines(utils.read_lines(filename), carrier)
+
+    def __len__(self):
+        return len(self.legs)
+
+    def leg(self, row):
+        return LegView(self, row)
+
+    def flight_legs(self, name):
+        """The legs of a flight such as 'HR330', in file order."""
+        return [LegView(self, row) for row in self.flights.get(name, ())]
+
+    def dei_rows(self, leg_row):
+        """The DEI rows belonging to a leg row."""
+        start = bisect.bisect_left(self.dei_legs, leg_row)
+        stop = bisect.bisect_right(self.dei_legs, leg_row, start)
+        return range(start, stop)
+
+    def nbytes(self):
+        """Approximate bytes of column data and distinct codes."""
+        return (self.legs.nbytes() + self.deis.nbytes() +
+                self.dei_legs.itemsize * len(self.dei_legs) +
+                sum(len(value) for value in self.codes.values))
@@ -0,0 +1,353 @@
+"""Find direct, one-stop and two-stop itineraries between two stations.
+
+Leg departures on the dates of interest are turned into UTC minutes and
+sorted by (station, time).  The onward legs of an arriving leg are then a
+contiguous run of that array, found with two binary searches, so every
+search step is a handful of vectorized NumPy calls however many legs
+touch a hub.
+"""
+import collections
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import columnar
+import operating_dates
+
+
+# Minimum connecting times in minutes by the domestic ('D') or
+# international ('I') status of the arriving and departing legs.
+DEFAULT_MCT = {
+    ('D', 'D'): 45,
+    ('D', 'I'): 60,
+    ('I', 'D'): 60,
+    ('I', 'I'): 90,
+    }
+# Longest wait between two legs of an itinerary, in minutes.
+MAX_CONNECTION = 6 * 60
+MAX_STOPS = 2
+# Spacing between stations in the (station, time) sort keys; larger than
+# any departure time, in minutes, of the dates searched.
+STATION_STRIDE = 1 << 24
+# Candidate connections checked at once, bounding the memory used.
+CANDIDATE_BLOCK = 1 << 20
+
+Itinerary = collections.namedtuple(
+    'Itinerary', ['legs', 'departure_utc', 'arrival_utc'])
+
+
+class MinimumConnectTimes(object):
+    """Minimum connecting times by station and domestic/international status.
+
+    Args:
+      default: dict.  Minutes by (arriving status, departing status),
+        overriding DEFAULT_MCT.
+      stations: dict.  Station code to minutes, used for every status at
+        that station, or to a dict shaped like default.
+    """
+
+    def __init__(self, default=None, stations=None):
+        self.default = dict(DEFAULT_MCT)
+        self.default.update(default or {})
+        self.stations = stations or {}
+
+    def table(self, station_codes):
+        """Build a (stations, 2, 2) array of minutes for vectorized lookup.
+
+        Args:
+          station_codes: sequence of station codes, in station id order.
+        Returns:
+          A numpy int64 array indexed by station id, arriving status and
+          departing status, where status 1 is international.
+        """
+        statuses = ('D', 'I')
+        table = np.empty((len(station_codes), 2, 2), np.int64)
+        for arriving in range(2):
+            for departing in range(2):
+                table[:, arriving, departing] = self.default[
+                    statuses[arriving], statuses[departing]]
+        for i, station in enumerate(station_codes):
+            minutes = self.stations.get(station.strip())
+            if minutes is None:
+                continue
+            if isinstance(minutes, dict):
+                for (arriving, departing), value in minutes.items():
+                    table[i, statuses.index(arriving),
+                          statuses.index(departing)] = value
+            else:
+                table[i] = minutes
+        return table
+
+
+class RouteIndex(object):
+    """An origin/destination index over every leg of a LegTable.
+
+    Args:
+      legs: columnar.LegTable.  The schedule.
+      operating: operating_dates.OperatingIndex over the same legs, built
+        when not given.
+      mct: MinimumConnectTimes.  Defaults to DEFAULT_MCT everywhere.
+    """
+
+    def __init__(self, legs, operating=None, mct=None):
+        columnar.require_numpy()
+        self.legs = legs
+        self.operating = operating or operating_dates.OperatingIndex(legs)
+        records = legs.records
+        self.stations, station_ids = np.unique(
+            np.concatenate((records['departure_station'],
+                            records['arrival_station'])),
+            return_inverse=True)
+        self.departure_ids = station_ids[:len(legs)]
+        self.arrival_ids = station_ids[len(legs):]
+        self.mct_table = (mct or MinimumConnectTimes()).table(self.stations)
+        # MCT status of each leg at the station it leaves and the station
+        # it arrives at, 1 where international.
+        self.departure_international = (records['mct'] == 'I').astype(
+            np.int64)
+        self.arrival_international = (records['arrival_mct'] == 'I').astype(
+            np.int64)
+        # UTC minutes of departure and arrival from 00:00 UTC on the local
+        # departure date.
+        departure_days = legs.departure_variation * 1440
+        self.departure_minutes = legs.departure_utc - departure_days
+        self.arrival_minutes = legs.arrival_utc - departure_days
+
+        # Legs sorted by (origin, destination) for route lookups.
+        route_keys = self.departure_ids * len(self.stations) + self.arrival_ids
+        self.route_order = np.argsort(route_keys, kind='mergesort')
+        self.route_keys = route_keys[self.route_order]
+
+    @classmethod
+    def from_file(cls, filename, carrier=None, mct=None):
+        """Index every leg of an SSIM file, optionally for one carrier."""
+        return cls(columnar.LegTable.from_file(filename, carrier), mct=mct)
+
+    def station_id(self, station):
+        """Return the id of a station code, or None when it has no legs."""
+        code = station.upper().ljust(3)
+        position = np.searchsorted(self.stations, code)
+        if position < len(self.stations) and self.stations[position] == code:
+            return int(position)
+        return None
+
+    def route_legs(self, origin, destination):
+        """Positions in the LegTable of every leg from origin to destination."""
+        origin_id = self.station_id(origin)
+        destination_id = self.station_id(destination)
+        if origin_id is None or destination_id is None:
+            return np.zeros(0, np.int64)
+        key = origin_id * len(self.stations) + destination_id
+        start, end = np.searchsorted(self.route_keys, [key, key + 1])
+        return np.sort(self.route_order[start:end])
+
+    def destinations(self, origin):
+        """Station codes served without a stop from origin."""
+        origin_id = self.station_id(origin)
+        if origin_id is None:
+            return []
+        ids = np.unique(self.arrival_ids[self.departure_ids == origin_id])
+        return [station.strip() for station in self.stations[ids]]
+
+    def instances(self, first, last):
+        """Expand the legs departing between two dates into timed instances.
+
+        Legs without valid times are left out.
+
+        Returns:
+          A tuple of numpy arrays (leg positions, local departure dates,
+          departure and arrival times in UTC minutes since 1970-01-01).
+        """
+        positions = []
+        days = []
+        day = columnar.to_datetime64(first)
+        last = columnar.to_datetime64(last)
+        while day <= last:
+            on_day = self.operating.legs_on(day)
+            positions.append(on_day)
+            days.append(np.full(len(on_day), day, 'datetime64[D]'))
+            day += 1
+        positions = np.concatenate(positions)
+        days = np.concatenate(days)
+        timed = self.legs.times_valid[positions]
+        positions = positions[timed]
+        days = days[timed]
+        day_minutes = operating_dates.day_numbers(days) * 1440
+        departures = day_minutes + self.departure_minutes[positions]
+        arrivals = day_minutes + self.arrival_minutes[positions]
+        return positions, days, departures, arrivals
+
+    def connections(self, origin, destination, date, max_stops=MAX_STOPS,
+                    max_connection=MAX_CONNECTION, limit=None):
+        """Find itineraries from origin to destination departing on date.
+
+        Each connection must leave at least the minimum connecting time
+        for the station and the legs' domestic/international status after
+        the previous leg arrives, and at most max_connection minutes.  A
+        flight continuing with its next leg needs no connecting time.  No
+        itinerary visits a station twice.
+
+        Args:
+          origin: str.  Departure station code.
+          destination: str.  Arrival station code.
+          date: date.  Local departure date at origin.
+          max_stops: int.  0 for direct legs only, up to 2.
+          max_connection: int.  Longest connection in minutes.
+          limit: int.  Only return this many itineraries.
+        Returns:
+          A list of Itinerary tuples ordered by arrival time, then fewest
+          legs, then latest departure.  Each has a tuple of (leg position,
+          local departure date) for its legs.
+        """
+        origin_id = self.station_id(origin)
+        destination_id = self.station_id(destination)
+        if origin_id is None or destination_id is None:
+            return []
+        day = columnar.to_datetime64(date)
+        # Later legs may leave a day before (flying west) or up to two
+        # days after the first one.
+        positions, days, departures, arrivals = self.instances(day - 1,
+                                                               day + 2)
+        if not len(positions):
+            return []
+        stations_from = self.departure_ids[positions]
+        stations_to = self.arrival_ids[positions]
+        flights = self.operating.flight_ids[positions]
+        base = departures.min()
+        n_stations = len(self.stations)
+
+        # Departure instances sorted by (station, UTC departure time), and
+        # by (station, next station, UTC departure time) for final legs.
+        station_keys = stations_from * STATION_STRIDE + departures - base
+        by_station = np.argsort(station_keys, kind='mergesort')
+        station_keys = station_keys[by_station]
+        route_keys = ((stations_from * n_stations + stations_to) *
+                      STATION_STRIDE + departures - base)
+        by_route = np.argsort(route_keys, kind='mergesort')
+        route_keys = route_keys[by_route]
+
+        def extend(paths, order, start, counts):
+            """Join each path to the candidate legs starting at start."""
+            rows = np.repeat(np.arange(len(paths)), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(
+                np.cumsum(counts) - counts, counts)
+            following = order[np.repeat(start, counts) + offsets]
+            previous = paths[rows, -1]
+            wait = departures[following] - arrivals[previous]
+            minimum = self.mct_table[
+                stations_to[previous],
+                self.arrival_international[positions[previous]],
+                self.departure_international[positions[following]]]
+            valid = ((flights[following] == flights[previous]) |
+                     (wait >= minimum))
+            for column in range(paths.shape[1]):
+                valid &= (stations_to[following] !=
+                          stations_from[paths[rows, column]])
+            rows = rows[valid]
+            following = following[valid]
+            if not len(rows):
+                return np.zeros((0, paths.shape[1] + 1), np.int64)
+            # Of the legs continuing a path to the same station on the same
+            # flight with the same arrival status keep the first to arrive;
+            # any connection a later one makes is open to it too.  Legs of
+            # different flights or statuses are all kept, as the connecting
+            # time they need at the next station differs, except at the
+            # destination where nothing connects onward.
+            next_station = rows * n_stations + stations_to[following]
+            continues = stations_to[following] != destination_id
+            next_flight = np.where(continues, flights[following], -1)
+            status = np.where(continues, self.arrival_international[
+                positions[following]], 0)
+            best = np.lexsort((arrivals[following], status, next_flight,
+                               next_station))
+            groups = np.column_stack((next_station[best], next_flight[best],
+                                      status[best]))
+            best = best[np.r_[True, (groups[1:] != groups[:-1]).any(axis=1)]]
+            return np.column_stack((paths[rows[best]], following[best]))
+
+        def onward(paths, final):
+            """Extend each path, an array of instance columns, by one leg.
+
+            Final legs are only looked for among departures to the
+            destination.
+            """
+            previous = paths[:, -1]
+            if final:
+                prefix = stations_to[previous] * n_stations + destination_id
+                sorted_keys, order = route_keys, by_route
+            else:
+                prefix = stations_to[previous]
+                sorted_keys, order = station_keys, by_station
+            ready = prefix * STATION_STRIDE + arrivals[previous] - base
+            start = np.searchsorted(sorted_keys, ready)
+            counts = np.searchsorted(sorted_keys, ready + max_connection,
+                                     'right') - start
+            # Expand a bounded number of candidate pairs at a time.
+            totals = np.cumsum(counts)
+            extended = [np.zeros((0, paths.shape[1] + 1), np.int64)]
+            low = 0
+            while low < len(paths):
+                high = max(int(np.searchsorted(
+                    totals, totals[low] - counts[low] + CANDIDATE_BLOCK,
+                    'right')), low + 1)
+                extended.append(extend(paths[low:high], order,
+                                       start[low:high], counts[low:high]))
+                low = high
+            return np.concatenate(extended)
+
+        # Stations that can reach the destination in at most n more legs.
+        reaches = [np.zeros(n_stations, bool)]
+        reaches[0][destination_id] = True
+        for stops in range(max_stops):
+            feeds = np.zeros(n_stations, bool)
+            feeds[self.departure_ids[reaches[-1][self.arrival_ids]]] = True
+            reaches.append(reaches[-1] | feeds)
+
+        paths = np.flatnonzero((stations_from == origin_id) &
+                               (days == day))[:, None]
+        found = []
+        for stops in range(max_stops + 1):
+            arrived = stations_to[paths[:, -1]] == destination_id
+            found.append(paths[arrived])
+            legs_left = max_stops - stops
+            if not legs_left:
+                break
+            paths = paths[~arrived &
+                          reaches[legs_left][stations_to[paths[:, -1]]]]
+            if not len(paths):
+                break
+            paths = onward(paths, final=legs_left == 1)
+
+        # Order everything found before turning only the itineraries that
+        # are wanted into Python objects.
+        groups = np.concatenate([np.full(len(legs), stops, np.int64)
+                                 for stops, legs in enumerate(found)])
+        rows = np.concatenate([np.arange(len(legs)) for legs in found])
+        first_legs = np.concatenate([legs[:, 0] for legs in found])
+        last_legs = np.concatenate([legs[:, -1] for legs in found])
+        ranking = np.lexsort((-departures[first_legs], groups,
+                              arrivals[last_legs]))
+        itineraries = []
+        for i in ranking[:limit]:
+            path = found[groups[i]][rows[i]]
+            itineraries.append(Itinerary(
+                tuple((int(positions[leg]), days[leg].astype(object))
+                      for leg in path),
+                int(departures[path[0]]), int(arrivals[path[-1]])))
+        return itineraries
+
+    def describe(self, itinerary):
+        """Format an itinerary as 'HR 330 DUS 0835 LUX 0920 | ...'."""
+        records = self.legs.records
+        legs = []
+        for position, day in itinerary.legs:
+            legs.append('{}{} {} {} {} {} {}'.format(
+                records['carrier_code'][position].strip(),
+                records['flight'][position].strip(), day,
+                records['departure_station'][position],
+                records['passenger_std'][position],
+                records['arrival_station'][position],
+                records['passenger_sta'][position]))
+        return ' | '.join(legs)
@@ -0,0 +1,188 @@
+"""Decode the data of record 4 Data Element Identifiers into typed values.
+
+RecordFour keeps dei_data as the raw text of columns 40-194.  decode()
+turns it into a value by the decoder registered for the DEI number:
+
+  10   marketing flights of a codeshare, a tuple of FlightDesignator
+  50   flights a duplicate leg is operated as, a tuple of FlightDesignator
+  127  operating airline disclosure text
+  505  electronic ticketing, True for 'ET' and False for 'EN'
+
+DEIs without a decoder, and data a decoder cannot read, decode to the
+raw string.  Decoded values are immutable and memoized by (DEI number,
+data), so the same codeshare text on a thousand legs is parsed once and
+shared.
+
+MarketingIndex answers bulk questions such as "every flight marketed by
+LG" from the DEI 10 data of a set of Flight objects.
+"""
+import collections
+import logging
+import re
+
+
+# Decoded values kept before the memo is emptied and refilled.
+MAX_CACHED = 100000
+
+# DEI number -> function of the data string.
+DECODERS = {}
+
+_cache = {}
+_cache_counts = collections.Counter()
+
+DESIGNATOR_RE = re.compile(r'^([A-Z0-9]{2}[A-Z]?) *(\d{1,4})([A-Z]?)$')
+
+
+class FlightDesignator(collections.namedtuple('FlightDesignator',
+                                              'carrier number suffix')):
+    """An airline designator, flight number and operational suffix."""
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        """The flight key, e.g. 'LG1330'."""
+        return '{}{}{}'.format(self.carrier, self.number, self.suffix)
+
+
+# One leg marketed under another carrier's flight number through DEI 10.
+MarketedLeg = collections.namedtuple(
+    'MarketedLeg', 'marketing flight ivi board_point off_point')
+
+
+def register(number):
+    """Decorator registering a decoder for a DEI number.
+
+    A decoder takes the stripped data string and returns an immutable
+    value, raising ValueError for data it cannot read.
+    """
+    def wrap(function):
+        DECODERS[number] = function
+        clear_cache()
+        return function
+    return wrap
+
+
+def decode(number, data):
+    """Return the typed value of one DEI.
+
+    Args:
+      number: int.  DEI number, as flight_classes.dei_number returns it.
+      data: str.  DEI data; surrounding blanks are ignored.
+    Returns:
+      The decoded value, or the stripped data when no decoder is
+      registered for number or the decoder could not read it.
+    """
+    key = (number, data)
+    try:
+        value = _cache[key]
+    except KeyError:
+        pass
+    else:
+        _cache_counts['hits'] += 1
+        return value
+    _cache_counts['misses'] += 1
+    text = data.strip()
+    value = text
+    decoder = DECODERS.get(number)
+    if decoder is not None:
+        try:
+            value = decoder(text)
+        except ValueError as e:
+            logging.debug('Could not decode DEI {} data {!r}: {}'.format(
+                    number, text, e))
+    if len(_cache) >= MAX_CACHED:
+        _cache.clear()
+    _cache[key] = value
+    return value
+
+
+def clear_cache():
+    _cache.clear()
+    _cache_counts.clear()
+
+
+def cache_info():
+    """Return (hits, misses, values cached) of the decode memo."""
+    return (_cache_counts['hits'], _cache_counts['misses'], len(_cache))
+
+
+@register(10)
+@register(50)
+def flight_designators(text):
+    """Parse '/' separated flights such as 'LG 1330/LX 4711A'."""
+    designators = []
+    for entry in text.split('/'):
+        entry = entry.strip()
+        if not entry:
+            continue
+        match = DESIGNATOR_RE.match(entry)
+        if match is None:
+            raise ValueError('not a flight designator: {!r}'.format(entry))
+        carrier, number, suffix = match.groups()
+        designators.append(FlightDesignator(carrier, int(number), suffix))
+    return tuple(designators)
+
+
+@register(127)
+def disclosure(text):
+    """Operating airline disclosure, with runs of blanks collapsed."""
+    return ' '.join(text.split())
+
+
+@register(505)
+def electronic_ticketing(text):
+    if text == 'ET':
+        return True
+    if text == 'EN':
+        return False
+    raise ValueError('expected ET or EN')
+
+
+class MarketingIndex(object):
+    """The legs each carrier markets under its own flight numbers.
+
+    Built from the DEI 10 data of every segment of every flight variation.
+    """
+
+    def __init__(self):
+        # marketing carrier -> list of MarketedLeg
+        self.carriers = collections.defaultdict(list)
+
+    @classmethod
+    def from_flights(cls, flights):
+        """Index a dict mapping flight names to Flight objects."""
+        index = cls()
+        for name in sorted(flights):
+            index.add_flight(flights[name])
+        return index
+
+    def add_flight(self, flight):
+        for ivi in sorted(flight.ivi):
+            variation = flight.ivi[ivi]
+            for key in sorted(variation.deis):
+                board_point, off_point, number = key
+                if number != 10:
+                    continue
+                for data in variation.deis[key]:
+                    value = decode(10, data)
+                    if not isinstance(value, tuple):
+                        continue
+                    for designator in value:
+                        self.carriers[designator.carrier].append(MarketedLeg(
+                                designator, flight.name, ivi, board_point,
+                                off_point))
+
+    def __len__(self):
+        return sum(len(legs) for legs in self.carriers.values())
+
+    def marketing_carriers(self):
+        return sorted(self.carriers)
+
+    def marketed_by(self, carrier):
+        """Every leg marketed by carrier, as MarketedLeg tuples."""
+        return list(self.carriers.get(carrier.upper(), ()))
+
+    def flights_marketed_by(self, carrier):
+        """Sorted names of the operating flights carrier markets."""
+        return sorted(set(leg.flight for leg in self.marketed_by(carrier)))
@@ -1,19 +1,107 @@
 import os
 import re
 
-class RecordTwo(object):
-    """Parse an SSIM record two entry. """
+import dei
+
+
+# Fields holding codes that repeat across many records.
+CODE_FIELDS = frozenset([
+    'time_mode', 'carrier_code', 'flight', 'ivi', 'leg_sequence',
+    'service_type', 'frequency_rate', 'departure_station',
+    'departure_utc_variation', 'passenger_departure_terminal',
+    'arrival_station', 'arrival_utc_variation', 'passenger_arrival_terminal',
+    'aircraft_type', 'mct', 'arrival_mct', 'secure_flight', 'aircraft_owner',
+    'disclosure', 'date_variation', 'dei', 'board_point', 'off_point',
+    ])
+
+
+class RecordField(object):
+    """A fixed-width SSIM field, decoded from the raw record on first access.
+
+    Decoded values are cached on the record, so each field is sliced and
+    stripped at most once however often it is read.  Values of the short
+    code fields in CODE_FIELDS are interned, so every record holding 'FRA'
+    shares one string.
+    """
+
+    __slots__ = ('name', 'start', 'end', 'interned')
+
+    def __init__(self, name, start, end):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.interned = name in CODE_FIELDS
+
+    def __get__(self, record, owner):
+        if record is None:
+            return self
+        fields = record._fields
+        if fields is None:
+            fields = record._fields = {}
+        elif self.name in fields:
+            return fields[self.name]
+        value = record.original_record[self.start:self.end].strip()
+        if self.interned:
+            value = intern(value)
+        fields[self.name] = value
+        return value
+
+
+def record_layout(cls):
+    """Class decorator adding a RecordField for each entry in cls.LAYOUT."""
+    for name, start, end in cls.LAYOUT:
+        setattr(cls, name, RecordField(name, start, end))
+    return cls
+
+
+class Record(object):
+    """Base class for SSIM records wrapping the raw 200 byte line.
+
+    Subclasses declare their fields in LAYOUT as (name, start, end) slice
+    offsets; nothing is decoded until a field is read.
+    """
+
+    __slots__ = ('original_record', '_fields')
+    LAYOUT = ()
 
     def __init__(self, line):
         self.original_record = line
-        self.time_mode = line[1].strip()
-        self.carrier_code = line[2:5].strip()
-        self.validity_period = line[14:28].strip()
-        self.creation_date = line[28:35].strip()
-        self.sell_date = line[64:71].strip()
-        self.secure_flight = line[168].strip()
-        self.eticket = line[188:190].strip()
-        self.name = self.carrier_code + "_r2"
+        self._fields = None
+
+    def as_dict(self):
+        """Decode every field, returning a mapping of field name to value."""
+        fields = dict((name, getattr(self, name))
+                      for name, start, end in self.LAYOUT)
+        fields['name'] = self.name
+        return fields
+
+
+@record_layout
+class RecordTwo(Record):
+    """Parse an SSIM record two entry. """
+
+    __slots__ = ()
+    LAYOUT = (
+        ('time_mode', 1, 2),
+        ('carrier_code', 2, 5),
+        ('validity_period', 14, 28),
+        ('creation_date', 28, 35),
+        ('sell_date', 64, 71),
+        ('secure_flight', 168, 169),
+        ('eticket', 188, 190),
+        )
+
+    @property
+    def name(self):
+        return self.carrier_code + "_r2"
+
+    @property
+    def valid_start(self):
+        return self.validity_period[:7]
+
+    @property
+    def valid_end(self):
+        return self.validity_period[7:]
 
     def prettyprint(self):
         """ Convert variables and pretty print the data from this record """
@@ -36,50 +124,56 @@ class RecordTwo(object):
         print "End of " + self.name
 
 
-class RecordThree(object):
+@record_layout
+class RecordThree(Record):
     """ Parse an SSIM record three entry """
 
-    def __init__(self, line):
-        self.original_record = line
-        self.carrier_code = line[2:5].strip()
-        self.flight = line[5:9].strip()
-        self.ivi = line[9:11].strip() # Itinerary Variation Identifier
-        self.leg_sequence = line[11:13].strip()
-        self.service_type = line[13].strip()
-        self.period_of_operation_start = line[14:21].strip()
-        self.period_of_operation_end = line[21:28].strip()
-        self.days_of_operation = line[28:35].strip()
-        self.frequency_rate = line[35].strip()
-        self.departure_station = line[36:39].strip()
-        self.passenger_std = line[39:43].strip()
-        self.aircraft_std = line[43:47].strip()
-        self.departure_utc_variation = line[47:52].strip()
-        self.passenger_departure_terminal = line[52:54].strip()
-        self.arrival_station = line[54:57].strip()
-        self.aircraft_sta = line[57:61].strip()
-        self.passenger_sta = line[61:65].strip()
-        self.arrival_utc_variation = line[65:70].strip()
-        self.passenger_arrival_terminal = line[70:72].strip()
-        self.aircraft_type = line[72:75].strip()
-        self.prdb = line[75:95].strip() # Booking Designator
-        self.prbm = line[95:100].strip() # Booking Modifier
-        self.meal_service = line[100:110].strip()
-        self.joint_airline_designator = line[110:119].strip()
-        self.mct = line[119:120].strip()
-        self.secure_flight = line[121].strip() # Secure Flight Indicator
-        self.ivi_overflow = line[127].strip() # Itinerary Variation Overflow
-        self.aircraft_owner = line[128:131].strip()
-        self.cockpit_crew = line[131:134].strip()
-        self.cabin_crew = line[134:137].strip()
-        self.onward_airline = line[137:139].strip()
-        self.onward_flight = line[140:143].strip()
-        self.disclosure = line[148].strip() # DEI 2
-        self.traffic_restriction = line[149:160].strip()
-        self.traffic_restriction_overflow = line[160]
-        self.aircraft_configuration = line[172:192].strip()
-        self.date_variation = line[192:194].strip()
-        self.record_serial_number = line[194:200].strip()
-        self.name = self.carrier_code + self.flight + self.ivi + "_r3"
+    __slots__ = ()
+    LAYOUT = (
+        ('carrier_code', 2, 5),
+        ('flight', 5, 9),
+        ('ivi', 9, 11), # Itinerary Variation Identifier
+        ('leg_sequence', 11, 13),
+        ('service_type', 13, 14),
+        ('period_of_operation_start', 14, 21),
+        ('period_of_operation_end', 21, 28),
+        ('days_of_operation', 28, 35),
+        ('frequency_rate', 35, 36),
+        ('departure_station', 36, 39),
+        ('passenger_std', 39, 43),
+        ('aircraft_std', 43, 47),
+        ('departure_utc_variation', 47, 52),
+        ('passenger_departure_terminal', 52, 54),
+        ('arrival_station', 54, 57),
+        ('aircraft_sta', 57, 61),
+        ('passenger_sta', 61, 65),
+        ('arrival_utc_variation', 65, 70),
+        ('passenger_arrival_terminal', 70, 72),
+        ('aircraft_type', 72, 75),
+        ('prdb', 75, 95), # Booking Designator
+        ('prbm', 95, 100), # Booking Modifier
+        ('meal_service', 100, 110),
+        ('joint_airline_designator', 110, 119),
+        ('mct', 119, 120), # Departure station MCT status
+        ('arrival_mct', 120, 121), # Arrival station MCT status
+        ('secure_flight', 121, 122), # Secure Flight Indicator
+        ('ivi_overflow', 127, 128), # Itinerary Variation Overflow
+        ('aircraft_owner', 128, 131),
+        ('cockpit_crew', 131, 134),
+        ('cabin_crew', 134, 137),
+        ('onward_airline', 137, 139),
+        ('onward_flight', 140, 143),
+        ('disclosure', 148, 149), # DEI 2
+        ('traffic_restriction', 149, 160),
+        ('traffic_restriction_overflow', 160, 161),
+        ('aircraft_configuration', 172, 192),
+        ('date_variation', 192, 194),
+        ('record_serial_number', 194, 200),
+        )
+
+    @property
+    def name(self):
+        return self.carrier_code + self.flight + self.ivi + "_r3"
 
     def prettyprint(self):
         print "Printing out data for " + self.name
@@ -91,25 +185,35 @@ class RecordThree(object):
         print "Arrive: " + self.arrival_station + " At: " + self.passenger_sta
         print "End of " + self.name
 
-class RecordFour(object):
+@record_layout
+class RecordFour(Record):
     """ Parse an SSIM record four entry """
 
-    def __init__(self, line):
-        self.original_record = line
-        self.carrier_code = line[2:5].strip()
-        self.flight = line[5:9].strip()
-        self.ivi = line[9:11].strip()
-        self.leg_sequence = line[11:13].strip()
-        self.service_type = line[13].strip()
-        self.board_point_indicator = line[18:29].strip()
-        self.off_point_indicator = line[29].strip()
-        self.dei = line[30:33].strip() # Data Element Identifier
-        self.segment = line[33:39].strip()
-        self.board_point = line[33:36].strip()
-        self.off_point = line[36:39].strip()
-        self.dei_data = line[39:194].strip()
-        self.record_serial_number = line[194:]
-        self.name = self.carrier_code + self.flight + self.ivi + "_r4"
+    __slots__ = ()
+    LAYOUT = (
+        ('carrier_code', 2, 5),
+        ('flight', 5, 9),
+        ('ivi', 9, 11),
+        ('leg_sequence', 11, 13),
+        ('service_type', 13, 14),
+        ('board_point_indicator', 18, 29),
+        ('off_point_indicator', 29, 30),
+        ('dei', 30, 33), # Data Element Identifier
+        ('segment', 33, 39),
+        ('board_point', 33, 36),
+        ('off_point', 36, 39),
+        ('dei_data', 39, 194),
+        ('record_serial_number', 194, 200),
+        )
+
+    @property
+    def name(self):
+        return self.carrier_code + self.flight + self.ivi + "_r4"
+
+    @property
+    def decoded(self):
+        """The DEI data as a typed value, see dei.decode."""
+        return dei.decode(dei_number(self), self.dei_data)
 
     def prettyprint(self):
         print "Printing out data for " + self.name
@@ -124,6 +228,35 @@ class RecordFour(object):
         print "Done printing data for " + self.name
 
 
+# Record types that carry an airline designator in columns 3-5.
+CARRIER_RECORD_TYPES = frozenset('2345')
+
+# Record types that are parsed into record objects.
+RECORD_CLASSES = {
+    '2': RecordTwo,
+    '3': RecordThree,
+    '4': RecordFour,
+    }
+
+
+def classify_record(line, carrier):
+    """Find the record type of an SSIM line if it belongs to carrier.
+
+    Reads the record type byte and the airline designator once, so callers
+    can dispatch on the result instead of matching regexes per record type.
+
+    Args:
+      line: str.  A single SSIM record.
+      carrier: str.  Upper case IATA carrier code to keep.
+    Returns:
+      The record type character ('2' to '5'), or None to skip the line.
+    """
+    record_type = line[:1]
+    if record_type in CARRIER_RECORD_TYPES and line[2:5].rstrip() == carrier:
+        return record_type
+    return None
+
+
 class Flight(object):
     """An object that represents all information for a single flight.
 
@@ -133,53 +266,219 @@ class Flight(object):
     with the flight in a dictionary.
     """
 
+    __slots__ = ('name', 'carrier_code', 'flight_num', 'ivi', 'carrier')
+
     def __init__(self, carrier_code, flight_num, carrier_record):
         self.name = carrier_code + flight_num
         self.carrier_code = carrier_code
         self.flight_num = flight_num
         self.ivi = {}
-        self.handle_record2(carrier_record)
+        # Parallel ingest may meet a flight before its carrier's record 2.
+        self.carrier = None
+        if carrier_record is not None:
+            self.handle_record2(carrier_record)
 
     def handle_record2(self, carrier_record):
-        """Update Flight object with carrier record information """
-        self.time_mode = carrier_record.time_mode
-        self.validity_period = carrier_record.validity_period
-        self.valid_start = carrier_record.validity_period[:7]
-        self.valid_end = carrier_record.validity_period[7:]
-        self.release_date = carrier_record.sell_date
-        self.secure_flight = carrier_record.secure_flight
+        """Update Flight object with carrier record information.
+
+        Every flight of a carrier shares the one RecordTwo; the carrier
+        fields below are read from it rather than copied.
+        """
+        self.carrier = carrier_record
+
+    def _carrier_field(name):
+        def get(self):
+            if self.carrier is None:
+                raise AttributeError(name)
+            return getattr(self.carrier, name)
+        return property(get)
+
+    time_mode = _carrier_field('time_mode')
+    validity_period = _carrier_field('validity_period')
+    valid_start = _carrier_field('valid_start')
+    valid_end = _carrier_field('valid_end')
+    release_date = _carrier_field('sell_date')
+    secure_flight = _carrier_field('secure_flight')
+    del _carrier_field
 
     def create_variation(self, ivi, record):
-        """ Create an initial flight variation."""
+        """ Create a flight variation, or add a record to an existing one."""
         if not ivi in self.ivi:
             # Send this to the FlightVariation class
             self.ivi[ivi] = FlightVariation(self.flight_num, ivi, record)
+        else:
+            self.ivi[ivi].update_variation(record)
         return self.ivi
 
+    def merge(self, other):
+        """Fold in a Flight built from records later in the same SSIM.
+
+        Used to combine flights parsed from separate chunks of a file; the
+        result matches building the flight from all records in order.
+        """
+        for ivi, variation in other.ivi.items():
+            if ivi in self.ivi:
+                self.ivi[ivi].merge(variation)
+            else:
+                self.ivi[ivi] = variation
+        return self
+
+
+def dei_number(record):
+    """Return the DEI of a record 4 as an int, e.g. 10 for '010'."""
+    if record.dei.isdigit():
+        return int(record.dei)
+    return record.dei
+
+
+class Segment(object):
+    """The DEIs recorded for one board point/off point pair of a leg."""
+
+    __slots__ = ('board_point', 'off_point', 'deis')
+
+    def __init__(self, board_point, off_point):
+        self.board_point = board_point
+        self.off_point = off_point
+        # DEI number -> list of DEI data, in file order.
+        self.deis = {}
+
+    def add(self, record):
+        """Record the DEI carried by a RecordFour."""
+        self.deis.setdefault(dei_number(record), []).append(record.dei_data)
+
+    def merge(self, other):
+        for number, values in other.deis.items():
+            self.deis.setdefault(number, []).extend(values)
+
+    def __eq__(self, other):
+        return (isinstance(other, Segment) and
+                (self.board_point, self.off_point, self.deis) ==
+                (other.board_point, other.off_point, other.deis))
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class Leg(object):
+    """One leg of a flight variation: its record 3 and segment data.
+
+    Record 3 fields are read straight from the wrapped RecordThree, so
+    leg.departure_station is record.departure_station.
+    """
+
+    __slots__ = ('leg_sequence', 'record', 'segments')
+
+    def __init__(self, leg_sequence):
+        self.leg_sequence = leg_sequence
+        # The RecordThree, None until it has been seen.
+        self.record = None
+        # (board point, off point) -> Segment
+        self.segments = {}
+
+    def __getattr__(self, name):
+        record = object.__getattribute__(self, 'record')
+        if record is None:
+            raise AttributeError(name)
+        return getattr(record, name)
+
+    def add(self, record):
+        """Add a RecordThree or RecordFour belonging to this leg."""
+        if isinstance(record, RecordThree):
+            self.record = record
+            return None
+        key = (record.board_point, record.off_point)
+        if key not in self.segments:
+            self.segments[key] = Segment(*key)
+        self.segments[key].add(record)
+        return key
+
+    def merge(self, other):
+        """Fold in a Leg built from records later in the same SSIM."""
+        if other.record is not None:
+            self.record = other.record
+        for key, segment in other.segments.items():
+            if key in self.segments:
+                self.segments[key].merge(segment)
+            else:
+                self.segments[key] = segment
+
+    def as_dict(self):
+        """Return the leg's non-empty record 3 fields and its DEIs."""
+        fields = {}
+        if self.record is not None:
+            fields = dict((k, v) for k, v in self.record.as_dict().items()
+                          if v != '')
+        for (board_point, off_point), segment in self.segments.items():
+            fields['deis ' + board_point + off_point] = segment.deis
+        return fields
+
+    def __eq__(self, other):
+        if not isinstance(other, Leg):
+            return False
+        lines = [leg.record.original_record if leg.record else None
+                 for leg in (self, other)]
+        return (self.leg_sequence == other.leg_sequence and
+                lines[0] == lines[1] and self.segments == other.segments)
+
+    def __ne__(self, other):
+        return not self == other
+
 
 class FlightVariation(object):
     """An object that represents all information for a single flight variation.
 
     Each flight variation can have one or more legs, and multiple DEIs
-    associated with it.
+    associated with it.  The DEIs of every leg are also indexed by
+    (board point, off point, DEI number) in self.deis.
     """
 
+    __slots__ = ('name', 'legs', 'deis')
+
     def __init__(self, flight_num, ivi, record):
         self.name = flight_num + ivi
         self.legs = {}
-        self.legs
+        self.deis = {}
         self.update_variation(record)
 
     def update_variation(self, record):
+        """Add a RecordThree or RecordFour to the leg it belongs to."""
         if not record.leg_sequence in self.legs:
-            self.legs[record.leg_sequence] = {}
-        leg = self.legs[record.leg_sequence]
-        for key in vars(record):
-            value = getattr(record, key)
-            if key == 'dei':
-                leg['deis'] = {}
-                leg['deis'][key] = value
-            if value != '' and key != 'original_record':
-                leg[key] = value
+            self.legs[record.leg_sequence] = Leg(record.leg_sequence)
+        key = self.legs[record.leg_sequence].add(record)
+        if key is not None:
+            self.deis.setdefault(key + (dei_number(record),), []).append(
+                record.dei_data)
         return self.legs
 
+    def dei(self, board_point, off_point, number):
+        """Return the DEI data for a segment, e.g. dei('DUS', 'LUX', 10)."""
+        return self.deis.get((board_point, off_point, number), [])
+
+    def decoded_dei(self, board_point, off_point, number):
+        """Like dei(), with each entry decoded by dei.decode."""
+        return [dei.decode(number, data)
+                for data in self.dei(board_point, off_point, number)]
+
+    def reindex(self):
+        """Rebuild the DEI index from the legs, in leg sequence order."""
+        self.deis = {}
+        for leg_sequence in sorted(self.legs):
+            for key, segment in self.legs[leg_sequence].segments.items():
+                for number, values in segment.deis.items():
+                    self.deis.setdefault(key + (number,), []).extend(values)
+
+    def remove_leg(self, leg_sequence):
+        """Drop a leg and its DEIs from the variation."""
+        if self.legs.pop(leg_sequence, None) is not None:
+            self.reindex()
+
+    def merge(self, other):
+        """Fold in the legs of a variation built from later records."""
+        for leg_sequence, leg in other.legs.items():
+            if leg_sequence in self.legs:
+                self.legs[leg_sequence].merge(leg)
+            else:
+                self.legs[leg_sequence] = leg
+        for key, values in other.deis.items():
+            self.deis.setdefault(key, []).extend(values)
+        return self.legs
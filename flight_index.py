@@ -0,0 +1,168 @@
+import hashlib
+import logging
+import os
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import instrumentation
+import utils
+from flight_classes import RecordTwo, RecordThree, RecordFour
+
+
+# Bump this whenever the layout of the stored index changes.
+INDEX_VERSION = 2
+INDEX_SUFFIX = '.idx'
+
+
+def index_filename(filename):
+    """Return the name of the index file stored next to an SSIM file."""
+    return filename + INDEX_SUFFIX
+
+
+def file_stat(filename):
+    """Return the (size, mtime, ctime, inode) of a file.
+
+    Writing to a file or setting its times, as touch -r does, changes its
+    ctime, so any edit changes the tuple even when size and mtime are
+    put back.
+    """
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime, stat.st_ctime, stat.st_ino
+
+
+def file_digest(filename):
+    """Return the SHA-1 hex digest of the whole file."""
+    digest = hashlib.sha1()
+    utils.hash_file(filename, digest)
+    return digest.hexdigest()
+
+
+def build_index(filename):
+    """Scan an uncompressed SSIM once and record the offset of every record.
+
+    Args:
+      filename: str.  The SSIM file to index.
+    Returns:
+      A dictionary with the file's stat tuple and digest, the offset of
+      each carrier's
+      record 2 and, per (carrier, flight), a mapping of IVI to the offsets
+      of its record 3 and record 4 lines in file order.
+    """
+    logging.debug('Building flight index for {!r}'.format(filename))
+    carriers = {}
+    flights = {}
+    offset = 0
+    with open(filename, 'rb') as f:
+        for line in f:
+            record_type = line[:1]
+            if record_type == '2':
+                carriers.setdefault(line[2:5].strip(), offset)
+            elif record_type == '3' or record_type == '4':
+                flight_key = (line[2:5].strip(), line[5:9].strip())
+                variations = flights.setdefault(flight_key, {})
+                variations.setdefault(line[9:11].strip(), []).append(offset)
+            offset += len(line)
+    return {
+        'version': INDEX_VERSION,
+        'stat': file_stat(filename),
+        'digest': file_digest(filename),
+        'carriers': carriers,
+        'flights': flights,
+        }
+
+
+def save_index(index, filename):
+    """Write an index next to its SSIM file.
+
+    The index is written to a temporary name and renamed into place so that
+    concurrent lookups never see a partially written file.
+    """
+    idx_name = index_filename(filename)
+    tmp_name = '{}.{}.tmp'.format(idx_name, os.getpid())
+    with open(tmp_name, 'wb') as f:
+        pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_name, idx_name)
+
+
+def load_index(filename, rebuild=False):
+    """Return a valid index for filename, rebuilding it if it is stale.
+
+    The file is only hashed when its stat tuple differs from the stored
+    one; if the content turns out unchanged the index is kept and saved
+    with the new stat tuple.
+
+    Args:
+      filename: str.  The uncompressed SSIM file the index describes.
+      rebuild: bool.  Ignore any stored index and build a new one.
+    Returns:
+      The index dictionary, as created by build_index.
+    """
+    idx_name = index_filename(filename)
+    if not rebuild and os.path.exists(idx_name):
+        try:
+            with open(idx_name, 'rb') as f:
+                index = pickle.load(f)
+        except Exception:
+            logging.debug('Index {!r} unreadable, rebuilding'.format(idx_name))
+        else:
+            if index.get('version') == INDEX_VERSION:
+                stat = file_stat(filename)
+                if index['stat'] == stat:
+                    return index
+                if index['digest'] == file_digest(filename):
+                    index['stat'] = stat
+                    try:
+                        save_index(index, filename)
+                    except (IOError, OSError) as e:
+                        logging.debug('Could not save index {!r}: {}'
+                                      .format(idx_name, e))
+                    return index
+            logging.debug('Index {!r} is stale, rebuilding'.format(idx_name))
+    index = build_index(filename)
+    try:
+        save_index(index, filename)
+    except (IOError, OSError) as e:
+        logging.debug('Could not save index {!r}: {}'.format(idx_name, e))
+    return index
+
+
+def read_flight_records(carrier, flight_num, filename, index=None):
+    """Read the records for a single flight by seeking to indexed offsets.
+
+    Args:
+      carrier: str.  Two character IATA carrier code.
+      flight_num: str.  The number for the flight we care about.
+      filename: str.  The uncompressed SSIM file to read from.
+      index: dict.  A preloaded index, loaded from disk when not given.
+    Returns:
+      A tuple of lists of RecordTwo, RecordThree and RecordFour objects,
+      matching the return value of ssim_pprint.parse_records.
+    """
+    if index is None:
+        index = load_index(filename)
+    carrier = carrier.upper()
+    carrier_record = []
+    leg_records = []
+    seg_records = []
+    variations = index['flights'].get((carrier, flight_num.strip()), {})
+    offsets = sorted(off for ivi in variations.values() for off in ivi)
+    with open(filename, 'rb') as f:
+        if carrier in index['carriers']:
+            f.seek(index['carriers'][carrier])
+            carrier_record.append(RecordTwo(f.readline()))
+        for offset in offsets:
+            f.seek(offset)
+            line = f.readline()
+            if line[:1] == '3':
+                leg_records.append(RecordThree(line))
+            else:
+                seg_records.append(RecordFour(line))
+    instrumentation.count('lines read', len(carrier_record) + len(offsets))
+    for record_type, records in (('2', carrier_record), ('3', leg_records),
+                                 ('4', seg_records)):
+        instrumentation.count('type {} records'.format(record_type),
+                              len(records))
+    return carrier_record, leg_records, seg_records
@@ -0,0 +1,200 @@
+"""Load many SSIM files at once into a single schedule.
+
+Files are decompressed and split into batches of lines by a bounded pool
+of threads; zlib, bz2 and lzma release the GIL while they work, so
+several files decompress in parallel.  The batches are parsed into
+Flight objects by a pool of processes, as parallel.parse_flights does
+for a single file.
+
+Each file's flights are merged in file order.  Files are then combined
+in the order given; a flight found in more than one file is taken from
+the last one, so a newer feed replaces an older one.  Once combined, the
+DEI 10 codeshares of the schedule are indexed in Ingester.marketing.
+"""
+import collections
+import glob
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import dei
+import parallel
+
+
+DEFAULT_THREADS = 4
+# Batches a reader thread may have waiting for a parser at once.
+MAX_PENDING_BATCHES = 4
+
+
+FileReport = collections.namedtuple(
+    'FileReport', 'filename size bytes lines flights seconds error')
+
+
+def expand_paths(patterns):
+    """Turn files, directories and glob patterns into a list of files.
+
+    Directories contribute the regular files directly inside them, skipping
+    hidden ones.  Each file appears once, in the order first found.
+
+    Args:
+      patterns: iterable of str.
+    Returns:
+      A list of file names.
+    """
+    filenames = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name)
+                       for name in sorted(os.listdir(pattern))
+                       if not name.startswith('.')]
+        elif os.path.exists(pattern):
+            matches = [pattern]
+        else:
+            matches = sorted(glob.glob(pattern))
+        for filename in matches:
+            if os.path.isfile(filename) and filename not in filenames:
+                filenames.append(filename)
+    return filenames
+
+
+def print_progress(report, done, total, out=None):
+    """Default progress callback: one line per file on stderr."""
+    out = out or sys.stderr
+    if report.error:
+        out.write('[{}/{}] {}: failed: {}\n'.format(done, total,
+                                                   report.filename,
+                                                   report.error))
+        return
+    rate = report.bytes / 1e6 / report.seconds if report.seconds else 0
+    out.write('[{}/{}] {}: {} lines, {} flights, {:.1f} MB in {:.2f}s '
+              '({:.1f} MB/s)\n'.format(done, total, report.filename,
+                                       report.lines, report.flights,
+                                       report.bytes / 1e6, report.seconds,
+                                       rate))
+
+
+class Ingester(object):
+    """Parse a set of SSIM files concurrently.
+
+    Args:
+      threads: int.  Files read and decompressed at once.
+      workers: int.  Parser processes, defaults to the CPU count.  With a
+        single worker each reader thread parses its own batches.
+      carrier: str.  Only build this carrier's flights when given.
+      progress: callable.  Called with (FileReport, files done, files in
+        total) as each file finishes, from the reader thread.
+    """
+
+    def __init__(self, threads=DEFAULT_THREADS, workers=None, carrier=None,
+                 progress=None):
+        self.threads = max(threads or DEFAULT_THREADS, 1)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+        self.carrier = carrier.upper() if carrier else None
+        self.progress = progress
+        self.lock = threading.Lock()
+        self.done = 0
+        self.total = 0
+        self.parsers = None
+        # dei.MarketingIndex of the last schedule ingested.
+        self.marketing = None
+
+    def _parse(self, batches):
+        """Parse batches of lines, yielding results in order."""
+        if self.parsers is None:
+            for batch in batches:
+                yield parallel.build_flights(*batch)
+            return
+        pending = collections.deque()
+        for batch in batches:
+            pending.append(self.parsers.apply_async(parallel._parse_lines,
+                                                    (batch,)))
+            if len(pending) >= MAX_PENDING_BATCHES:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def _read(self, filename):
+        """Reader thread entry point: load one file."""
+        start = time.time()
+        counts = collections.Counter()
+
+        def batches():
+            for lines, carrier in parallel.line_batches(filename,
+                                                        self.carrier):
+                counts['lines'] += len(lines)
+                counts['bytes'] += sum(map(len, lines))
+                yield lines, carrier
+
+        flights, error = {}, None
+        try:
+            flights = parallel.merge_results(self._parse(batches()))
+        except Exception as e:
+            # A partly uploaded file can fail anywhere from the gzip header
+            # read to the parser; report it and carry on with the others.
+            logging.warning('Could not read {!r}: {}'.format(filename, e))
+            error = str(e) or e.__class__.__name__
+        report = FileReport(filename, os.path.getsize(filename),
+                            counts['bytes'], counts['lines'], len(flights),
+                            time.time() - start, error)
+        with self.lock:
+            self.done += 1
+            if self.progress is not None:
+                self.progress(report, self.done, self.total)
+        return report, flights
+
+    def ingest(self, filenames):
+        """Load every file into one schedule.
+
+        Args:
+          filenames: list of str.  SSIM files, plain or compressed.
+        Returns:
+          A tuple of (dict mapping flight names to Flight objects, list of
+          FileReport in the order of filenames).
+        """
+        self.done = 0
+        self.total = len(filenames)
+        if self.workers > 1:
+            self.parsers = multiprocessing.Pool(self.workers)
+        readers = ThreadPool(min(self.threads, max(len(filenames), 1)))
+        try:
+            results = readers.map(self._read, filenames, chunksize=1)
+        finally:
+            readers.close()
+            readers.join()
+            if self.parsers is not None:
+                self.parsers.close()
+                self.parsers.join()
+                self.parsers = None
+        schedule = {}
+        for report, flights in results:
+            replaced = len(set(flights).intersection(schedule))
+            if replaced:
+                logging.debug('{} flights of {!r} replace earlier files'
+                              .format(replaced, report.filename))
+            schedule.update(flights)
+        self.marketing = dei.MarketingIndex.from_flights(schedule)
+        return schedule, [report for report, flights in results]
+
+
+def ingest(patterns, threads=DEFAULT_THREADS, workers=None, carrier=None,
+           progress=None):
+    """Load the SSIM files matching patterns into one schedule.
+
+    Args:
+      patterns: iterable of str.  Files, directories or glob patterns.
+      threads: int.  Files read and decompressed at once.
+      workers: int.  Parser processes, defaults to the CPU count.
+      carrier: str.  Only build this carrier's flights when given.
+      progress: callable.  See Ingester.
+    Returns:
+      A tuple of (dict mapping flight names to Flight objects, list of
+      FileReport).
+    """
+    filenames = expand_paths(patterns)
+    return Ingester(threads, workers, carrier, progress).ingest(filenames)
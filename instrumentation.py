@@ -0,0 +1,123 @@
+"""Counters and stage timers behind the --stats and --profile options.
+
+Nothing is collected until enable() is called, and the per-line and
+per-block hooks are only installed when it has been, so a normal run pays
+a flag check per file opened rather than per line.  Counters live in the
+current process; work done by parser subprocesses is not included.
+"""
+import cProfile
+import collections
+import contextlib
+import io
+import sys
+import time
+
+
+ENABLED = False
+counters = collections.Counter()
+timings = collections.OrderedDict()
+
+
+def enable():
+    """Start collecting counters and stage timings."""
+    global ENABLED
+    ENABLED = True
+
+
+def reset():
+    """Stop collecting and forget everything collected so far."""
+    global ENABLED
+    ENABLED = False
+    counters.clear()
+    timings.clear()
+
+
+def count(name, amount=1):
+    """Add amount to the named counter when collection is enabled."""
+    if ENABLED:
+        counters[name] += amount
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Time the enclosed block as a pipeline stage.
+
+    Time spent in a stage entered more than once is added up.
+    """
+    if not ENABLED:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.time() - start
+
+
+class DecompressTimer(io.RawIOBase):
+    """Raw reader that times and counts the reads of a decompressor.
+
+    Wrapped in an io.BufferedReader the decompressor is called once per
+    buffer fill, so timing it adds next to nothing to the run.
+    """
+
+    def __init__(self, f):
+        self.f = f
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        start = time.time()
+        data = self.f.read(len(b))
+        timings['decompress'] = (timings.get('decompress', 0.0) +
+                                 time.time() - start)
+        counters['bytes decompressed'] += len(data)
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.f.close()
+        super(DecompressTimer, self).close()
+
+
+def counted_lines(lines):
+    """Yield lines, counting them and the records of each type."""
+    records = collections.Counter()
+    total = 0
+    try:
+        for line in lines:
+            total += 1
+            records[line[:1]] += 1
+            yield line
+    finally:
+        counters['lines read'] += total
+        for record_type, amount in records.items():
+            counters['type {} records'.format(record_type)] += amount
+
+
+def report(out=None):
+    """Write the collected timings and counters, by default to stderr."""
+    out = out or sys.stderr
+    out.write('Stage timings:\n')
+    for name, seconds in timings.items():
+        out.write('  {:<24} {:10.3f}s\n'.format(name, seconds))
+    out.write('Counters:\n')
+    for name in sorted(counters):
+        out.write('  {:<24} {:10d}\n'.format(name, counters[name]))
+
+
+def profiled(filename, func, *args):
+    """Call func(*args) under cProfile and dump the profile to filename.
+
+    The dump can be read with the pstats module or a viewer such as
+    snakeviz.
+
+    Returns:
+      Whatever func returned.
+    """
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func, *args)
+    finally:
+        profile.dump_stats(filename)
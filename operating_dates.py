@@ -0,0 +1,188 @@
+"""Expand legs into the dates they operate and index them by date.
+
+The index holds one bitset per day with a bit for every leg of a
+LegTable, set when the leg departs that day, and a second one with a bit
+per flight.  A year of a 200,000 leg schedule takes about 10 MB, and
+answering "what departs on D" is a single row unpack.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import columnar
+
+
+# Legs expanded at a time while building; a multiple of 8 so each block
+# packs into whole bytes.
+BLOCK_SIZE = 4096
+# Days covered when every period of operation in a schedule is open ended.
+OPEN_ENDED_DAYS = 366
+# Monday 1969-12-29 is day -3 of the datetime64 epoch.
+EPOCH_WEEKDAY = 3
+
+
+def day_numbers(dates):
+    """Days since 1970-01-01 of datetime64[D] values, as int64."""
+    return dates.astype('datetime64[D]').astype(np.int64)
+
+
+def operating_matrix(legs, first, days, rows=None):
+    """Work out which legs depart on each of a run of dates.
+
+    The period and days of operation and the frequency rate of a record 3
+    apply to the flight date, so each departure date is first moved back
+    by the leg's departure date variation.  Fortnightly legs operate in
+    the week, counted from Monday, that their period starts in and every
+    second week after it.
+
+    Args:
+      legs: columnar.LegTable.
+      first: datetime64[D].  The first local departure date.
+      days: int.  The number of dates, one column each.
+      rows: slice.  Only these legs, all of them by default.
+    Returns:
+      A numpy boolean array of shape (legs, days).
+    """
+    columnar.require_numpy()
+    if rows is None:
+        rows = slice(0, len(legs))
+    departures = day_numbers(first) + np.arange(days)
+    flight_dates = (departures[None, :] -
+                    legs.departure_variation[rows][:, None])
+    start = day_numbers(legs.period_start[rows])[:, None]
+    end = day_numbers(legs.period_end[rows])[:, None]
+    valid = ~np.isnat(legs.period_start[rows])[:, None]
+    operates = valid & (flight_dates >= start) & (flight_dates <= end)
+    weekdays = (flight_dates + EPOCH_WEEKDAY) % 7
+    operates &= np.take_along_axis(legs.days_of_operation[rows], weekdays,
+                                   axis=1)
+    fortnightly = legs.fortnightly[rows]
+    if fortnightly.any():
+        monday = start - (start + EPOCH_WEEKDAY) % 7
+        even_week = (flight_dates - monday) // 7 % 2 == 0
+        operates &= ~fortnightly[:, None] | even_week
+    return operates
+
+
+class OperatingIndex(object):
+    """Answer "which legs depart on day D" for a whole schedule.
+
+    Dates are local departure dates, so a leg with a departure date
+    variation is found on the day it actually leaves.
+
+    Args:
+      legs: columnar.LegTable.  The legs to index.
+      first: date.  First departure date to index, by default the earliest
+        period of operation start.
+      last: date.  Last departure date to index, by default the latest
+        period of operation end.  Open ended periods stop here.
+    """
+
+    def __init__(self, legs, first=None, last=None):
+        columnar.require_numpy()
+        self.legs = legs
+        variations = legs.departure_variation
+        earliest = int(variations.min()) if len(legs) else 0
+        latest = int(variations.max()) if len(legs) else 0
+        if first is None:
+            starts = legs.period_start[~np.isnat(legs.period_start)]
+            if len(starts):
+                first = starts.min() + earliest
+            else:
+                first = np.datetime64('today', 'D')
+        self.first_day = columnar.to_datetime64(first)
+        if last is None:
+            ends = legs.period_end[legs.period_end <
+                                   np.datetime64('9999-12-31')]
+            if len(ends):
+                last = ends.max() + latest
+            else:
+                last = self.first_day + OPEN_ENDED_DAYS
+        self.last_day = columnar.to_datetime64(last)
+        days = max(int(day_numbers(self.last_day) -
+                       day_numbers(self.first_day)) + 1, 0)
+
+        keys = np.char.add(legs.records['carrier_code'],
+                           legs.records['flight'])
+        self.flight_names, self.flight_ids = np.unique(keys,
+                                                       return_inverse=True)
+
+        self.leg_bits = np.zeros((days, (len(legs) + 7) // 8), np.uint8)
+        flight_days = np.zeros((len(self.flight_names), days), bool)
+        for start in range(0, len(legs), BLOCK_SIZE):
+            block = slice(start, min(start + BLOCK_SIZE, len(legs)))
+            operates = operating_matrix(legs, self.first_day, days, block)
+            self.leg_bits[:, start // 8:(block.stop + 7) // 8] = np.packbits(
+                operates.T, axis=1)
+            # The legs of a flight are normally next to each other, so OR
+            # together each run of legs belonging to the same flight.
+            ids = self.flight_ids[block]
+            runs = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+            run_days = np.logical_or.reduceat(operates, runs, axis=0)
+            run_ids = ids[runs]
+            if len(np.unique(run_ids)) == len(run_ids):
+                flight_days[run_ids] |= run_days
+            else:
+                np.logical_or.at(flight_days, run_ids, run_days)
+        self.flight_bits = np.packbits(flight_days.T, axis=1)
+
+    @classmethod
+    def from_file(cls, filename, carrier=None, first=None, last=None):
+        """Index every leg of an SSIM file, optionally for one carrier."""
+        return cls(columnar.LegTable.from_file(filename, carrier), first,
+                   last)
+
+    def _rows(self, first, last):
+        """Clip an inclusive date range to a slice of bitset rows."""
+        base = day_numbers(self.first_day)
+        start = int(day_numbers(columnar.to_datetime64(first)) - base)
+        stop = int(day_numbers(columnar.to_datetime64(last)) - base) + 1
+        days = len(self.leg_bits)
+        return slice(min(max(start, 0), days), min(max(stop, 0), days))
+
+    def _members(self, bitsets, first, last, size):
+        """Positions set in any of the bitsets between first and last."""
+        rows = bitsets[self._rows(first, last)]
+        if not len(rows):
+            return np.zeros(0, np.int64)
+        if len(rows) == 1:
+            bits = rows[0]
+        else:
+            bits = np.bitwise_or.reduce(rows, axis=0)
+        return np.flatnonzero(np.unpackbits(bits)[:size].view(bool))
+
+    def legs_on(self, date):
+        """Positions in the LegTable of the legs departing on a date."""
+        return self.legs_between(date, date)
+
+    def legs_between(self, first, last):
+        """Positions of the legs departing on any date in [first, last]."""
+        return self._members(self.leg_bits, first, last, len(self.legs))
+
+    def flights_on(self, date):
+        """Flights with a leg departing on a date.
+
+        Returns:
+          A sorted numpy array of flight keys, the carrier code padded to
+          three characters followed by the four character flight number;
+          see flight_keys().
+        """
+        return self.flights_between(date, date)
+
+    def flights_between(self, first, last):
+        """Flights departing on any date in [first, last], as flights_on."""
+        return self.flight_names[self._members(
+            self.flight_bits, first, last, len(self.flight_names))]
+
+    def leg_dates(self, position):
+        """The local departure dates of the leg at a LegTable position."""
+        operates = operating_matrix(self.legs, self.first_day,
+                                    len(self.leg_bits),
+                                    slice(position, position + 1))[0]
+        return self.first_day + np.flatnonzero(operates)
+
+
+def flight_keys(names):
+    """Turn flight keys from flights_on() into (carrier, flight) tuples."""
+    return [(name[:3].strip(), name[3:].strip()) for name in names]
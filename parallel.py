@@ -0,0 +1,206 @@
+"""Parse large SSIM files across several processes.
+
+Plain files are cut into byte ranges on line boundaries and every worker
+reads its own range.  Compressed files cannot be split that way, so the
+parent decompresses them and hands batches of lines to the workers.
+Each worker builds Flight objects for its share of the records; the
+parent merges them in file order.
+"""
+import logging
+import multiprocessing
+import os
+
+import utils
+from flight_classes import RECORD_CLASSES, Flight
+
+
+# Lines handed to a worker at once when reading compressed input.
+LINES_PER_BATCH = 50000
+
+
+def chunk_ranges(filename, chunks):
+    """Split a plain SSIM file into byte ranges that start on a new line.
+
+    Args:
+      filename: str.  The uncompressed SSIM file.
+      chunks: int.  The number of ranges wanted.
+    Returns:
+      A list of (start, end) byte offsets covering the whole file.
+    """
+    size = os.path.getsize(filename)
+    boundaries = [0]
+    with open(filename, 'rb') as f:
+        for i in range(1, chunks):
+            f.seek(max(size * i // chunks - 1, boundaries[-1]))
+            f.readline()
+            position = f.tell()
+            if position >= size:
+                break
+            if position > boundaries[-1]:
+                boundaries.append(position)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def read_range(filename, start, end):
+    """Yield the lines of a plain file that start within [start, end)."""
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        position = start
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
+
+
+def build_flights(lines, carrier=None):
+    """Build Flight objects for every record 3 and 4 in lines.
+
+    Args:
+      lines: iterable of SSIM records.
+      carrier: str.  Only keep this carrier's records when given.
+    Returns:
+      A tuple of (dict mapping carrier code to its first RecordTwo,
+      dict mapping flight names to Flight objects).
+    """
+    carrier_records = {}
+    flights = {}
+    for line in lines:
+        record_type = line[:1]
+        if record_type not in RECORD_CLASSES:
+            continue
+        carrier_code = line[2:5].strip()
+        if carrier is not None and carrier_code != carrier:
+            continue
+        record = RECORD_CLASSES[record_type](line)
+        if record_type == '2':
+            carrier_records.setdefault(carrier_code, record)
+            continue
+        flightname = carrier_code + record.flight
+        if flightname not in flights:
+            flights[flightname] = Flight(carrier_code, record.flight, None)
+        flights[flightname].create_variation(record.ivi, record)
+    return carrier_records, flights
+
+
+def _parse_range(task):
+    """Worker entry point for a byte range of a plain file."""
+    filename, start, end, carrier = task
+    return build_flights(read_range(filename, start, end), carrier)
+
+
+def _parse_lines(task):
+    """Worker entry point for a batch of lines from a compressed file."""
+    lines, carrier = task
+    return build_flights(lines, carrier)
+
+
+def line_batches(filename, carrier):
+    """Group the lines of a (compressed) file into worker sized batches."""
+    return batches(utils.read_lines(filename), carrier)
+
+
+def batches(lines, carrier):
+    """Group a stream of lines into worker sized batches."""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= LINES_PER_BATCH:
+            yield batch, carrier
+            batch = []
+    if batch:
+        yield batch, carrier
+
+
+def merge_results(results):
+    """Merge per-chunk (carrier_records, flights) results in file order.
+
+    Flights, variations and legs split across chunks are combined with
+    Flight.merge, then each flight gets its carrier's record 2 data.
+
+    Returns:
+      flights: dict. Mapping of flight names to flight objects.
+    """
+    carrier_records = {}
+    flights = {}
+    for chunk_carriers, chunk_flights in results:
+        for carrier, record in chunk_carriers.items():
+            carrier_records.setdefault(carrier, record)
+        for flightname, flight in chunk_flights.items():
+            if flightname in flights:
+                flights[flightname].merge(flight)
+            else:
+                flights[flightname] = flight
+    for flight in flights.values():
+        if flight.carrier_code in carrier_records:
+            flight.handle_record2(carrier_records[flight.carrier_code])
+    return flights
+
+
+def parse_flights(filename, workers=None, carrier=None):
+    """Parse a whole SSIM into Flight objects using a pool of processes.
+
+    Args:
+      filename: str.  Plain or compressed SSIM file.
+      workers: int.  Number of processes, defaults to the CPU count.  With
+        a single worker everything runs in the current process.
+      carrier: str.  Only build this carrier's flights when given.
+    Returns:
+      flights: dict. Mapping of flight names to flight objects.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if carrier is not None:
+        carrier = carrier.upper()
+    logging.debug('Parsing {!r} with {} workers'.format(filename, workers))
+    if workers <= 1:
+        return merge_results([build_flights(utils.read_lines(filename),
+                                            carrier)])
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        if utils.is_file_compressed(filename):
+            results = pool.imap(_parse_lines,
+                                line_batches(filename, carrier))
+        else:
+            # A few chunks per worker evens out uneven carrier sections.
+            tasks = [(filename, start, end, carrier) for start, end
+                     in chunk_ranges(filename, workers * 4)]
+            results = pool.imap(_parse_range, tasks)
+        flights = merge_results(results)
+    finally:
+        pool.close()
+        pool.join()
+    return flights
+
+
+def parse_lines(lines, workers=None, carrier=None):
+    """Parse a stream of SSIM records into Flight objects.
+
+    The stream is only iterated once, in this process; with more than one
+    worker the records are parsed by a pool in batches.
+
+    Args:
+      lines: iterable of SSIM records in file order.
+      workers: int.  Number of processes, defaults to the CPU count.
+      carrier: str.  Only build this carrier's flights when given.
+    Returns:
+      flights: dict. Mapping of flight names to flight objects.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if carrier is not None:
+        carrier = carrier.upper()
+    if workers <= 1:
+        return merge_results([build_flights(lines, carrier)])
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        flights = merge_results(pool.imap(_parse_lines,
+                                          batches(lines, carrier)))
+    finally:
+        pool.close()
+        pool.join()
+    return flights
@@ -0,0 +1,392 @@
+"""Keep schedules loaded in memory and answer queries over HTTP.
+
+The server speaks plain HTTP/1.0 with JSON responses, over TCP or a Unix
+socket, and handles each client in its own thread.  Every request works
+against the Schedule objects current when it started; a reloaded file is
+built in full before it replaces the old one, so readers never see a
+half loaded schedule.
+
+Endpoints:
+  /flights/<carrier><number>    legs of a flight, e.g. /flights/HR330
+  /stations/<code>?date=D       legs departing a station (on a date)
+  /operating?date=D&until=D2    flights departing on a date or in a range
+  /connections?origin=A&destination=B&date=D[&max_stops=N]
+  /marketed/<carrier>           legs a carrier markets through DEI 10
+  /schedules                    files loaded and when
+  /stats                        request counts and latency percentiles
+
+Every query takes an optional schedule=<file name> to pick one of the
+loaded files; by default all of them are searched.
+"""
+import BaseHTTPServer
+import SocketServer
+import collections
+import json
+import logging
+import os
+import threading
+import time
+import urlparse
+
+import columnar
+import connections
+import dei
+import operating_dates
+import render
+import snapshot
+
+
+# Requests timed per endpoint for the latency percentiles.
+LATENCY_SAMPLES = 10000
+PERCENTILES = (50, 90, 99)
+DEFAULT_RELOAD_INTERVAL = 5.0
+
+
+def file_signature(filename):
+    """The (size, mtime) used to spot a file changing on disk."""
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime
+
+
+class Schedule(object):
+    """One SSIM file with the indexes the endpoints need.
+
+    Args:
+      filename: str.  Plain or compressed SSIM file.
+      carrier: str.  Only load this carrier when given.
+      workers: int.  Parser processes used to build the flights.
+    """
+
+    def __init__(self, filename, carrier=None, workers=None):
+        start = time.time()
+        self.filename = filename
+        self.name = os.path.basename(filename)
+        self.signature = file_signature(filename)
+        self.flights = snapshot.load_flights(filename, workers, carrier)
+        self.marketing = dei.MarketingIndex.from_flights(self.flights)
+        self.legs = None
+        self.operating = None
+        self.routes = None
+        if columnar.np is not None:
+            self.legs = columnar.LegTable.from_file(filename, carrier)
+            self.operating = operating_dates.OperatingIndex(self.legs)
+            self.routes = connections.RouteIndex(self.legs, self.operating)
+        self.loaded = time.time()
+        self.load_seconds = self.loaded - start
+        logging.info('Loaded {!r}: {} flights in {:.2f}s'.format(
+                filename, len(self.flights), self.load_seconds))
+
+
+class ScheduleStore(object):
+    """The loaded schedules, swapped atomically when their files change."""
+
+    def __init__(self, filenames, carrier=None, workers=None):
+        self.carrier = carrier
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.schedules = collections.OrderedDict(
+            (filename, Schedule(filename, carrier, workers))
+            for filename in filenames)
+
+    def current(self, name=None):
+        """The schedules to answer a request from.
+
+        Args:
+          name: str.  A file name or base name to pick one schedule.
+        Returns:
+          A list of Schedule objects, empty when name matches none.
+        """
+        with self.lock:
+            schedules = list(self.schedules.values())
+        if name is None:
+            return schedules
+        return [s for s in schedules if name in (s.filename, s.name)]
+
+    def refresh(self):
+        """Reload every file that changed on disk since it was loaded.
+
+        Returns:
+          The names of the files reloaded.
+        """
+        reloaded = []
+        for schedule in self.current():
+            try:
+                if file_signature(schedule.filename) == schedule.signature:
+                    continue
+                fresh = Schedule(schedule.filename, self.carrier,
+                                 self.workers)
+            except Exception:
+                # Keep serving the old copy while a file is being replaced;
+                # a half written file can fail in the decompressor or the
+                # parser as well as in the read.
+                logging.exception('Could not reload {!r}'.format(
+                        schedule.filename))
+                continue
+            with self.lock:
+                self.schedules[schedule.filename] = fresh
+            reloaded.append(schedule.filename)
+        return reloaded
+
+    def watch(self, interval=DEFAULT_RELOAD_INTERVAL):
+        """Start a daemon thread calling refresh() every interval seconds."""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh()
+                except Exception:
+                    logging.exception('Schedule reload failed')
+        thread = threading.Thread(target=run, name='schedule-reloader')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+def percentile(samples, percent):
+    """The nearest rank percentile of a sorted list of samples."""
+    if not samples:
+        return None
+    rank = max(int(round(percent / 100.0 * len(samples))) - 1, 0)
+    return samples[min(rank, len(samples) - 1)]
+
+
+class LatencyStats(object):
+    """Request counts and the latest LATENCY_SAMPLES latencies per endpoint."""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.samples = collections.defaultdict(
+            lambda: collections.deque(maxlen=samples))
+
+    def record(self, endpoint, seconds):
+        with self.lock:
+            self.counts[endpoint] += 1
+            self.samples[endpoint].append(seconds)
+
+    def summary(self):
+        """Per endpoint request count and latency percentiles in ms."""
+        with self.lock:
+            samples = dict((endpoint, sorted(values))
+                           for endpoint, values in self.samples.items())
+            counts = dict(self.counts)
+        summary = {}
+        for endpoint, values in samples.items():
+            summary[endpoint] = dict(
+                ('p{}'.format(p), percentile(values, p) * 1000)
+                for p in PERCENTILES)
+            summary[endpoint]['requests'] = counts[endpoint]
+        return summary
+
+
+class QueryError(Exception):
+    """A request that cannot be answered, with the HTTP status to send."""
+
+    def __init__(self, status, message):
+        super(QueryError, self).__init__(message)
+        self.status = status
+
+
+def require_indexes(schedule):
+    if schedule.legs is None:
+        raise QueryError(501, 'Station and date queries need NumPy')
+
+
+def query_flight(store, key, params):
+    """Legs of one flight, e.g. key 'HR330'."""
+    rows = []
+    for schedule in store.current(params.get('schedule')):
+        flight = schedule.flights.get(key.upper())
+        if flight is None:
+            continue
+        for flight, variation, leg in render.iter_legs([flight]):
+            rows.append(render.leg_dict(flight, leg))
+    if not rows:
+        raise QueryError(404, 'Flight {} not found'.format(key))
+    return {'flight': key.upper(), 'legs': rows}
+
+
+def query_station(store, station, params):
+    """Legs departing a station, on a date when one is given."""
+    rows = []
+    for schedule in store.current(params.get('schedule')):
+        require_indexes(schedule)
+        legs = schedule.legs.filter(departure_station=station.upper(),
+                                    operating_on=params.get('date'))
+        rows.extend(dict(zip(columnar.SUMMARY_COLUMNS,
+                             (value.strip() for value in row)))
+                    for row in legs.rows(columnar.SUMMARY_COLUMNS))
+    return {'station': station.upper(), 'legs': rows}
+
+
+def query_operating(store, params):
+    """Flights departing on a date or within [date, until]."""
+    if 'date' not in params:
+        raise QueryError(400, 'date is required')
+    first = params['date']
+    last = params.get('until', first)
+    flights = set()
+    for schedule in store.current(params.get('schedule')):
+        require_indexes(schedule)
+        flights.update('{}{}'.format(carrier, flight) for carrier, flight
+                       in operating_dates.flight_keys(
+                           schedule.operating.flights_between(first, last)))
+    return {'from': first, 'to': last, 'flights': sorted(flights)}
+
+
+def query_connections(store, params):
+    """Itineraries between two stations departing on a date."""
+    for name in ('origin', 'destination', 'date'):
+        if name not in params:
+            raise QueryError(400, '{} is required'.format(name))
+    max_stops = int(params.get('max_stops', connections.MAX_STOPS))
+    limit = int(params.get('limit', 20))
+    itineraries = []
+    for schedule in store.current(params.get('schedule')):
+        require_indexes(schedule)
+        for itinerary in schedule.routes.connections(
+                params['origin'], params['destination'], params['date'],
+                max_stops, limit=limit):
+            itineraries.append({
+                'legs': schedule.routes.describe(itinerary).split(' | '),
+                'departure_utc': itinerary.departure_utc,
+                'arrival_utc': itinerary.arrival_utc,
+                })
+    itineraries.sort(key=lambda i: (i['arrival_utc'], len(i['legs'])))
+    return {'itineraries': itineraries[:limit]}
+
+
+def query_marketed(store, carrier, params):
+    """Legs a carrier markets under its own flight numbers."""
+    rows = []
+    for schedule in store.current(params.get('schedule')):
+        rows.extend({
+            'marketing_flight': leg.marketing.name,
+            'flight': leg.flight,
+            'ivi': leg.ivi,
+            'board_point': leg.board_point,
+            'off_point': leg.off_point,
+            } for leg in schedule.marketing.marketed_by(carrier))
+    return {'carrier': carrier.upper(), 'legs': rows}
+
+
+def query_schedules(store, params):
+    return {'schedules': [{
+        'file': schedule.filename,
+        'flights': len(schedule.flights),
+        'loaded': schedule.loaded,
+        'load_seconds': schedule.load_seconds,
+        } for schedule in store.current()]}
+
+
+class QueryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Route GET requests to the query functions and time them.
+
+    Latency covers decoding the request and building the response body,
+    not the time the client takes to read it.
+    """
+
+    def do_GET(self):
+        start = time.time()
+        url = urlparse.urlparse(self.path)
+        params = dict((name, values[-1]) for name, values
+                      in urlparse.parse_qs(url.query).items())
+        parts = [part for part in url.path.split('/') if part]
+        endpoint = parts[0] if parts else ''
+        store = self.server.store
+        try:
+            if endpoint == 'flights' and len(parts) == 2:
+                body = query_flight(store, parts[1], params)
+            elif endpoint == 'stations' and len(parts) == 2:
+                body = query_station(store, parts[1], params)
+            elif endpoint == 'operating':
+                body = query_operating(store, params)
+            elif endpoint == 'connections':
+                body = query_connections(store, params)
+            elif endpoint == 'marketed' and len(parts) == 2:
+                body = query_marketed(store, parts[1], params)
+            elif endpoint == 'schedules':
+                body = query_schedules(store, params)
+            elif endpoint == 'stats':
+                body = {'latency_ms': self.server.latency.summary()}
+            else:
+                raise QueryError(404, 'Unknown endpoint {!r}'.format(
+                        url.path))
+            status = 200
+        except QueryError as e:
+            status, body = e.status, {'error': str(e)}
+        except ValueError as e:
+            status, body = 400, {'error': str(e)}
+        except Exception as e:
+            logging.exception('Error answering {!r}'.format(self.path))
+            status = 500
+            body = {'error': str(e) or e.__class__.__name__}
+        data = json.dumps(body, sort_keys=True)
+        self.server.latency.record(endpoint, time.time() - start)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address to resolve.
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def log_message(self, format, *args):
+        logging.debug('%s %s', self.address_string(), format % args)
+
+
+class QueryServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, store):
+        BaseHTTPServer.HTTPServer.__init__(self, address, QueryHandler)
+        self.store = store
+        self.latency = LatencyStats()
+
+
+class UnixQueryServer(SocketServer.ThreadingMixIn,
+                      SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, store):
+        SocketServer.UnixStreamServer.__init__(self, path, QueryHandler)
+        self.store = store
+        self.latency = LatencyStats()
+
+
+def serve(store, host='127.0.0.1', port=8080, unix_socket=None,
+          reload_interval=DEFAULT_RELOAD_INTERVAL):
+    """Answer queries until interrupted, reloading changed files.
+
+    Args:
+      store: ScheduleStore.  The schedules to serve.
+      host: str.  Interface to listen on.
+      port: int.  TCP port to listen on.
+      unix_socket: str.  Listen on this Unix socket instead of TCP.
+      reload_interval: float.  Seconds between checks for changed files,
+        0 to never reload.
+    """
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = UnixQueryServer(unix_socket, store)
+        print("Serving on unix socket {}".format(unix_socket))
+    else:
+        server = QueryServer((host, port), store)
+        print("Serving on http://{}:{}/".format(*server.server_address))
+    if reload_interval:
+        store.watch(reload_interval)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        print(json.dumps(server.latency.summary(), indent=2,
+                         sort_keys=True))
@@ -0,0 +1,131 @@
+"""Render flights as text, JSON Lines, CSV or an aligned table.
+
+Renderers consume an iterable of Flight objects one at a time and write
+through a single buffered writer, so a generator of flights can be
+exported without holding the whole schedule in memory.
+"""
+import csv
+import io
+import json
+import sys
+
+from flight_classes import RecordThree
+
+
+OUTPUT_FORMATS = ('text', 'jsonl', 'csv', 'table')
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Columns written per leg by the csv and table formats.
+LEG_COLUMNS = ('carrier_code', 'flight', 'ivi', 'leg_sequence',
+               'service_type', 'period_of_operation_start',
+               'period_of_operation_end', 'days_of_operation',
+               'frequency_rate', 'departure_station', 'passenger_std',
+               'departure_utc_variation', 'arrival_station', 'passenger_sta',
+               'arrival_utc_variation', 'aircraft_type', 'date_variation')
+FIELD_WIDTHS = dict((name, end - start)
+                    for name, start, end in RecordThree.LAYOUT)
+
+
+def iter_legs(flights):
+    """Yield (flight, variation, leg) for every leg, in a stable order."""
+    for flight in flights:
+        for ivi in sorted(flight.ivi):
+            variation = flight.ivi[ivi]
+            for leg_sequence in sorted(variation.legs):
+                yield flight, variation, variation.legs[leg_sequence]
+
+
+def leg_values(leg):
+    """Return the LEG_COLUMNS values of a leg, blank if it has no record 3."""
+    if leg.record is None:
+        return [''] * len(LEG_COLUMNS)
+    return [getattr(leg.record, name) for name in LEG_COLUMNS]
+
+
+def deis_text(leg):
+    """Flatten a leg's DEIs to 'DUSLUX/10=LG 1330;DUSLUX/505=ET'."""
+    entries = []
+    for (board_point, off_point), segment in sorted(leg.segments.items()):
+        for number in sorted(segment.deis):
+            for value in segment.deis[number]:
+                entries.append('{}{}/{}={}'.format(board_point, off_point,
+                                                  number, value))
+    return ';'.join(entries)
+
+
+def render_text(flights, out):
+    """The original 'field : value' listing of every leg."""
+    for flight in flights:
+        for ivi in sorted(flight.ivi):
+            variation = flight.ivi[ivi]
+            out.write("Record Variation: {}\n".format(variation.name))
+            for leg_sequence in sorted(variation.legs):
+                fields = variation.legs[leg_sequence].as_dict()
+                out.write(''.join("{} : {}\n".format(field, fields[field])
+                                  for field in fields))
+
+
+def leg_dict(flight, leg):
+    """The LEG_COLUMNS and DEIs of a leg as a JSON serialisable dict."""
+    row = dict(zip(LEG_COLUMNS, leg_values(leg)))
+    row['carrier_code'] = flight.carrier_code
+    row['flight'] = flight.flight_num
+    row['leg_sequence'] = leg.leg_sequence
+    row['deis'] = dict(
+        (board_point + off_point,
+         dict((str(number), values)
+              for number, values in segment.deis.items()))
+        for (board_point, off_point), segment in leg.segments.items())
+    return row
+
+
+def render_jsonl(flights, out):
+    """One JSON object per leg."""
+    for flight, variation, leg in iter_legs(flights):
+        out.write(json.dumps(leg_dict(flight, leg), sort_keys=True))
+        out.write('\n')
+
+
+def render_csv(flights, out):
+    """A header row, then one row per leg."""
+    writer = csv.writer(out)
+    writer.writerow(LEG_COLUMNS + ('deis',))
+    for flight, variation, leg in iter_legs(flights):
+        writer.writerow(leg_values(leg) + [deis_text(leg)])
+
+
+def render_table(flights, out):
+    """Columns aligned to the SSIM field widths, so nothing is buffered."""
+    widths = [max(len(name), FIELD_WIDTHS[name]) for name in LEG_COLUMNS]
+    template = ' '.join('{:<%d}' % width for width in widths) + ' {}\n'
+    out.write(template.format(*(LEG_COLUMNS + ('deis',))))
+    for flight, variation, leg in iter_legs(flights):
+        out.write(template.format(*(leg_values(leg) + [deis_text(leg)])))
+
+
+RENDERERS = {
+    'text': render_text,
+    'jsonl': render_jsonl,
+    'csv': render_csv,
+    'table': render_table,
+    }
+
+
+def write_flights(flights, output_format='text', out=None):
+    """Render flights through a single buffered writer.
+
+    Args:
+      flights: iterable of Flight objects, e.g. a generator.
+      output_format: str.  One of OUTPUT_FORMATS.
+      out: file name to write to, or None for standard output.
+    """
+    if out is None:
+        sys.stdout.flush()
+        writer = io.open(sys.stdout.fileno(), 'wb',
+                         buffering=WRITE_BUFFER_SIZE, closefd=False)
+    else:
+        writer = io.open(out, 'wb', buffering=WRITE_BUFFER_SIZE)
+    try:
+        RENDERERS[output_format](flights, writer)
+    finally:
+        writer.close()
@@ -0,0 +1,303 @@
+"""Compare two versions of an SSIM and apply the differences.
+
+Records are grouped into legs, a record 3 plus the record 4s that follow
+it, keyed by (carrier, flight, ivi, leg sequence).  Each leg is hashed
+without its record serial numbers, which shift whenever a line is added
+or removed earlier in the file.  A leg whose records are split over
+several groups, a repeated record 3 or record 4s separated from it, keeps
+every group: their digests are chained in file order.
+
+A snapshot saved by reload_flights keeps these digests, so the next
+day's reload reads only the new file, once, and does not need the old
+one any more.
+"""
+import hashlib
+import logging
+import os
+
+import parallel
+import utils
+from flight_classes import RECORD_CLASSES, Flight, RecordTwo
+
+
+# Columns from here on hold the record serial number.
+SERIAL_OFFSET = 194
+
+
+def record_groups(lines):
+    """Group SSIM lines into carrier records and legs.
+
+    Args:
+      lines: iterable of SSIM records in file order.
+    Yields:
+      ('2', carrier, [line]) for each record 2 and
+      ('3', (carrier, flight, ivi, leg sequence), lines) for each leg.
+    """
+    leg_key = None
+    leg_lines = []
+    for line in lines:
+        record_type = line[:1]
+        if record_type == '2':
+            yield '2', line[2:5].strip(), [line]
+        elif record_type == '3' or record_type == '4':
+            key = (line[2:5].strip(), line[5:9].strip(),
+                   line[9:11].strip(), line[11:13].strip())
+            if record_type == '3' or key != leg_key:
+                if leg_lines:
+                    yield '3', leg_key, leg_lines
+                leg_key = key
+                leg_lines = []
+            leg_lines.append(line)
+    if leg_lines:
+        yield '3', leg_key, leg_lines
+
+
+def digest(lines):
+    """Hash the content of a group of records, ignoring serial numbers."""
+    return hashlib.sha1(''.join(line[:SERIAL_OFFSET].rstrip('\r\n')
+                                for line in lines)).digest()
+
+
+def chain(previous, group_digest):
+    """Combine the digest of a leg's earlier groups with its next group."""
+    return hashlib.sha1(previous + group_digest).digest()
+
+
+class RepeatedLegError(ValueError):
+    """A leg is split over several groups in a way a diff cannot follow.
+
+    Raised when the first group of a split leg matched the old digest of
+    the whole leg, so its lines were not kept.
+    """
+
+
+def schedule_digests(filename):
+    """Hash every carrier record and leg of an SSIM file.
+
+    Returns:
+      A tuple of (dict mapping carrier to digest, dict mapping leg key to
+      digest).
+    """
+    return line_digests(utils.read_lines(filename))
+
+
+def line_digests(lines):
+    """Hash every carrier record and leg of a stream of SSIM records."""
+    digests = ({}, {})
+    for group in record_groups(lines):
+        add_digest(digests, *group)
+    return digests
+
+
+def add_digest(digests, record_type, key, lines):
+    """Add one group from record_groups to (carrier, leg) digests."""
+    carriers, legs = digests
+    if record_type == '2':
+        carriers.setdefault(key, digest(lines))
+    elif key in legs:
+        logging.debug('Leg {} is split over several groups'.format(key))
+        legs[key] = chain(legs[key], digest(lines))
+    else:
+        legs[key] = digest(lines)
+
+
+def digested_lines(lines, digests):
+    """Yield the records 2, 3 and 4 of lines, hashing them on the way.
+
+    Lets a schedule be hashed and parsed from a single read.
+
+    Args:
+      lines: iterable of SSIM records in file order.
+      digests: tuple.  (carrier, leg) digest dicts, as line_digests
+        returns them, filled in once the stream is exhausted.
+    """
+    for group in record_groups(lines):
+        add_digest(digests, *group)
+        for line in group[2]:
+            yield line
+
+
+class ScheduleDiff(object):
+    """The differences between an old and a new version of a schedule.
+
+    Lines are only kept for legs that were added or changed, so memory use
+    follows the size of the change set.
+    """
+
+    def __init__(self):
+        self.added_legs = {}
+        self.changed_legs = {}
+        self.removed_legs = set()
+        self.changed_carriers = set()
+        self.carrier_records = {}
+        self.old_flights = set()
+        self.new_flights = set()
+        # schedule_digests() of the new schedule.
+        self.digests = ({}, {})
+
+    @property
+    def added_flights(self):
+        return self.new_flights - self.old_flights
+
+    @property
+    def removed_flights(self):
+        return self.old_flights - self.new_flights
+
+    @property
+    def changed_flights(self):
+        touched = set(key[:2] for key in self.changed_legs)
+        touched.update(key[:2] for key in self.added_legs)
+        touched.update(key[:2] for key in self.removed_legs)
+        return touched & self.old_flights & self.new_flights
+
+    def __len__(self):
+        return (len(self.added_legs) + len(self.changed_legs) +
+                len(self.removed_legs) + len(self.changed_carriers))
+
+
+def diff_schedules(old_filename, new_filename):
+    """Compare two SSIM files leg by leg.
+
+    Args:
+      old_filename: str.  The previous version of the schedule.
+      new_filename: str.  The current version of the schedule.
+    Returns:
+      A ScheduleDiff.
+    """
+    return diff_lines(schedule_digests(old_filename),
+                      utils.read_lines(new_filename))
+
+
+def diff_lines(old_digests, lines):
+    """Compare a new schedule against the digests of the old one.
+
+    Args:
+      old_digests: tuple.  schedule_digests() of the previous version.
+      lines: iterable of SSIM records of the current version.
+    Returns:
+      A ScheduleDiff, with the digests of the new schedule.
+    Raises:
+      RepeatedLegError: when a leg split over several groups needs lines
+        that were already dropped.
+    """
+    old_carriers, old_legs = old_digests
+    diff = ScheduleDiff()
+    diff.old_flights = set(key[:2] for key in old_legs)
+    new_carriers, new_legs = diff.digests
+    # Split legs, only known to be changed once the whole file is read.
+    split_legs = set()
+    for record_type, key, lines in record_groups(lines):
+        if record_type == '2':
+            if key not in diff.carrier_records:
+                diff.carrier_records[key] = RecordTwo(lines[0])
+                new_carriers[key] = digest(lines)
+                if old_carriers.get(key) != new_carriers[key]:
+                    diff.changed_carriers.add(key)
+            continue
+        if key in new_legs:
+            kept = diff.added_legs.get(key, diff.changed_legs.get(key))
+            if kept is None:
+                raise RepeatedLegError(
+                    'Leg {} is split over several groups'.format(key))
+            new_legs[key] = chain(new_legs[key], digest(lines))
+            kept.extend(lines)
+            split_legs.add(key)
+            continue
+        new_legs[key] = digest(lines)
+        diff.new_flights.add(key[:2])
+        old_digest = old_legs.get(key)
+        if old_digest is None:
+            diff.added_legs[key] = lines
+        elif old_digest != new_legs[key]:
+            diff.changed_legs[key] = lines
+    for key in split_legs:
+        if key in diff.changed_legs and old_legs[key] == new_legs[key]:
+            del diff.changed_legs[key]
+    diff.removed_legs = set(old_legs) - set(new_legs)
+    logging.debug('Schedule diff: {} added, {} changed, {} removed legs'.format(
+            len(diff.added_legs), len(diff.changed_legs),
+            len(diff.removed_legs)))
+    return diff
+
+
+def apply_diff(flights, diff):
+    """Update Flight objects built from the old schedule to the new one.
+
+    Only flights named in the diff are touched.
+
+    Args:
+      flights: dict.  Flight objects built from the old schedule.
+      diff: ScheduleDiff.  The differences to apply.
+    Returns:
+      flights: dict. The same dictionary, now matching the new schedule.
+    """
+    for carrier, flight_num, ivi, leg_sequence in diff.removed_legs:
+        flight = flights.get(carrier + flight_num)
+        if flight is None or ivi not in flight.ivi:
+            continue
+        flight.ivi[ivi].remove_leg(leg_sequence)
+        if not flight.ivi[ivi].legs:
+            del flight.ivi[ivi]
+        if not flight.ivi:
+            del flights[carrier + flight_num]
+
+    for legs in (diff.changed_legs, diff.added_legs):
+        for (carrier, flight_num, ivi, leg_sequence), lines in legs.items():
+            flightname = carrier + flight_num
+            if flightname not in flights:
+                flights[flightname] = Flight(
+                    carrier, flight_num, diff.carrier_records.get(carrier))
+            flight = flights[flightname]
+            if ivi in flight.ivi:
+                flight.ivi[ivi].remove_leg(leg_sequence)
+            for line in lines:
+                flight.create_variation(ivi, RECORD_CLASSES[line[:1]](line))
+
+    for flight in flights.values():
+        if flight.carrier_code in diff.changed_carriers:
+            flight.handle_record2(diff.carrier_records[flight.carrier_code])
+    return flights
+
+
+def reload_flights(old, new_filename, cache, workers=None):
+    """Bring the snapshot of the previous schedule up to date.
+
+    When the previous schedule has a snapshot with digests, new_filename
+    is read once, to hash it and diff it against them; only the
+    differences are applied and the result is saved as its snapshot.
+    Otherwise, or when a split leg cannot be diffed, the new schedule is
+    parsed in full, hashed from the same read.
+
+    Args:
+      old: str.  The snapshot key of the previous version, as returned by
+        an earlier reload, or its SSIM file, hashed to find the key.
+      new_filename: str.  The current version of the schedule.
+      cache: snapshot.SnapshotCache.  Where snapshots are kept.
+      workers: int.  Parser processes to use for a full parse.
+    Returns:
+      A tuple of (flights dict, ScheduleDiff or None after a full parse,
+      snapshot key of new_filename).
+    """
+    old_key = cache.key(old) if os.path.isfile(old) else old
+    entry = cache.load_entry(old_key)
+    if entry is not None and entry[1] is not None:
+        flights, old_digests = entry
+        file_digest = hashlib.sha1()
+        try:
+            diff = diff_lines(old_digests, utils.read_lines_hashed(
+                    new_filename, file_digest))
+        except RepeatedLegError as e:
+            logging.warning('{}, parsing {!r} in full'.format(e, new_filename))
+        else:
+            key = cache.hash_key(file_digest.hexdigest())
+            apply_diff(flights, diff)
+            cache.save(key, flights, diff.digests)
+            return flights, diff, key
+    file_digest = hashlib.sha1()
+    digests = ({}, {})
+    flights = parallel.parse_lines(digested_lines(
+            utils.read_lines_hashed(new_filename, file_digest), digests),
+                                   workers)
+    key = cache.hash_key(file_digest.hexdigest())
+    cache.save(key, flights, digests)
+    return flights, None, key
@@ -0,0 +1,239 @@
+"""Aggregate a schedule in one streaming pass over its record 3s.
+
+Nothing is kept per leg.  Each leg adds to counters keyed on its parsed
+fields, and departures per date are recorded as the start and end of
+each weekly run of dates, so memory grows with the number of stations,
+routes and dates in the schedule but not with the size of the file.
+
+Reports:
+  stations    departures per station per local departure date
+  routes      departures per route per week (weeks start on Monday)
+  aircraft    legs and departures per aircraft type
+  blocktimes  departures by block time, in BLOCK_BUCKET minute buckets
+"""
+import collections
+import datetime
+
+import compact
+import utils
+
+
+REPORTS = ('stations', 'routes', 'aircraft', 'blocktimes')
+BLOCK_BUCKET = 30
+# Days an open ended period of operation is counted for.
+OPEN_ENDED_DAYS = 366
+
+
+def date_variation_days(code):
+    """Days of an SSIM date variation character; 'A' is the day before."""
+    if code.isdigit():
+        return int(code)
+    return -1 if code == 'A' else 0
+
+
+def operating_runs(start, end, mask, fortnightly=False):
+    """The runs of flight dates a leg operates on, one per weekday.
+
+    Args:
+      start: int.  Ordinal of the first day of the period of operation.
+      end: int.  Ordinal of the last day.
+      mask: int.  Days of operation bitmask, bit 0 for Monday.
+      fortnightly: bool.  Operates in the week the period starts in and
+        every second week after it.
+    Yields:
+      (first ordinal, last ordinal, stride in days) tuples.
+    """
+    stride = 14 if fortnightly else 7
+    monday = start - datetime.date.fromordinal(start).weekday()
+    for weekday in range(7):
+        if not mask & 1 << weekday:
+            continue
+        first = monday + weekday
+        if first < start:
+            first += 7
+        if fortnightly and (first - monday) // 7 % 2:
+            first += 7
+        if first > end:
+            continue
+        yield first, first + (end - first) // stride * stride, stride
+
+
+class DateCounter(object):
+    """Count departures per key and date from runs of dates.
+
+    Each run is stored as a +1 where it starts and a -1 one stride after it
+    ends; counts() adds them up along each stride.
+    """
+
+    def __init__(self):
+        # key -> (stride, ordinal) -> change in departures
+        self.changes = collections.defaultdict(collections.Counter)
+
+    def add(self, key, first, last, stride):
+        changes = self.changes[key]
+        changes[(stride, first)] += 1
+        changes[(stride, last + stride)] -= 1
+
+    def keys(self):
+        return sorted(self.changes)
+
+    def counts(self, key):
+        """Departures of key per date, as sorted (ordinal, count) pairs."""
+        changes = self.changes.get(key)
+        if not changes:
+            return []
+        days = [day for stride, day in changes]
+        totals = collections.Counter()
+        for stride in set(stride for stride, day in changes):
+            running = collections.Counter()
+            for day in range(min(days), max(days)):
+                running[day % stride] += changes.get((stride, day), 0)
+                if running[day % stride]:
+                    totals[day] += running[day % stride]
+        return sorted(totals.items())
+
+
+class ScheduleStats(object):
+    """Accumulate the aggregates of a stream of SSIM records.
+
+    Record 2s set the time mode of their carrier; block times of a UTC
+    schedule are taken from the times alone, those of a local time
+    schedule also correct for the UTC variations.
+
+    Args:
+      carrier: str.  Only count this carrier's legs when given.
+    """
+
+    def __init__(self, carrier=None):
+        self.carrier = carrier.upper() if carrier else None
+        self.time_modes = {}
+        self.legs = 0
+        self.departures = 0
+        self.skipped = 0
+        self.stations = DateCounter()
+        self.routes = DateCounter()
+        self.aircraft_legs = collections.Counter()
+        self.aircraft_departures = collections.Counter()
+        self.block_times = collections.Counter()
+
+    def update(self, lines):
+        """Count every record 3 of lines."""
+        for line in lines:
+            record_type = line[:1]
+            if record_type != '3' and record_type != '2':
+                continue
+            carrier = line[2:5].strip()
+            if self.carrier is not None and carrier != self.carrier:
+                continue
+            if record_type == '2':
+                self.time_modes.setdefault(carrier, line[1])
+            else:
+                self.add_leg(line, self.time_modes.get(carrier, 'L'))
+        return self
+
+    def add_leg(self, line, time_mode='L'):
+        """Count one record 3."""
+        start = compact.date_ordinal(line[14:21])
+        end = compact.date_ordinal(line[21:28])
+        mask = compact.days_mask(line[28:35])
+        if start is None or not mask:
+            self.skipped += 1
+            return
+        if end is None:
+            end = start + OPEN_ENDED_DAYS - 1
+        self.legs += 1
+        origin = line[36:39]
+        destination = line[54:57]
+        aircraft = line[72:75].strip()
+        shift = date_variation_days(line[192:193])
+        departures = 0
+        for first, last, stride in operating_runs(start, end, mask,
+                                                  line[35:36] == '2'):
+            first += shift
+            last += shift
+            self.stations.add(origin, first, last, stride)
+            self.routes.add((origin, destination), first, last, stride)
+            departures += (last - first) // stride + 1
+        self.departures += departures
+        self.aircraft_legs[aircraft] += 1
+        self.aircraft_departures[aircraft] += departures
+        block = self.block_time(line, time_mode)
+        if block is not None:
+            self.block_times[block // BLOCK_BUCKET * BLOCK_BUCKET] += (
+                departures)
+
+    @staticmethod
+    def block_time(line, time_mode='L'):
+        """Minutes from departure to arrival of a record 3, or None."""
+        std = compact.time_minutes(line[39:43])
+        sta = compact.time_minutes(line[61:65])
+        if std is None or sta is None:
+            return None
+        days = (date_variation_days(line[193:194]) -
+                date_variation_days(line[192:193]))
+        block = sta - std + days * 1440
+        if time_mode != 'U':
+            departure_utc = compact.utc_minutes(line[47:52])
+            arrival_utc = compact.utc_minutes(line[65:70])
+            if departure_utc is None or arrival_utc is None:
+                return None
+            block -= arrival_utc - departure_utc
+        return block if block >= 0 else None
+
+    def station_days(self, station=None):
+        """Yield (station, date, departures) in station and date order."""
+        stations = [station.upper()] if station else self.stations.keys()
+        for code in stations:
+            for day, count in self.stations.counts(code):
+                yield code, datetime.date.fromordinal(day), count
+
+    def route_weeks(self):
+        """Yield (origin, destination, Monday, departures) per route week."""
+        for route in self.routes.keys():
+            weeks = collections.Counter()
+            for day, count in self.routes.counts(route):
+                weeks[day - datetime.date.fromordinal(day).weekday()] += count
+            for monday, count in sorted(weeks.items()):
+                yield route + (datetime.date.fromordinal(monday), count)
+
+    def aircraft(self):
+        """Yield (aircraft type, legs, departures), busiest first."""
+        for aircraft, departures in self.aircraft_departures.most_common():
+            yield aircraft, self.aircraft_legs[aircraft], departures
+
+    def block_time_distribution(self):
+        """Yield (bucket start in minutes, departures) in bucket order."""
+        return sorted(self.block_times.items())
+
+    def block_time_percentile(self, percent):
+        """The bucket holding the given percentile of departures."""
+        total = sum(self.block_times.values())
+        seen = 0
+        for bucket, count in self.block_time_distribution():
+            seen += count
+            if seen * 100 >= percent * total:
+                return bucket
+        return None
+
+
+def schedule_stats(filename, carrier=None):
+    """Compute every aggregate of a plain or compressed SSIM file."""
+    return ScheduleStats(carrier).update(utils.read_lines(filename))
+
+
+def write_report(stats, report, out, station=None):
+    """Write one report as tab separated lines with a header."""
+    if report == 'stations':
+        out.write('station\tdate\tdepartures\n')
+        rows = stats.station_days(station)
+    elif report == 'routes':
+        out.write('origin\tdestination\tweek\tdepartures\n')
+        rows = stats.route_weeks()
+    elif report == 'aircraft':
+        out.write('aircraft\tlegs\tdepartures\n')
+        rows = stats.aircraft()
+    else:
+        out.write('block_minutes\tdepartures\n')
+        rows = stats.block_time_distribution()
+    for row in rows:
+        out.write('\t'.join(str(value) for value in row) + '\n')
@@ -0,0 +1,153 @@
+"""Cache parsed Flight graphs as binary snapshots.
+
+Snapshots are keyed by the SHA-1 of the source SSIM and PARSER_VERSION,
+so a changed file or a changed parser never returns stale flights.  The
+cache directory is kept under a size limit by evicting the least
+recently used snapshots.  A snapshot may also hold the per-record
+digests schedule_diff compares, so the next version of the schedule can
+be diffed against it without the old file.
+"""
+import hashlib
+import logging
+import os
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import parallel
+import utils
+
+
+# Bump this whenever the Flight objects built from an SSIM change shape.
+PARSER_VERSION = 4
+SNAPSHOT_SUFFIX = '.snap'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'ssim_pprint')
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def file_hash(filename):
+    """Return the SHA-1 hex digest of a file's contents."""
+    digest = hashlib.sha1()
+    utils.hash_file(filename, digest)
+    return digest.hexdigest()
+
+
+class SnapshotCache(object):
+    """A directory of flight snapshots with least recently used eviction.
+
+    Loading a snapshot refreshes its modification time, which is what
+    eviction orders on.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or os.environ.get('SSIM_PPRINT_CACHE',
+                                                     DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+
+    def key(self, filename, carrier=None):
+        """Build the snapshot key for an SSIM file and optional carrier."""
+        return self.hash_key(file_hash(filename), carrier)
+
+    def hash_key(self, hexdigest, carrier=None):
+        """Build a snapshot key from the SHA-1 hex digest of an SSIM."""
+        return '{}-{}-v{}'.format(hexdigest, (carrier or 'all').upper(),
+                                  PARSER_VERSION)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + SNAPSHOT_SUFFIX)
+
+    def load(self, key):
+        """Return the flights stored under key, or None on a cache miss."""
+        entry = self.load_entry(key)
+        return entry[0] if entry is not None else None
+
+    def load_entry(self, key):
+        """Return (flights, digests or None) stored under key, or None."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if entry[0] != PARSER_VERSION:
+            return None
+        os.utime(path, None)
+        logging.debug('Loaded snapshot {!r}'.format(path))
+        return entry[1:]
+
+    def save(self, key, flights, digests=None):
+        """Store flights under key, then trim the cache to max_bytes.
+
+        Args:
+          key: str.  From key() or hash_key().
+          flights: dict.  Mapping of flight names to Flight objects.
+          digests: The schedule_diff.schedule_digests() of the schedule,
+            kept so a later version can be diffed against this one.
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = self.path(key)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((PARSER_VERSION, flights, digests), f,
+                        pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+        logging.debug('Saved snapshot {!r}'.format(path))
+        self.evict(keep=path)
+
+    def snapshots(self):
+        """Return (mtime, size, path) for every snapshot, oldest first."""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for name in os.listdir(self.directory):
+            if name.endswith(SNAPSHOT_SUFFIX):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """Delete least recently used snapshots until under max_bytes.
+
+        Args:
+          keep: str.  A snapshot path that must survive, even if it alone
+            is larger than the limit.
+        """
+        entries = self.snapshots()
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            logging.debug('Evicting snapshot {!r}'.format(path))
+            os.remove(path)
+            total -= size
+
+
+def load_flights(filename, workers=None, carrier=None, cache=None):
+    """Return the Flight objects of an SSIM, from a snapshot when possible.
+
+    Args:
+      filename: str.  Plain or compressed SSIM file.
+      workers: int.  Parser processes to use on a cache miss.
+      carrier: str.  Only build this carrier's flights when given.
+      cache: SnapshotCache.  Pass None to always parse.
+    Returns:
+      flights: dict. Mapping of flight names to flight objects.
+    """
+    if cache is None:
+        return parallel.parse_flights(filename, workers, carrier)
+    key = cache.key(filename, carrier)
+    flights = cache.load(key)
+    if flights is None:
+        flights = parallel.parse_flights(filename, workers, carrier)
+        try:
+            cache.save(key, flights)
+        except (IOError, OSError) as e:
+            logging.debug('Could not save snapshot: {}'.format(e))
+    return flights
@@ -0,0 +1,259 @@
+"""Generate synthetic SSIM files for testing and benchmarking.
+
+The output is deterministic for a given seed: the same arguments always
+produce byte for byte the same file.
+
+Usage: python ssim_generator.py out.ssim.dat [--carriers N] [--flights N]
+                                [--variations N] [--legs N] [--deis N]
+                                [--seed N] [--gzip]
+"""
+import argparse
+import datetime
+import gzip
+import random
+import string
+
+from flight_classes import RecordFour, RecordThree, RecordTwo
+from utils import RECORD_LENGTH, make_record
+
+
+MONTHS = ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN',
+          'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC')
+AIRCRAFT_TYPES = ('319', '320', '321', '32N', '738', '73H', '76W', '77W',
+                  '788', '333', 'E90', 'CR9', 'DH4', 'AT7', 'CNJ')
+SERVICE_TYPES = 'JJJJJJCFG'
+# DEI numbers the record 4s of each leg are picked from.
+DEI_NUMBERS = (10, 505, 50, 127, 501, 503)
+SEASON_START = datetime.date(2015, 3, 29)
+SEASON_DAYS = 210
+
+
+def ssim_date(date):
+    """Format a date as SSIM 'DDMONYY'."""
+    return '{:02d}{}{:02d}'.format(date.day, MONTHS[date.month - 1],
+                                   date.year % 100)
+
+
+def date_variation(minutes):
+    """SSIM date variation code for a time in minutes from the first day."""
+    days = minutes // 1440
+    if days < 0:
+        return 'A'
+    return str(min(days, 9))
+
+
+class SsimGenerator(object):
+    """Build the records of a synthetic multi-carrier schedule.
+
+    Args:
+      carriers: int.  Number of airlines in the file.
+      flights: int.  Flights per carrier.
+      variations: int.  Itinerary variations per flight.
+      legs: int.  Legs per variation.
+      deis: int.  Record 4s per leg.
+      seed: int.  Seed for the random number generator.
+    """
+
+    def __init__(self, carriers=2, flights=100, variations=3, legs=2, deis=2,
+                 seed=0):
+        self.carriers = carriers
+        self.flights = flights
+        self.variations = variations
+        self.legs = legs
+        self.deis = deis
+        self.random = random.Random(seed)
+        self.serial = 0
+        self.stations = self.codes(string.ascii_uppercase, 3,
+                                   max(10, legs * 4 + 1))
+        self.carrier_codes = self.codes(string.ascii_uppercase +
+                                        string.digits, 2, carriers)
+        self.utc_offsets = dict((station, self.random.randrange(-10, 11))
+                                for station in self.stations)
+
+    def codes(self, alphabet, length, count):
+        """Return count distinct random codes, sorted."""
+        codes = set()
+        while len(codes) < count:
+            codes.add(''.join(self.random.choice(alphabet)
+                              for _ in range(length)))
+        return sorted(codes)
+
+    def finish(self, line):
+        """Stamp the next record serial number on a record."""
+        self.serial += 1
+        return line[:194] + '{:06d}'.format(self.serial) + '\n'
+
+    def header(self):
+        line = (' ' * RECORD_LENGTH)
+        line = ('1AIRLINE STANDARD SCHEDULE DATA SET     1' + line)[:194]
+        return self.finish(line)
+
+    def carrier_record(self, carrier):
+        end = SEASON_START + datetime.timedelta(days=SEASON_DAYS)
+        return self.finish(make_record('2', RecordTwo.LAYOUT, {
+            'time_mode': 'L',
+            'carrier_code': carrier,
+            'validity_period': ssim_date(SEASON_START) + ssim_date(end),
+            'creation_date': ssim_date(SEASON_START - datetime.timedelta(30)),
+            'eticket': 'ET',
+            }))
+
+    def trailer(self, carrier):
+        line = make_record('5', (('carrier_code', 2, 5),),
+                           {'carrier_code': carrier})
+        line = line[:187] + '{:06d}E'.format(self.serial) + line[194:]
+        return self.finish(line)
+
+    def utc_variation(self, station):
+        offset = self.utc_offsets[station]
+        return '{}{:02d}00'.format('+' if offset >= 0 else '-', abs(offset))
+
+    def days_of_operation(self):
+        days = [str(day) if self.random.random() < 0.6 else ' '
+                for day in range(1, 8)]
+        if not ''.join(days).strip():
+            day = self.random.randrange(7)
+            days[day] = str(day + 1)
+        return ''.join(days)
+
+    def dei_data(self, number, carrier):
+        if number == 10:
+            return '{} {}'.format(self.random.choice(self.carrier_codes),
+                                  self.random.randrange(1, 10000))
+        if number == 50:
+            return '{} {}'.format(carrier, self.random.randrange(1, 10000))
+        if number == 127:
+            return 'OPERATED BY {} EXPRESS'.format(carrier)
+        if number == 505:
+            return 'ET'
+        return self.random.choice(('Y', 'N', 'XX'))
+
+    def flight_records(self, carrier, flight_num):
+        """Yield the record 3s and 4s of one flight."""
+        stations = self.random.sample(self.stations, self.legs + 1)
+        aircraft_type = self.random.choice(AIRCRAFT_TYPES)
+        service_type = self.random.choice(SERVICE_TYPES)
+        first_departure = self.random.randrange(5 * 60, 23 * 60, 5)
+        for ivi in range(1, self.variations + 1):
+            start = SEASON_START + datetime.timedelta(
+                days=self.random.randrange(SEASON_DAYS - 14))
+            end = start + datetime.timedelta(
+                days=self.random.randrange(7, SEASON_DAYS))
+            days = self.days_of_operation()
+            # Minutes from midnight, local time, of the first leg's day.
+            departure = first_departure + self.random.randrange(-60, 61, 5)
+            for leg in range(self.legs):
+                origin, destination = stations[leg], stations[leg + 1]
+                block = self.random.randrange(45, 720, 5)
+                utc_change = (self.utc_offsets[destination] -
+                              self.utc_offsets[origin]) * 60
+                arrival = departure + block + utc_change
+                std = '{:02d}{:02d}'.format(*divmod(departure % 1440, 60))
+                sta = '{:02d}{:02d}'.format(*divmod(arrival % 1440, 60))
+                values = {
+                    'carrier_code': carrier,
+                    'flight': '{:>4}'.format(flight_num),
+                    'ivi': '{:02d}'.format(ivi),
+                    'leg_sequence': '{:02d}'.format(leg + 1),
+                    'service_type': service_type,
+                    'period_of_operation_start': ssim_date(start),
+                    'period_of_operation_end': ssim_date(end),
+                    'days_of_operation': days,
+                    'departure_station': origin,
+                    'passenger_std': std,
+                    'aircraft_std': std,
+                    'departure_utc_variation': self.utc_variation(origin),
+                    'arrival_station': destination,
+                    'aircraft_sta': sta,
+                    'passenger_sta': sta,
+                    'arrival_utc_variation': self.utc_variation(destination),
+                    'aircraft_type': aircraft_type,
+                    'prdb': 'JCDZYBMHQ',
+                    'mct': self.random.choice('  DI'),
+                    'aircraft_configuration': 'C20Y150',
+                    'date_variation': (date_variation(departure) +
+                                       date_variation(arrival)),
+                    }
+                yield self.finish(make_record('3', RecordThree.LAYOUT,
+                                              values))
+                for number in self.random.sample(DEI_NUMBERS,
+                                                 min(self.deis,
+                                                     len(DEI_NUMBERS))):
+                    yield self.finish(make_record('4', RecordFour.LAYOUT, {
+                        'carrier_code': carrier,
+                        'flight': values['flight'],
+                        'ivi': values['ivi'],
+                        'leg_sequence': values['leg_sequence'],
+                        'service_type': service_type,
+                        'board_point_indicator': 'A'.rjust(11),
+                        'off_point_indicator': 'B',
+                        'dei': '{:03d}'.format(number),
+                        'board_point': origin,
+                        'off_point': destination,
+                        'dei_data': self.dei_data(number, carrier),
+                        }))
+                departure = arrival + self.random.randrange(30, 120, 5)
+
+    def lines(self):
+        """Yield every line of the schedule in SSIM order."""
+        yield self.header()
+        for carrier in self.carrier_codes:
+            yield self.carrier_record(carrier)
+            flight_numbers = sorted(self.random.sample(xrange(1, 10000),
+                                                       self.flights))
+            for flight_num in flight_numbers:
+                for line in self.flight_records(carrier, flight_num):
+                    yield line
+            yield self.trailer(carrier)
+
+
+def generate_ssim(filename, compress=False, **options):
+    """Write a synthetic SSIM file.
+
+    Args:
+      filename: str.  The file to write.
+      compress: bool.  Write gzip compressed output.
+      options: keyword arguments for SsimGenerator.
+    Returns:
+      The number of lines written.
+    """
+    generator = SsimGenerator(**options)
+    if compress:
+        # A fixed mtime keeps compressed output reproducible.
+        f = gzip.GzipFile(filename, 'wb', mtime=0)
+    else:
+        f = open(filename, 'wb')
+    count = 0
+    try:
+        for line in generator.lines():
+            f.write(line)
+            count += 1
+    finally:
+        f.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate an SSIM file')
+    parser.add_argument('filename', help='File to write')
+    parser.add_argument('--carriers', type=int, default=2)
+    parser.add_argument('--flights', type=int, default=100,
+                        help='Flights per carrier')
+    parser.add_argument('--variations', type=int, default=3,
+                        help='Variations per flight')
+    parser.add_argument('--legs', type=int, default=2,
+                        help='Legs per variation')
+    parser.add_argument('--deis', type=int, default=2,
+                        help='Record 4s per leg')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--gzip', action='store_true',
+                        help='Compress the output with gzip')
+    args = vars(parser.parse_args())
+    filename = args.pop('filename')
+    compress = args.pop('gzip')
+    count = generate_ssim(filename, compress, **args)
+    print('Wrote {} records to {!r}'.format(count, filename))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,27 @@
 import argparse
 import logging
 import os
-import re
 import sys
+import time
 
+import columnar
+import connections
+import flight_index
+import ingest
+import instrumentation
+import operating_dates
+import parallel
+import query_server
+import render
+import schedule_diff
+import schedule_stats
+import snapshot
+import ssim_split
 import utils
-from flight_classes import RecordTwo, RecordThree, RecordFour, Flight
+from flight_classes import RECORD_CLASSES, RecordTwo, Flight, classify_record
 
-
-# Set the log output file and log level.
-logging.basicConfig(filename='ssim_pprint.log', level=logging.DEBUG)
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
 
 
 def parse_records(carrier, filename):
@@ -22,22 +34,82 @@ def parse_records(carrier, filename):
       A tuple of list objects.  Each list contains record objects.
     """
 
-    carrier_regex = '^2.' + carrier.upper()
-    leg_regex = '^3.' + carrier.upper()
-    seg_regex = '^4.' + carrier.upper()
+    return parse_lines(utils.read_lines(filename), carrier)
+
+
+def parse_lines(lines, carrier):
+    """Parse a stream of SSIM records held in memory.
+
+    The last stage of read_lines -> carrier_lines/flight_lines -> parse;
+    nothing is written to disk on the way.
+
+    Args:
+      lines: iterable of SSIM records, e.g. utils.flight_lines(...).
+      carrier: str. Two character IATA code for Airline Carrier
+    Returns:
+      A tuple of list objects.  Each list contains record objects.
+    """
+
+    carrier = carrier.upper()
     carrier_record = []
     leg_records = []
     seg_records = []
-    my_rec_two = ''
-    with open(filename, 'rb') as f:
-        for line in f:
-            if re.search(carrier_regex, line):
-                carrier_record.append(RecordTwo(line))
-            if re.search(leg_regex, line):
-                leg_records.append(RecordThree(line))
-            if re.search(seg_regex, line):
-                seg_records.append(RecordFour(line))
-        return carrier_record, leg_records, seg_records
+    records = {'2': carrier_record, '3': leg_records, '4': seg_records}
+    for line in lines:
+        record_type = classify_record(line, carrier)
+        if record_type in RECORD_CLASSES:
+            records[record_type].append(RECORD_CLASSES[record_type](line))
+    return carrier_record, leg_records, seg_records
+
+
+def parse_batch_records(flight_keys, filename):
+    """Read an SSIM file once, keeping the records of many flights.
+
+    Args:
+      flight_keys: iterable of (carrier, flight number) tuples.
+      filename: str. The file to parse
+    Returns:
+      A tuple of (dict mapping carrier code to its RecordTwo, list of
+      RecordThree objects, list of RecordFour objects).
+    """
+
+    wanted = set((carrier.upper(), flight.strip())
+                 for carrier, flight in flight_keys)
+    carriers = set(carrier for carrier, flight in wanted)
+    carrier_records = {}
+    leg_records = []
+    seg_records = []
+    records = {'3': leg_records, '4': seg_records}
+    for line in utils.read_lines(filename):
+        record_type = line[:1]
+        if record_type == '2':
+            carrier = line[2:5].strip()
+            if carrier in carriers and carrier not in carrier_records:
+                carrier_records[carrier] = RecordTwo(line)
+        elif record_type in records:
+            if (line[2:5].strip(), line[5:9].strip()) in wanted:
+                records[record_type].append(RECORD_CLASSES[record_type](line))
+    return carrier_records, leg_records, seg_records
+
+
+def build_batch_flights(carrier_records, leg_records, seg_records):
+    """Build flight objects for records belonging to several carriers.
+
+    Args:
+      carrier_records: dict. Mapping of carrier code to RecordTwo object.
+      leg_records: list. RecordThree objects for the requested flights.
+      seg_records: list. RecordFour objects for the requested flights.
+    Returns:
+      flights: dict. Mapping of flight names to flight objects.
+    """
+    flights = {}
+    for carrier, carrier_record in carrier_records.items():
+        create_flights(carrier_record,
+                       [r for r in leg_records if r.carrier_code == carrier],
+                       flights)
+    update_flights(leg_records, flights)
+    update_flights(seg_records, flights)
+    return flights
 
 
 def create_flights(carrier_record, record_list, flights):
@@ -77,6 +149,68 @@ def update_flights(record_list, flights):
     return flights
 
 
+def iter_flights(lines, carrier=None):
+    """Build flights one at a time from a stream of SSIM records.
+
+    SSIM files keep each flight's records together, so a flight is
+    complete as soon as a record for another flight is seen.  Only that
+    one flight is held in memory.
+
+    Args:
+      lines: iterable of SSIM records, e.g. utils.read_lines(filename).
+      carrier: str. Only build this carrier's flights when given.
+    Yields:
+      Flight objects in file order.
+    """
+    if carrier is not None:
+        carrier = carrier.upper()
+    carrier_records = {}
+    flight = None
+    for line in lines:
+        record_type = line[:1]
+        if record_type not in RECORD_CLASSES:
+            continue
+        carrier_code = line[2:5].strip()
+        if carrier is not None and carrier_code != carrier:
+            continue
+        record = RECORD_CLASSES[record_type](line)
+        if record_type == '2':
+            carrier_records.setdefault(carrier_code, record)
+            continue
+        if flight is None or flight.name != carrier_code + record.flight:
+            if flight is not None:
+                instrumentation.count('flights built')
+                yield flight
+            flight = Flight(carrier_code, record.flight,
+                            carrier_records.get(carrier_code))
+        flight.create_variation(record.ivi, record)
+    if flight is not None:
+        instrumentation.count('flights built')
+        yield flight
+
+
+def configure_logging(level='WARNING', filename=None):
+    """Send log records at or above level to filename, or to stderr.
+
+    Any handlers installed earlier, including the one logging adds by
+    itself on first use, are replaced.
+
+    Args:
+      level: str.  One of LOG_LEVELS.
+      filename: str.  Log file to append to, or None for stderr.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    if filename:
+        handler = logging.FileHandler(filename)
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
 def parse_commands():
     """ Construct the command line parser."""
 
@@ -84,56 +218,361 @@ def parse_commands():
     description = 'Display information about a specific Airline Flight'
     parser = argparse.ArgumentParser(description=description)
 
+    # Options shared by every subcommand.
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--log-level', choices=LOG_LEVELS, default='WARNING',
+                        help='Lowest level of log message to record')
+    common.add_argument('--log-file',
+                        help='Append log messages here instead of stderr')
+    common.add_argument('--stats', action='store_true',
+                        help='Print stage timings and counters to stderr')
+    common.add_argument('--profile', metavar='FILE',
+                        help='Write a cProfile dump of the run to FILE')
+
     subparsers = parser.add_subparsers(dest='command',
                                        help='Available Commands')
 
     #Todo: Consider supporting a mapping of names to IATA codes.
     logging.debug('Constructing the flight lookup subparser')
-    lookup_parser = subparsers.add_parser('lookup',
-                                          help='Look up specific flight data.')
+    lookup_parser = subparsers.add_parser(
+        'lookup', parents=[common], help='Look up specific flight data.')
     lookup_parser.add_argument('-c', '--carrier',
                                help='Two digit IATA carrier code')
     lookup_parser.add_argument('-f', '--flight',
                                help='Number of the flight to lookup')
+    lookup_parser.add_argument('--format', choices=render.OUTPUT_FORMATS,
+                               default='text', help='Output format')
+    lookup_parser.add_argument('--keep-isolated', metavar='FILE',
+                               help="Also write the flight's records to FILE")
     lookup_parser.add_argument('-s', '--ssim',
                                help='Name of the SSIM file to search')
+
+    logging.debug('Constructing the index subparser')
+    index_parser = subparsers.add_parser(
+        'index', parents=[common], help='Build the flight lookup index.')
+    index_parser.add_argument('-s', '--ssim',
+                              help='Name of the SSIM file to index')
+
+    logging.debug('Constructing the batch lookup subparser')
+    batch_parser = subparsers.add_parser(
+        'batch', parents=[common],
+        help='Look up many flights in a single pass.')
+    batch_parser.add_argument('flights', nargs='*',
+                              help='Flights to lookup, e.g. HR330 or HR/330')
+    batch_parser.add_argument('-i', '--input',
+                              help='File listing flights, one per line')
+    batch_parser.add_argument('--format', choices=render.OUTPUT_FORMATS,
+                              default='text', help='Output format')
+    batch_parser.add_argument('-s', '--ssim',
+                              help='Name of the SSIM file to search')
+
+    logging.debug('Constructing the leg search subparser')
+    search_parser = subparsers.add_parser(
+        'search', parents=[common],
+        help='Search legs by station, equipment or date.')
+    search_parser.add_argument('-c', '--carrier',
+                               help='Two digit IATA carrier code')
+    search_parser.add_argument('--origin', nargs='+',
+                               help='Departure station(s)')
+    search_parser.add_argument('--destination', nargs='+',
+                               help='Arrival station(s)')
+    search_parser.add_argument('--aircraft', nargs='+',
+                               help='IATA aircraft type(s)')
+    search_parser.add_argument('--service', nargs='+',
+                               help='Service type code(s)')
+    search_parser.add_argument('--date',
+                               help='Only legs operating on this date, '
+                                    'YYYY-MM-DD or DDMONYY')
+    search_parser.add_argument('-s', '--ssim',
+                               help='Name of the SSIM file to search')
+
+    logging.debug('Constructing the operating dates subparser')
+    operating_parser = subparsers.add_parser(
+        'operating', parents=[common],
+        help='List the flights departing on a date or in a date range.')
+    operating_parser.add_argument('-c', '--carrier',
+                                  help='Only this IATA carrier code')
+    operating_parser.add_argument('--date', required=True,
+                                  help='Local departure date, '
+                                       'YYYY-MM-DD or DDMONYY')
+    operating_parser.add_argument('--until',
+                                  help='Last date of a range starting at '
+                                       '--date')
+    operating_parser.add_argument('-s', '--ssim',
+                                  help='Name of the SSIM file to search')
+
+    logging.debug('Constructing the connections subparser')
+    connections_parser = subparsers.add_parser(
+        'connections', parents=[common],
+        help='Find direct and connecting itineraries between stations.')
+    connections_parser.add_argument('-c', '--carrier',
+                                    help='Only use this IATA carrier code')
+    connections_parser.add_argument('--origin', required=True,
+                                    help='Departure station')
+    connections_parser.add_argument('--destination', required=True,
+                                    help='Arrival station')
+    connections_parser.add_argument('--date', required=True,
+                                    help='Local departure date, '
+                                         'YYYY-MM-DD or DDMONYY')
+    connections_parser.add_argument('--max-stops', type=int,
+                                    choices=range(connections.MAX_STOPS + 1),
+                                    default=connections.MAX_STOPS)
+    connections_parser.add_argument('--max-connection', type=int,
+                                    default=connections.MAX_CONNECTION,
+                                    help='Longest connection in minutes')
+    connections_parser.add_argument('--mct', nargs='+', default=[],
+                                    metavar='STATION=MINUTES',
+                                    help='Minimum connecting time overrides')
+    connections_parser.add_argument('--limit', type=int, default=20,
+                                    help='Itineraries to show')
+    connections_parser.add_argument('-s', '--ssim',
+                                    help='Name of the SSIM file to search')
+
+    logging.debug('Constructing the load subparser')
+    load_parser = subparsers.add_parser(
+        'load', parents=[common],
+        help='Parse a whole schedule and summarise it.')
+    load_parser.add_argument('-c', '--carrier',
+                             help='Only load this IATA carrier code')
+    load_parser.add_argument('-w', '--workers', type=int,
+                             help='Parser processes, defaults to CPU count')
+    load_parser.add_argument('--cache-dir',
+                             help='Snapshot cache directory')
+    load_parser.add_argument('--no-cache', action='store_true',
+                             help='Always parse, ignoring snapshots')
+    load_parser.add_argument('-s', '--ssim',
+                             help='Name of the SSIM file to load')
+
+    logging.debug('Constructing the diff subparser')
+    diff_parser = subparsers.add_parser(
+        'diff', parents=[common],
+        help='Compare two versions of a schedule.')
+    diff_parser.add_argument('-o', '--old',
+                             help='Name of the previous SSIM file, or with '
+                                  '--apply the snapshot key it printed')
+    diff_parser.add_argument('--apply', action='store_true',
+                             help='Update the old snapshot to the new file')
+    diff_parser.add_argument('--cache-dir',
+                             help='Snapshot cache directory')
+    diff_parser.add_argument('-s', '--ssim',
+                             help='Name of the current SSIM file')
+
+    logging.debug('Constructing the export subparser')
+    export_parser = subparsers.add_parser(
+        'export', parents=[common],
+        help='Stream every flight of a schedule out.')
+    export_parser.add_argument('-c', '--carrier',
+                               help='Only export this IATA carrier code')
+    export_parser.add_argument('--format', choices=render.OUTPUT_FORMATS,
+                               default='jsonl', help='Output format')
+    export_parser.add_argument('-o', '--output',
+                               help='File to write, defaults to stdout')
+    export_parser.add_argument('-s', '--ssim',
+                               help='Name of the SSIM file to export')
+
+    logging.debug('Constructing the ingest subparser')
+    ingest_parser = subparsers.add_parser(
+        'ingest', parents=[common],
+        help='Load many SSIM files concurrently into one schedule.')
+    ingest_parser.add_argument('-c', '--carrier',
+                               help='Only load this IATA carrier code')
+    ingest_parser.add_argument('-t', '--threads', type=int,
+                               default=ingest.DEFAULT_THREADS,
+                               help='Files decompressed at once')
+    ingest_parser.add_argument('-w', '--workers', type=int,
+                               help='Parser processes, defaults to CPU count')
+    ingest_parser.add_argument('-q', '--quiet', action='store_true',
+                               help='Do not report progress per file')
+    ingest_parser.add_argument('--marketed-by', metavar='CARRIER',
+                               help='List the flights this carrier markets '
+                                    'through DEI 10 codeshares')
+    ingest_parser.add_argument('--format', choices=render.OUTPUT_FORMATS,
+                               help='Also write the merged schedule out')
+    ingest_parser.add_argument('-o', '--output',
+                               help='File to write, defaults to stdout')
+    ingest_parser.add_argument('-s', '--ssim', action='append',
+                               help='SSIM file, directory or glob pattern, '
+                                    'may be repeated')
+
+    logging.debug('Constructing the stats subparser')
+    stats_parser = subparsers.add_parser(
+        'stats', parents=[common],
+        help='Aggregate departures, routes, aircraft and block times.')
+    stats_parser.add_argument('-c', '--carrier',
+                              help='Only count this IATA carrier code')
+    stats_parser.add_argument('--report', nargs='+',
+                              choices=schedule_stats.REPORTS,
+                              default=list(schedule_stats.REPORTS),
+                              help='Reports to print, all by default')
+    stats_parser.add_argument('--station',
+                              help='Only report departures from this station')
+    stats_parser.add_argument('-o', '--output',
+                              help='File to write, defaults to stdout')
+    stats_parser.add_argument('-s', '--ssim',
+                              help='Name of the SSIM file to aggregate')
+
+    logging.debug('Constructing the split subparser')
+    split_parser = subparsers.add_parser(
+        'split', parents=[common],
+        help='Write each carrier to its own SSIM file in one pass.')
+    split_parser.add_argument('-c', '--carrier', nargs='+',
+                              help='Only write these IATA carrier codes')
+    split_parser.add_argument('-o', '--output-dir', default='.',
+                              help='Directory to write the files to')
+    split_parser.add_argument('--template',
+                              default=ssim_split.DEFAULT_TEMPLATE,
+                              help='Output file name, {carrier} is replaced')
+    split_parser.add_argument('--max-open', type=int,
+                              default=ssim_split.DEFAULT_MAX_OPEN,
+                              help='Most output files open at once')
+    split_parser.add_argument('--gzip', action='store_true',
+                              help='Compress the outputs with gzip')
+    split_parser.add_argument('-w', '--workers', type=int,
+                              help='Compression processes, defaults to '
+                                   'CPU count')
+    split_parser.add_argument('-s', '--ssim',
+                              help='Name of the SSIM file to split')
+
+    logging.debug('Constructing the serve subparser')
+    serve_parser = subparsers.add_parser(
+        'serve', parents=[common],
+        help='Keep schedules in memory and answer queries over HTTP.')
+    serve_parser.add_argument('-c', '--carrier',
+                              help='Only load this IATA carrier code')
+    serve_parser.add_argument('-w', '--workers', type=int,
+                              help='Parser processes, defaults to CPU count')
+    serve_parser.add_argument('--host', default='127.0.0.1',
+                              help='Interface to listen on')
+    serve_parser.add_argument('--port', type=int, default=8080,
+                              help='TCP port to listen on')
+    serve_parser.add_argument('--unix-socket', metavar='PATH',
+                              help='Listen on a Unix socket instead of TCP')
+    serve_parser.add_argument('--reload-interval', type=float,
+                              default=query_server.DEFAULT_RELOAD_INTERVAL,
+                              help='Seconds between checks for changed '
+                                   'files, 0 to never reload')
+    serve_parser.add_argument('-s', '--ssim', action='append',
+                              help='SSIM file, directory or glob pattern '
+                                   'to serve, may be repeated')
     return parser
 
 
 def main():
     """ Parse command line args, take action based on arguments."""
 
-    logging.info("Starting the SSIM pretty printer.")
     parser = parse_commands()
-    logging.debug("All arguments are: {!r}".format(sys.argv[0:]))
     args = parser.parse_args(sys.argv[1:])
     # Convert parsed arguments from Namespace to dictionary
 
     args = vars(args)
+    configure_logging(args.pop('log_level'), args.pop('log_file'))
+    logging.info("Starting the SSIM pretty printer.")
     logging.debug("Arguments are now: {!r}".format(args))
     command = args.pop("command")
-    # Log an error and quit if file doesn't exist
-
-    if command == "lookup":
-        if os.path.exists(args['ssim']):
-            logging.debug('File {!r} exists, Continuing.'.format(
-                    args['ssim']))
+    show_stats = args.pop('stats')
+    profile = args.pop('profile')
+    if show_stats:
+        instrumentation.enable()
+    try:
+        if profile:
+            instrumentation.profiled(profile, run_command, command, args)
         else:
-            logging.debug('File {!r} doesn\'t exist.  Exiting'.format(
-                    arguments['ssim']))
+            run_command(command, args)
+    finally:
+        if show_stats:
+            instrumentation.report()
+
+
+def run_command(command, args):
+    """Carry out one subcommand.
+
+    Args:
+      command: str.  The subcommand name.
+      args: dict.  The parsed arguments of the subcommand.
+    """
+    if command in ("ingest", "serve"):
+        filenames = ingest.expand_paths(args['ssim'] or [])
+        if not filenames:
             sys.exit('SSIM file name provided not found.')
 
-        filename = args['ssim']
+    if command == "ingest":
+        progress = None if args['quiet'] else ingest.print_progress
+        start = time.time()
+        ingester = ingest.Ingester(args['threads'], args['workers'],
+                                   args['carrier'], progress)
+        with instrumentation.stage('build'):
+            flights, reports = ingester.ingest(filenames)
+        seconds = time.time() - start
+        instrumentation.count('flights built', len(flights))
+        total = sum(report.bytes for report in reports)
+        failed = [report.filename for report in reports if report.error]
+        print("Loaded {} flights from {} files, {:.1f} MB in {:.2f}s "
+              "({:.1f} MB/s)".format(len(flights), len(reports) - len(failed),
+                                     total / 1e6, seconds,
+                                     total / 1e6 / seconds if seconds else 0))
+        if failed:
+            print("Could not read: {}".format(', '.join(failed)))
+        if args['marketed_by']:
+            for leg in ingester.marketing.marketed_by(args['marketed_by']):
+                print("{} {} {} {}-{}".format(leg.marketing.name, leg.flight,
+                                              leg.ivi, leg.board_point,
+                                              leg.off_point))
+        if args['format']:
+            with instrumentation.stage('render'):
+                render.write_flights(
+                    (flights[name] for name in sorted(flights)),
+                    args['format'], args['output'])
+        return
+
+    if command == "serve":
+        with instrumentation.stage('build'):
+            store = query_server.ScheduleStore(filenames, args['carrier'],
+                                               args['workers'])
+        query_server.serve(store, args['host'], args['port'],
+                           args['unix_socket'], args['reload_interval'])
+        return
+
+    # Log an error and quit if file doesn't exist
+
+    if os.path.exists(args['ssim']):
+        logging.debug('File {!r} exists, Continuing.'.format(args['ssim']))
+    else:
+        logging.debug('File {!r} doesn\'t exist.  Exiting'.format(
+                args['ssim']))
+        sys.exit('SSIM file name provided not found.')
+
+    filename = args['ssim']
+    # Index offsets refer to plain files; compressed files are streamed.
+    compressed = utils.is_file_compressed(filename)
+
+    if command == "index":
+        if compressed:
+            sys.exit('Only uncompressed SSIM files can be indexed.')
+        index = flight_index.load_index(filename, rebuild=True)
+        print("Indexed {} flights in {!r}".format(len(index['flights']),
+                                                 filename))
+
+    if command == "lookup":
         carrier = args['carrier']
         flight = args['flight']
 
-        # Isolate the SSIM to a single carrier/flight
-        file_to_parse = utils.isolateFlight(carrier, flight, filename)
-
-        print("Single flight SSIM file {!r} created".format(file_to_parse))
-        # parse the file into record objects
-        print("Parsing SSIM file into record objects")
-        record2s, record3s, record4s = parse_records(carrier, file_to_parse)
+        print("Reading records for {} {} from {!r}".format(carrier, flight,
+                                                          filename))
+        if compressed or args['keep_isolated']:
+            # Stream the flight's records straight into the parser,
+            # keeping a copy on disk only when asked to.
+            lines = utils.flight_lines(utils.read_lines(filename), carrier,
+                                       flight)
+            if args['keep_isolated']:
+                lines = utils.tee_lines(lines, args['keep_isolated'])
+            with instrumentation.stage('parse'):
+                record2s, record3s, record4s = parse_lines(lines, carrier)
+        else:
+            # Seek straight to the flight's records using the index.
+            with instrumentation.stage('isolate'):
+                record2s, record3s, record4s = (
+                    flight_index.read_flight_records(carrier, flight,
+                                                     filename))
         # create a record name to match records to
         carrier_name = carrier.upper() + "_r2"
         print("Records created for {!r}".format(carrier))
@@ -141,13 +580,184 @@ def main():
         # Create a dictionary for keeping track of flight objects
         print("Parsed files, creating flight objects")
         flights = {}
-        create_flights(carrier_record, record3s, flights)
-        update_flights(record3s, flights)
-        update_flights(record4s, flights)
+        with instrumentation.stage('build'):
+            create_flights(carrier_record, record3s, flights)
+            update_flights(record3s, flights)
+            update_flights(record4s, flights)
+        instrumentation.count('flights built', len(flights))
+
+        print("Flight objects created, here is your data.")
+        with instrumentation.stage('render'):
+            utils.pprint_flight(flights, args['format'])
 
+    if command == "batch":
+        keys = args['flights']
+        if args['input']:
+            with open(args['input']) as f:
+                keys.extend(line.strip() for line in f if line.strip())
+        if not keys:
+            sys.exit('No flights given to look up.')
+        flight_keys = [utils.parse_flight_key(key) for key in keys]
+
+        print("Reading records for {} flights from {!r}".format(
+                len(flight_keys), filename))
+        with instrumentation.stage('parse'):
+            carrier_records, record3s, record4s = parse_batch_records(
+                flight_keys, filename)
+        with instrumentation.stage('build'):
+            flights = build_batch_flights(carrier_records, record3s,
+                                          record4s)
+        instrumentation.count('flights built', len(flights))
+        for carrier, flight in flight_keys:
+            if carrier + flight not in flights:
+                print("Flight {}{} not found".format(carrier, flight))
 
         print("Flight objects created, here is your data.")
-        utils.pprint_flight(flights)
+        with instrumentation.stage('render'):
+            utils.pprint_flight(flights, args['format'])
+
+    if command == "search":
+        with instrumentation.stage('parse'):
+            legs = columnar.LegTable.from_file(filename, args['carrier'])
+        with instrumentation.stage('query'):
+            matches = legs.filter(departure_station=args['origin'],
+                                  arrival_station=args['destination'],
+                                  aircraft_type=args['aircraft'],
+                                  service_type=args['service'],
+                                  operating_on=args['date'])
+        print("{} of {} legs match".format(len(matches), len(legs)))
+        for row in matches.rows(columnar.SUMMARY_COLUMNS):
+            print(" ".join(row))
+
+    if command == "operating":
+        with instrumentation.stage('parse'):
+            legs = columnar.LegTable.from_file(filename, args['carrier'])
+        with instrumentation.stage('build'):
+            index = operating_dates.OperatingIndex(legs)
+        with instrumentation.stage('query'):
+            keys = index.flights_between(args['date'],
+                                         args['until'] or args['date'])
+        for carrier, flight in operating_dates.flight_keys(keys):
+            print("{}{}".format(carrier, flight))
+        if args['until']:
+            dates = "from {} to {}".format(args['date'], args['until'])
+        else:
+            dates = "on {}".format(args['date'])
+        print("{} flights operating {}".format(len(keys), dates))
+
+    if command == "connections":
+        stations = {}
+        for override in args['mct']:
+            station, _, minutes = override.partition('=')
+            if not minutes.isdigit():
+                sys.exit('MCT overrides look like DUS=40, not {!r}.'.format(
+                        override))
+            stations[station.upper()] = int(minutes)
+        mct = connections.MinimumConnectTimes(stations=stations)
+        with instrumentation.stage('parse'):
+            legs = columnar.LegTable.from_file(filename, args['carrier'])
+        with instrumentation.stage('build'):
+            routes = connections.RouteIndex(legs, mct=mct)
+        with instrumentation.stage('query'):
+            itineraries = routes.connections(
+                args['origin'], args['destination'], args['date'],
+                args['max_stops'], args['max_connection'], args['limit'])
+        for itinerary in itineraries:
+            elapsed = itinerary.arrival_utc - itinerary.departure_utc
+            print("{:d}h{:02d} {}".format(elapsed // 60, elapsed % 60,
+                                          routes.describe(itinerary)))
+        print("{} itineraries from {} to {} on {}".format(
+                len(itineraries), args['origin'].upper(),
+                args['destination'].upper(), args['date']))
+
+    if command == "load":
+        cache = None
+        if not args['no_cache']:
+            cache = snapshot.SnapshotCache(args['cache_dir'])
+        with instrumentation.stage('build'):
+            flights = snapshot.load_flights(filename, args['workers'],
+                                            args['carrier'], cache)
+        instrumentation.count('flights built', len(flights))
+        variations = sum(len(f.ivi) for f in flights.values())
+        legs = sum(len(v.legs) for f in flights.values()
+                   for v in f.ivi.values())
+        carriers = set(f.carrier_code for f in flights.values())
+        print("Loaded {} carriers, {} flights, {} variations, {} legs".format(
+                len(carriers), len(flights), variations, legs))
+
+    if command == "diff":
+        if not args['old'] or not (args['apply'] or
+                                   os.path.exists(args['old'])):
+            sys.exit('Previous SSIM file name provided not found.')
+        if args['apply']:
+            cache = snapshot.SnapshotCache(args['cache_dir'])
+            with instrumentation.stage('diff'):
+                flights, diff, key = schedule_diff.reload_flights(
+                    args['old'], filename, cache)
+            if diff is None:
+                print("No snapshot of {!r}, parsed {!r} in full".format(
+                        args['old'], filename))
+            print("Snapshot key: {}".format(key))
+        else:
+            try:
+                with instrumentation.stage('diff'):
+                    diff = schedule_diff.diff_schedules(args['old'], filename)
+            except schedule_diff.RepeatedLegError as e:
+                sys.exit('Cannot diff {!r}: {}'.format(filename, e))
+        if diff is not None:
+            for sign, flight_keys in (('+', diff.added_flights),
+                                      ('-', diff.removed_flights),
+                                      ('~', diff.changed_flights)):
+                for carrier, flight in sorted(flight_keys):
+                    print("{} {}{}".format(sign, carrier, flight))
+            for sign, leg_keys in (('+', diff.added_legs),
+                                   ('-', diff.removed_legs),
+                                   ('~', diff.changed_legs)):
+                for carrier, flight, ivi, leg in sorted(leg_keys):
+                    print("{} {}{} variation {} leg {}".format(
+                            sign, carrier, flight, ivi, leg))
+            print("{} added, {} removed, {} changed flights".format(
+                    len(diff.added_flights), len(diff.removed_flights),
+                    len(diff.changed_flights)))
+
+    if command == "stats":
+        with instrumentation.stage('parse'):
+            stats = schedule_stats.schedule_stats(filename, args['carrier'])
+        instrumentation.count('legs counted', stats.legs)
+        out = open(args['output'], 'w') if args['output'] else sys.stdout
+        try:
+            with instrumentation.stage('render'):
+                out.write("# {} legs, {} departures, block time p50 {} p90 "
+                          "{} minutes\n".format(
+                              stats.legs, stats.departures,
+                              stats.block_time_percentile(50),
+                              stats.block_time_percentile(90)))
+                for report in args['report']:
+                    out.write('\n')
+                    schedule_stats.write_report(stats, report, out,
+                                                args['station'])
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+    if command == "split":
+        if not os.path.isdir(args['output_dir']):
+            os.makedirs(args['output_dir'])
+        with instrumentation.stage('split'):
+            outputs = ssim_split.split_ssim(
+                filename, args['output_dir'], args['template'],
+                args['carrier'], args['max_open'], args['gzip'],
+                args['workers'])
+        for carrier, (output, records) in outputs.items():
+            print("{:<3} {:>8} records  {}".format(carrier, records, output))
+        print("Split {!r} into {} carrier files".format(filename,
+                                                      len(outputs)))
+
+    if command == "export":
+        flights = iter_flights(utils.read_lines(filename), args['carrier'])
+        # Flights are parsed and built as they are rendered.
+        with instrumentation.stage('render'):
+            render.write_flights(flights, args['format'], args['output'])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,188 @@
+"""Split a multi-carrier SSIM file into one file per carrier in one pass.
+
+Each output is a complete SSIM file: the input's record 1, the carrier's
+record 2, 3 and 4 records and a new record 5, with the record serial
+numbers renumbered from 1.  Lines are buffered per carrier and written
+through a small pool of open files, so a file with hundreds of carriers
+never holds more than max_open handles.
+"""
+import collections
+import gzip
+import logging
+import multiprocessing
+import os
+import shutil
+
+import utils
+
+
+DEFAULT_TEMPLATE = '{carrier}_only.ssim.dat'
+DEFAULT_MAX_OPEN = 64
+# Bytes buffered for a carrier before they are written out.
+FLUSH_SIZE = 256 * 1024
+# Record serial numbers are six digits and wrap around.
+SERIAL_MODULUS = 1000000
+
+
+def renumber(line, serial, newline):
+    """Put a new record serial number in columns 195-200 of a record."""
+    return '{}{:06d}{}'.format(line[:194].ljust(194),
+                               serial % SERIAL_MODULUS, newline)
+
+
+def trailer_record(carrier, serial, newline):
+    """Build the record 5 closing a carrier's records.
+
+    Args:
+      carrier: str.  IATA carrier code.
+      serial: int.  Serial number of the trailer; the record before it,
+        the serial number check reference, is serial - 1.
+      newline: str.  The line ending to use.
+    """
+    line = utils.make_record('5', (('carrier_code', 2, 5),),
+                             {'carrier_code': carrier})
+    line = line[:187] + '{:06d}E'.format((serial - 1) % SERIAL_MODULUS)
+    return renumber(line, serial, newline)
+
+
+class WriterPool(object):
+    """Buffered writers for many files sharing a capped set of handles.
+
+    The least recently used handle is closed when a new one is needed;
+    a file is reopened for appending when more data arrives for it.
+
+    Args:
+      max_open: int.  Most files held open at once.
+      flush_size: int.  Bytes buffered per file before writing.
+    """
+
+    def __init__(self, max_open=DEFAULT_MAX_OPEN, flush_size=FLUSH_SIZE):
+        self.max_open = max(max_open, 1)
+        self.flush_size = flush_size
+        self.handles = collections.OrderedDict()
+        self.buffers = collections.defaultdict(list)
+        self.buffered = collections.Counter()
+        self.started = set()
+        self.opens = 0
+
+    def write(self, filename, data):
+        self.buffers[filename].append(data)
+        self.buffered[filename] += len(data)
+        if self.buffered[filename] >= self.flush_size:
+            self.flush(filename)
+
+    def flush(self, filename):
+        """Write out whatever is buffered for filename."""
+        if not self.buffers.get(filename):
+            return
+        self._handle(filename).write(''.join(self.buffers.pop(filename)))
+        del self.buffered[filename]
+
+    def _handle(self, filename):
+        handle = self.handles.pop(filename, None)
+        if handle is None:
+            while len(self.handles) >= self.max_open:
+                self.handles.popitem(last=False)[1].close()
+            mode = 'ab' if filename in self.started else 'wb'
+            handle = open(filename, mode)
+            self.started.add(filename)
+            self.opens += 1
+        # Most recently used last.
+        self.handles[filename] = handle
+        return handle
+
+    def close(self):
+        for filename in list(self.buffers):
+            self.flush(filename)
+        while self.handles:
+            self.handles.popitem()[1].close()
+
+
+def compress_file(filename):
+    """Gzip filename to filename.gz, remove the original and return the
+    new name."""
+    compressed = filename + '.gz'
+    with open(filename, 'rb') as f_in:
+        f_out = gzip.GzipFile(compressed, 'wb', mtime=0)
+        try:
+            shutil.copyfileobj(f_in, f_out, utils.READ_BUFFER_SIZE)
+        finally:
+            f_out.close()
+    os.remove(filename)
+    return compressed
+
+
+def split_ssim(filename, directory='.', template=DEFAULT_TEMPLATE,
+               carriers=None, max_open=DEFAULT_MAX_OPEN, compress=False,
+               workers=None):
+    """Write every carrier of an SSIM file to its own file, reading once.
+
+    Args:
+      filename: str.  Plain or compressed SSIM file to split.
+      directory: str.  Where to write the outputs.
+      template: str.  Output file name, formatted with carrier=<code>.
+      carriers: iterable of str.  Only write these carriers when given.
+      max_open: int.  Most output files held open at once.
+      compress: bool.  Gzip the outputs once they are complete.
+      workers: int.  Processes compressing outputs, defaults to CPU count.
+    Returns:
+      An OrderedDict mapping carrier code to (output file name, number of
+      records written), in the order carriers appear in the input.
+    """
+    if carriers is not None:
+        carriers = set(carrier.upper() for carrier in carriers)
+    pool = WriterPool(max_open)
+    header = None
+    newline = '\n'
+    outputs = collections.OrderedDict()
+    serials = {}
+    try:
+        for line in utils.read_lines(filename):
+            record_type = line[:1]
+            if record_type == '1':
+                if header is None:
+                    header = line
+                    newline = line[len(line.rstrip('\r\n')):] or newline
+                continue
+            if not record_type or record_type not in '234':
+                # Record 5s are rebuilt and record 0 padding is dropped.
+                continue
+            carrier = line[2:5].strip()
+            if carriers is not None and carrier not in carriers:
+                continue
+            if carrier not in outputs:
+                outputs[carrier] = os.path.join(
+                    directory, template.format(carrier=carrier))
+                serials[carrier] = 0
+                if header is not None:
+                    serials[carrier] = 1
+                    pool.write(outputs[carrier],
+                               renumber(header, 1, newline))
+            serials[carrier] += 1
+            pool.write(outputs[carrier],
+                       renumber(line.rstrip('\r\n'), serials[carrier],
+                                newline))
+        for carrier, output in outputs.items():
+            serials[carrier] += 1
+            pool.write(output, trailer_record(carrier, serials[carrier],
+                                              newline))
+    finally:
+        pool.close()
+    logging.debug('Split {!r} into {} files with {} opens'.format(
+            filename, len(outputs), pool.opens))
+
+    if compress and outputs:
+        workers = min(workers or multiprocessing.cpu_count(), len(outputs))
+        if workers > 1:
+            processes = multiprocessing.Pool(workers)
+            try:
+                names = processes.map(compress_file, outputs.values())
+            finally:
+                processes.close()
+                processes.join()
+        else:
+            names = [compress_file(output) for output in outputs.values()]
+        outputs = collections.OrderedDict(zip(outputs, names))
+    return collections.OrderedDict(
+        (carrier, (outputs[carrier], serials[carrier]))
+        for carrier in outputs)
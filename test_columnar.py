@@ -0,0 +1,93 @@
+import datetime
+import unittest
+
+import columnar
+import schedule_stats
+import utils
+from ssim_generator import SsimGenerator
+
+
+@unittest.skipIf(columnar.np is None, 'NumPy is not installed')
+class LegTableTests(unittest.TestCase):
+    def setUp(self):
+        self.legs = columnar.LegTable.from_file(
+            './sample_data/hr.ssim.dat.gz')
+
+    def testLoad(self):
+        self.assertEqual(len(self.legs), 18)
+        self.assertEqual(list(self.legs.column('departure_station')[:2]),
+                         ['DUS', 'DUS'])
+        self.assertEqual(self.legs.records['flight'][0], ' 330')
+
+    def testCarrierFilter(self):
+        legs = columnar.LegTable.from_file('./sample_data/hr.ssim.dat.gz',
+                                           carrier='XX')
+        self.assertEqual(len(legs), 0)
+        self.assertEqual(len(self.legs.filter(carrier='hr')), 18)
+
+    def testSsimDates(self):
+        dates = columnar.ssim_dates(
+            columnar.np.array(['02JAN15', '29FEB16', '00XXX00'], 'S7'))
+        self.assertEqual(str(dates[0]), '2015-01-02')
+        self.assertEqual(str(dates[1]), '2016-02-29')
+        self.assertTrue(columnar.np.isnat(dates[2]))
+
+    def testStationAndEquipment(self):
+        self.assertEqual(len(self.legs.filter(departure_station='DUS')), 9)
+        self.assertEqual(len(self.legs.filter(arrival_station=['DUS', 'LUX'],
+                                              aircraft_type='CNJ')), 18)
+        self.assertEqual(len(self.legs.filter(aircraft_type='320')), 0)
+
+    def testOperatingOn(self):
+        legs = self.legs.filter(operating_on=datetime.date(2015, 1, 2))
+        self.assertEqual(list(legs.column('flight')), ['330', '331'])
+        self.assertEqual(len(self.legs.filter(operating_on='03JAN15')), 0)
+
+    def testDaysAndPeriod(self):
+        self.assertEqual(len(self.legs.filter(days=[5])), 10)
+        self.assertEqual(
+            len(self.legs.filter(period=('2015-05-01', '2015-05-31'))), 6)
+
+    def testUtcTimes(self):
+        first = self.legs.records[0]
+        self.assertEqual((first['passenger_std'], first['passenger_sta'],
+                          first['departure_utc_variation'],
+                          first['arrival_utc_variation']),
+                         ('0835', '0920', '+0100', '+0100'))
+        self.assertEqual(self.legs.departure_utc[0], 455)
+        self.assertEqual(self.legs.arrival_utc[0], 500)
+        self.assertEqual(list(self.legs.column('block_minutes')[:2]),
+                         [45, 45])
+        self.assertFalse(self.legs.overnight.any())
+        utc = columnar.LegTable(self.legs.records, {'HR': 'U'})
+        self.assertEqual(utc.departure_utc[0], 515)
+        self.assertEqual(len(utc.filter(carrier='HR').time_modes), 1)
+
+    def testBlockTimesMatchScheduleStats(self):
+        lines = [line[:columnar.RECORD_LENGTH] for line
+                 in SsimGenerator(carriers=2, flights=10, legs=3,
+                                  seed=4).lines() if line[:1] == '3']
+        # Blank or broken times, UTC variations and an arrival before
+        # the departure.
+        lines[:4] = [lines[0][:39] + '    ' + lines[0][43:],
+                     lines[1][:61] + '09X0' + lines[1][65:],
+                     lines[2][:47] + '     ' + lines[2][52:],
+                     lines[3][:39] + '2300' + lines[3][43:61] + '0100' +
+                     lines[3][65:192] + '00' + lines[3][194:]]
+        legs = columnar.LegTable(columnar.np.frombuffer(
+            ''.join(lines), columnar.record_three_dtype()))
+        expected = [schedule_stats.ScheduleStats.block_time(line)
+                    for line in lines]
+        self.assertEqual(expected[:4], [None] * 4)
+        self.assertEqual(list(legs.times_valid),
+                         [block is not None for block in expected])
+        self.assertEqual(list(legs.block_minutes),
+                         [-1 if block is None else block
+                          for block in expected])
+        days = schedule_stats.date_variation_days
+        self.assertEqual(list(legs.overnight),
+                         [days(line[192]) < days(line[193])
+                          for line in lines])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+import compact
+import parallel
+import utils
+from flight_classes import Flight, RecordFour, RecordThree
+from ssim_generator import SsimGenerator
+
+
+def check_fields(test, view, record):
+    for name, start, end in record.LAYOUT:
+        test.assertEqual(getattr(view, name), getattr(record, name), name)
+
+
+class CompactScheduleTests(unittest.TestCase):
+    ssim = './sample_data/hr.ssim.dat.gz'
+
+    def assertRoundTrip(self, lines):
+        schedule = compact.CompactSchedule.from_lines(lines)
+        legs = [RecordThree(line) for line in lines if line[:1] == '3']
+        deis = [RecordFour(line) for line in lines if line[:1] == '4']
+        self.assertEqual(len(schedule), len(legs))
+        views = []
+        for row, record in enumerate(legs):
+            check_fields(self, schedule.leg(row), record)
+            views.extend(schedule.leg(row).deis())
+        self.assertEqual(len(views), len(deis))
+        for view, record in zip(views, deis):
+            check_fields(self, view, record)
+            self.assertEqual(view.segment, record.segment)
+            self.assertEqual(view.name, record.name)
+        return schedule
+
+    def testSampleRoundTrip(self):
+        lines = list(utils.read_lines(self.ssim))
+        schedule = self.assertRoundTrip(lines)
+        self.assertEqual(schedule.orphans, 0)
+        self.assertEqual(schedule.legs.other, {})
+        self.assertLess(schedule.nbytes(), sum(map(len, lines)) / 2)
+
+    def testSyntheticRoundTrip(self):
+        generator = SsimGenerator(carriers=3, flights=10, legs=3, deis=3)
+        self.assertRoundTrip(list(generator.lines()))
+
+    def testValuesKeptOnTheSide(self):
+        line = list(utils.read_lines(self.ssim))[2]
+        odd = (line[:21] + '00XXX00' + '1 3 5 7' + line[35:39] + '2561' +
+               line[43:47] + '+0099' + line[52:])
+        schedule = self.assertRoundTrip([odd, line])
+        self.assertEqual(schedule.leg(0).period_of_operation_end, '00XXX00')
+        self.assertEqual(schedule.leg(0).days_of_operation, '1 3 5 7')
+        self.assertEqual(sorted(name for name, row in schedule.legs.other),
+                         ['departure_utc_variation', 'passenger_std',
+                          'period_of_operation_end'])
+
+    def testFlightsAndCarriers(self):
+        schedule = compact.CompactSchedule.from_file(self.ssim, 'hr')
+        self.assertEqual(sorted(schedule.flights), ['HR330', 'HR331'])
+        legs = schedule.flight_legs('HR330')
+        self.assertEqual(len(legs), 9)
+        self.assertIs(legs[0].carrier, legs[-1].carrier)
+        self.assertEqual(legs[0].carrier.time_mode, 'L')
+        self.assertEqual(legs[0].dei('DUS', 'LUX', 10), ['LG 1330'])
+        self.assertEqual(schedule.flight_legs('HR999'), [])
+        self.assertEqual(len(compact.CompactSchedule.from_file(self.ssim,
+                                                               'XX')), 0)
+
+
+class SharedCarrierTests(unittest.TestCase):
+    def testFlightsShareRecordTwo(self):
+        flights = parallel.parse_flights('./sample_data/hr.ssim.dat.gz', 1)
+        self.assertIs(flights['HR330'].carrier, flights['HR331'].carrier)
+        self.assertEqual(flights['HR330'].valid_end, '31DEC16')
+        self.assertEqual(flights['HR330'].release_date, '')
+        with self.assertRaises(AttributeError):
+            Flight('XX', '1', None).time_mode
+
+
+if __name__ == '__main__':
+    unittest.main()
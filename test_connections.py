@@ -0,0 +1,166 @@
+import datetime
+import unittest
+
+import columnar
+import connections
+from flight_classes import RecordThree
+from utils import make_record
+
+
+def make_legs(*legs):
+    """Build a daily LegTable from (flight, departure station, std, UTC
+    variation, arrival station, sta, UTC variation, status, date variation)
+    tuples.  A status of 'DI' is domestic at departure and international
+    at arrival; a single letter applies to both stations."""
+    lines = []
+    for (flight, origin, std, origin_utc, destination, sta, destination_utc,
+         status, variation) in legs:
+        lines.append(make_record('3', RecordThree.LAYOUT, {
+            'carrier_code': 'XX',
+            'flight': flight.rjust(4),
+            'ivi': '01',
+            'leg_sequence': '01',
+            'period_of_operation_start': '05JAN15',
+            'period_of_operation_end': '11JAN15',
+            'days_of_operation': '1234567',
+            'departure_station': origin,
+            'passenger_std': std,
+            'departure_utc_variation': origin_utc,
+            'arrival_station': destination,
+            'passenger_sta': sta,
+            'arrival_utc_variation': destination_utc,
+            'mct': status[0],
+            'arrival_mct': status[-1],
+            'date_variation': variation,
+            }))
+    return columnar.LegTable(columnar.np.frombuffer(
+        ''.join(lines), columnar.record_three_dtype()))
+
+
+def flights(routes, itineraries):
+    return [[routes.legs.records['flight'][position].strip()
+             for position, day in itinerary.legs]
+            for itinerary in itineraries]
+
+
+@unittest.skipIf(columnar.np is None, 'NumPy is not installed')
+class RouteIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.legs = make_legs(
+            ('1', 'AAA', '0800', '+0000', 'BBB', '0900', '+0000', 'D', '00'),
+            ('2', 'BBB', '0940', '+0000', 'CCC', '1040', '+0000', 'D', '00'),
+            ('3', 'BBB', '1000', '+0000', 'CCC', '1100', '+0000', 'D', '00'),
+            ('4', 'AAA', '1200', '+0000', 'CCC', '1500', '+0000', 'D', '00'),
+            ('5', 'CCC', '1200', '+0000', 'DDD', '1300', '+0000', 'D', '00'),
+            ('6', 'BBB', '1000', '+0000', 'AAA', '1100', '+0000', 'D', '00'))
+        self.routes = connections.RouteIndex(self.legs)
+
+    def testRouteIndex(self):
+        self.assertEqual(list(self.routes.route_legs('bbb', 'CCC')), [1, 2])
+        self.assertEqual(len(self.routes.route_legs('CCC', 'AAA')), 0)
+        self.assertEqual(len(self.routes.route_legs('ZZZ', 'AAA')), 0)
+        self.assertEqual(self.routes.destinations('BBB'), ['AAA', 'CCC'])
+
+    def testMinimumConnectingTime(self):
+        itineraries = self.routes.connections('AAA', 'CCC', '2015-01-06')
+        self.assertEqual(flights(self.routes, itineraries),
+                         [['1', '3'], ['4']])
+        self.assertEqual(itineraries[0].legs[0],
+                         (0, datetime.date(2015, 1, 6)))
+        self.assertEqual(itineraries[0].arrival_utc -
+                         itineraries[0].departure_utc, 180)
+        faster = connections.RouteIndex(
+            self.legs, mct=connections.MinimumConnectTimes(
+                stations={'BBB': 30}))
+        self.assertEqual(
+            flights(faster, faster.connections('AAA', 'CCC', '2015-01-06')),
+            [['1', '2'], ['4']])
+
+    def testStops(self):
+        self.assertEqual(
+            flights(self.routes, self.routes.connections('AAA', 'DDD',
+                                                         '2015-01-06')),
+            [['1', '3', '5']])
+        self.assertEqual(self.routes.connections('AAA', 'DDD', '2015-01-06',
+                                                 max_stops=1), [])
+        self.assertEqual(
+            flights(self.routes, self.routes.connections(
+                'AAA', 'CCC', '2015-01-06', max_stops=0)), [['4']])
+        self.assertEqual(
+            len(self.routes.connections('AAA', 'CCC', '2015-01-06',
+                                        limit=1)), 1)
+        self.assertEqual(self.routes.connections('AAA', 'CCC', '2016-01-06'),
+                         [])
+
+    def testUtcOffsets(self):
+        # BBB is an hour ahead: flight 1 lands at 0900 UTC, flight 2 leaves
+        # at 0840 UTC and flight 3 at 1000 UTC.
+        legs = make_legs(
+            ('1', 'AAA', '0800', '+0000', 'BBB', '1000', '+0100', 'D', '00'),
+            ('2', 'BBB', '0940', '+0100', 'CCC', '1040', '+0100', 'D', '00'),
+            ('3', 'BBB', '1100', '+0100', 'CCC', '1200', '+0100', 'I', '00'))
+        routes = connections.RouteIndex(legs)
+        itineraries = routes.connections('AAA', 'CCC', '2015-01-06')
+        self.assertEqual(flights(routes, itineraries), [['1', '3']])
+        # A domestic to international connection needs an hour.
+        routes = connections.RouteIndex(
+            legs, mct=connections.MinimumConnectTimes({('D', 'I'): 61}))
+        self.assertEqual(routes.connections('AAA', 'CCC', '2015-01-06'), [])
+
+    def testArrivalStatus(self):
+        # Flight 1 leaves AAA international but arrives at BBB domestic, so
+        # connecting to the international flight 2 is domestic to
+        # international.
+        legs = make_legs(
+            ('1', 'AAA', '0800', '+0000', 'BBB', '0900', '+0000', 'ID', '00'),
+            ('2', 'BBB', '0940', '+0000', 'CCC', '1040', '+0000', 'I', '00'))
+        routes = connections.RouteIndex(
+            legs, mct=connections.MinimumConnectTimes(
+                {('D', 'I'): 30, ('I', 'I'): 120}))
+        self.assertEqual(
+            flights(routes, routes.connections('AAA', 'CCC', '2015-01-06')),
+            [['1', '2']])
+        routes = connections.RouteIndex(
+            legs, mct=connections.MinimumConnectTimes({('D', 'I'): 45}))
+        self.assertEqual(routes.connections('AAA', 'CCC', '2015-01-06'), [])
+
+    def testLaterArrivalOnSameFlightKept(self):
+        # Flight 2 reaches CCC first, but only flight 3 continues to DDD
+        # without needing the minimum connecting time.
+        legs = make_legs(
+            ('1', 'AAA', '0800', '+0000', 'BBB', '0900', '+0000', 'D', '00'),
+            ('2', 'BBB', '0945', '+0000', 'CCC', '1000', '+0000', 'D', '00'),
+            ('3', 'BBB', '0946', '+0000', 'CCC', '1005', '+0000', 'D', '00'),
+            ('3', 'CCC', '1030', '+0000', 'DDD', '1130', '+0000', 'D', '00'))
+        routes = connections.RouteIndex(legs)
+        self.assertEqual(
+            flights(routes, routes.connections('AAA', 'DDD', '2015-01-06')),
+            [['1', '3', '3']])
+
+    def testLegsWithoutTimes(self):
+        legs = make_legs(
+            ('1', 'AAA', '0800', '+0000', 'BBB', '0900', '+0000', 'D', '00'),
+            ('2', 'BBB', '    ', '+0000', 'CCC', '1040', '+0000', 'D', '00'),
+            ('3', 'BBB', '1000', '+0000', 'CCC', '1100', '+0000', 'D', '00'),
+            ('4', 'AAA', '1200', '     ', 'CCC', '1500', '+0000', 'D', '00'))
+        routes = connections.RouteIndex(legs)
+        self.assertEqual(
+            flights(routes, routes.connections('AAA', 'CCC', '2015-01-06')),
+            [['1', '3']])
+
+    def testOvernight(self):
+        # Flight 1 lands the next day, in time for the morning flight 2.
+        legs = make_legs(
+            ('1', 'AAA', '2200', '+0000', 'BBB', '0100', '+0000', 'D', '01'),
+            ('2', 'BBB', '0730', '+0000', 'CCC', '0830', '+0000', 'D', '00'))
+        routes = connections.RouteIndex(legs)
+        itineraries = routes.connections('AAA', 'CCC', '2015-01-06',
+                                         max_connection=8 * 60)
+        self.assertEqual([day for position, day in itineraries[0].legs],
+                         [datetime.date(2015, 1, 6),
+                          datetime.date(2015, 1, 7)])
+        self.assertEqual(routes.connections('AAA', 'CCC', '2015-01-06'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
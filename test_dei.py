@@ -0,0 +1,91 @@
+import unittest
+
+import compact
+import dei
+import ingest
+import parallel
+import utils
+from flight_classes import RecordFour
+from ssim_generator import SsimGenerator
+
+
+SAMPLE = './sample_data/hr.ssim.dat.gz'
+
+
+class DecodeTests(unittest.TestCase):
+    def setUp(self):
+        dei.clear_cache()
+
+    def testDecoders(self):
+        self.assertEqual(dei.decode(10, 'LG 1330/U21234A  '),
+                         (dei.FlightDesignator('LG', 1330, ''),
+                          dei.FlightDesignator('U2', 1234, 'A')))
+        self.assertEqual(dei.decode(10, 'LG 0017')[0].name, 'LG17')
+        self.assertEqual(dei.decode(50, 'ABC 12'),
+                         (dei.FlightDesignator('ABC', 12, ''),))
+        self.assertEqual(dei.decode(127, ' OPERATED BY  XX EXPRESS '),
+                         'OPERATED BY XX EXPRESS')
+        self.assertIs(dei.decode(505, 'ET'), True)
+        self.assertIs(dei.decode(505, 'EN'), False)
+
+    def testUndecodedDataKeptAsText(self):
+        self.assertEqual(dei.decode(10, 'NOT A FLIGHT '), 'NOT A FLIGHT')
+        self.assertEqual(dei.decode(505, 'XX'), 'XX')
+        self.assertEqual(dei.decode(999, ' Y '), 'Y')
+
+    def testMemoized(self):
+        first = dei.decode(10, 'LG 1330')
+        self.assertIs(dei.decode(10, 'LG 1330'), first)
+        self.assertEqual(dei.cache_info(), (1, 1, 1))
+
+    def testRecordsAndViews(self):
+        lines = list(utils.read_lines(SAMPLE))
+        record = RecordFour([line for line in lines if line[:1] == '4'][0])
+        self.assertEqual(record.decoded,
+                         (dei.FlightDesignator('LG', 1330, ''),))
+        flights = parallel.parse_flights(SAMPLE, 1)
+        variation = flights['HR330'].ivi.values()[0]
+        self.assertEqual(variation.decoded_dei('DUS', 'LUX', 505), [True])
+        schedule = compact.CompactSchedule.from_lines(lines)
+        self.assertEqual(schedule.leg(0).deis()[0].decoded, record.decoded)
+
+
+class MarketingIndexTests(unittest.TestCase):
+    def testSample(self):
+        flights, reports = ingest.ingest([SAMPLE], workers=1)
+        index = dei.MarketingIndex.from_flights(flights)
+        self.assertEqual(index.marketing_carriers(), ['LG'])
+        self.assertEqual(len(index), 18)
+        self.assertEqual(index.flights_marketed_by('lg'), ['HR330', 'HR331'])
+        self.assertEqual(set(leg.marketing.name for leg
+                             in index.marketed_by('LG')),
+                         set(['LG1330', 'LG1331']))
+        self.assertEqual(index.marketed_by('XX'), [])
+
+    def testMatchesRecordFours(self):
+        generator = SsimGenerator(carriers=3, flights=10, legs=2, deis=4,
+                                  seed=3)
+        lines = list(generator.lines())
+        expected = set()
+        for line in lines:
+            if line[:1] == '4' and line[30:33] == '010':
+                record = RecordFour(line)
+                for designator in record.decoded:
+                    expected.add((designator.carrier,
+                                  record.carrier_code + record.flight))
+        carriers, flights = parallel.build_flights(lines)
+        index = dei.MarketingIndex.from_flights(flights)
+        self.assertTrue(expected)
+        self.assertEqual(set((carrier, leg.flight)
+                             for carrier in index.marketing_carriers()
+                             for leg in index.marketed_by(carrier)), expected)
+
+    def testBuiltDuringIngest(self):
+        ingester = ingest.Ingester(workers=1)
+        ingester.ingest([SAMPLE])
+        self.assertEqual(ingester.marketing.flights_marketed_by('LG'),
+                         ['HR330', 'HR331'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import flight_index
+from ssim_pprint import parse_records
+
+
+class FlightIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.ssim = os.path.join(self.tmpdir, 'hr.ssim.dat')
+        f_in = gzip.open('./sample_data/hr.ssim.dat.gz', 'rb')
+        with open(self.ssim, 'wb') as f_out:
+            f_out.writelines(f_in)
+        f_in.close()
+
+    def testIndexKeys(self):
+        index = flight_index.build_index(self.ssim)
+        self.assertEqual(index['carriers'], {'HR': 202})
+        self.assertEqual(sorted(index['flights']),
+                         [('HR', '330'), ('HR', '331')])
+        self.assertEqual(len(index['flights'][('HR', '330')]), 9)
+        self.assertEqual(len(index['flights'][('HR', '330')]['01']), 3)
+
+    def testReadMatchesFullParse(self):
+        expected = parse_records('HR', self.ssim)
+        r2s, r3s, r4s = flight_index.read_flight_records('HR', '330',
+                                                         self.ssim)
+        self.assertEqual([r.original_record for r in r2s],
+                         [r.original_record for r in expected[0]])
+        self.assertEqual([r.original_record for r in r3s],
+                         [r.original_record for r in expected[1]
+                          if r.flight == '330'])
+        self.assertEqual([r.original_record for r in r4s],
+                         [r.original_record for r in expected[2]
+                          if r.flight == '330'])
+
+    def testIndexSavedNextToFile(self):
+        flight_index.load_index(self.ssim)
+        self.assertTrue(os.path.exists(self.ssim + '.idx'))
+
+    def testStaleIndexRebuilt(self):
+        flight_index.load_index(self.ssim)
+        with open(self.ssim, 'ab') as f:
+            f.write('\r\n3 HR  9990101J' + ' ' * 186)
+        index = flight_index.load_index(self.ssim)
+        self.assertIn(('HR', '999'), index['flights'])
+
+    def testEditKeepingSizeAndMtime(self):
+        # Pad the file so the edit is far from both ends.
+        with open(self.ssim, 'rb') as f:
+            lines = f.readlines()
+        filler = ['3 HR  7770101J' + ' ' * 186 + '\r\n'] * 1000
+        with open(self.ssim, 'wb') as f:
+            f.writelines(lines[:-1] + filler + lines[2:-1] + filler +
+                         lines[-1:])
+        # A whole second survives os.utime exactly.
+        os.utime(self.ssim, (1420070400, 1420070400))
+        flight_index.load_index(self.ssim)
+        with open(self.ssim, 'rb') as f:
+            data = f.read()
+        middle = data.index('3 HR  331', len(data) // 3)
+        with open(self.ssim, 'wb') as f:
+            f.write(data[:middle] + '3 HR  339' + data[middle + 9:])
+        os.utime(self.ssim, (1420070400, 1420070400))
+        index = flight_index.load_index(self.ssim)
+        self.assertIn(('HR', '339'), index['flights'])
+
+    def countHashes(self, call):
+        hashed = []
+        original = flight_index.utils.hash_file
+
+        def hash_file(filename, digest):
+            hashed.append(filename)
+            return original(filename, digest)
+        flight_index.utils.hash_file = hash_file
+        try:
+            call()
+        finally:
+            flight_index.utils.hash_file = original
+        return len(hashed)
+
+    def testUnchangedFileNotHashed(self):
+        flight_index.load_index(self.ssim)
+        lookup = lambda: flight_index.read_flight_records('HR', '330',
+                                                          self.ssim)
+        self.assertEqual(self.countHashes(lookup), 0)
+
+    def testTouchedFileKeepsIndex(self):
+        flight_index.load_index(self.ssim)
+        os.utime(self.ssim, (1420070400, 1420070400))
+        built = []
+        original = flight_index.build_index
+        flight_index.build_index = lambda name: built.append(name)
+        try:
+            # Hashed once to find the content unchanged, then not again.
+            self.assertEqual(self.countHashes(
+                    lambda: flight_index.load_index(self.ssim)), 1)
+            self.assertEqual(self.countHashes(
+                    lambda: flight_index.load_index(self.ssim)), 0)
+        finally:
+            flight_index.build_index = original
+        self.assertEqual(built, [])
+
+    def testMissingFlight(self):
+        r2s, r3s, r4s = flight_index.read_flight_records('HR', '1',
+                                                         self.ssim)
+        self.assertEqual(len(r2s), 1)
+        self.assertEqual(r3s, [])
+        self.assertEqual(r4s, [])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+if __name__ == "__main__":
+    unittest.main()
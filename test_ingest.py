@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import ingest
+import parallel
+from ssim_generator import generate_ssim
+
+
+def summary(flights):
+    return dict((name, sorted((ivi, sorted(variation.legs))
+                              for ivi, variation in flight.ivi.items()))
+                for name, flight in flights.items())
+
+
+class IngestTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filenames = []
+        for seed in range(3):
+            filename = os.path.join(self.tmpdir,
+                                    'feed{}.ssim.dat.gz'.format(seed))
+            generate_ssim(filename, compress=seed > 0, carriers=1,
+                          flights=20, variations=2, legs=2, deis=1,
+                          seed=seed)
+            self.filenames.append(filename)
+        self.expected = {}
+        for filename in self.filenames:
+            self.expected.update(parallel.parse_flights(filename, 1))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testExpandPaths(self):
+        self.assertEqual(ingest.expand_paths([self.tmpdir]), self.filenames)
+        pattern = os.path.join(self.tmpdir, 'feed[12]*')
+        self.assertEqual(ingest.expand_paths([pattern, self.filenames[1]]),
+                         self.filenames[1:])
+        self.assertEqual(ingest.expand_paths(['/no/such/file']), [])
+
+    def testMatchesParsingEachFile(self):
+        progress = []
+        for workers in (1, 2):
+            flights, reports = ingest.ingest(
+                [self.tmpdir], threads=2, workers=workers,
+                progress=lambda report, done, total: progress.append(
+                    (done, total)))
+            self.assertEqual(summary(flights), summary(self.expected))
+            self.assertEqual([report.filename for report in reports],
+                             self.filenames)
+            self.assertTrue(all(report.lines and report.bytes and
+                                report.error is None for report in reports))
+        self.assertEqual(progress, [(1, 3), (2, 3), (3, 3)] * 2)
+
+    def testBadFileReported(self):
+        broken = os.path.join(self.tmpdir, 'feed9.ssim.dat.gz')
+        with open(self.filenames[1], 'rb') as f:
+            data = f.read()
+        with open(broken, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        flights, reports = ingest.ingest([self.tmpdir], workers=1)
+        self.assertEqual(summary(flights), summary(self.expected))
+        self.assertEqual([report.filename for report in reports
+                          if report.error], [broken])
+
+    def testHeaderTruncatedGzipReported(self):
+        broken = os.path.join(self.tmpdir, 'feed9.ssim.dat.gz')
+        with open(self.filenames[1], 'rb') as f:
+            data = f.read()
+        with open(broken, 'wb') as f:
+            f.write(data[:6])
+        for workers in (1, 2):
+            flights, reports = ingest.ingest([self.tmpdir], workers=workers)
+            self.assertEqual(summary(flights), summary(self.expected))
+            self.assertEqual([report.filename for report in reports
+                              if report.error], [broken])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import instrumentation
+import utils
+from ssim_pprint import configure_logging
+
+
+SAMPLE_SSIM = './sample_data/hr.ssim.dat.gz'
+
+
+class InstrumentationTests(unittest.TestCase):
+    def tearDown(self):
+        instrumentation.reset()
+
+    def testDisabledCollectsNothing(self):
+        with instrumentation.stage('parse'):
+            lines = list(utils.read_lines(SAMPLE_SSIM))
+        instrumentation.count('flights built', 2)
+        self.assertEqual(len(lines), 57)
+        self.assertFalse(instrumentation.counters)
+        self.assertFalse(instrumentation.timings)
+
+    def testCountsLinesAndRecords(self):
+        instrumentation.enable()
+        with instrumentation.stage('parse'):
+            lines = list(utils.read_lines(SAMPLE_SSIM))
+        counters = instrumentation.counters
+        self.assertEqual(counters['lines read'], 57)
+        self.assertEqual(counters['type 3 records'], 18)
+        self.assertEqual(counters['type 4 records'], 36)
+        self.assertEqual(counters['bytes decompressed'],
+                         sum(len(line) for line in lines))
+        self.assertEqual(list(instrumentation.timings),
+                         ['decompress', 'parse'])
+
+    def testStagesAddUp(self):
+        instrumentation.enable()
+        for _ in range(2):
+            with instrumentation.stage('render'):
+                pass
+        self.assertEqual(list(instrumentation.timings), ['render'])
+        self.assertGreaterEqual(instrumentation.timings['render'], 0.0)
+
+
+class ConfigureLoggingTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        root = logging.getLogger()
+        self.handlers = root.handlers[:]
+        self.level = root.level
+
+    def tearDown(self):
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+            handler.close()
+        for handler in self.handlers:
+            root.addHandler(handler)
+        root.setLevel(self.level)
+        shutil.rmtree(self.tmpdir)
+
+    def testLevelAndFile(self):
+        log_file = os.path.join(self.tmpdir, 'run.log')
+        configure_logging('INFO', log_file)
+        logging.debug('not recorded')
+        logging.info('recorded')
+        logging.getLogger().handlers[0].flush()
+        with open(log_file) as f:
+            text = f.read()
+        self.assertIn('recorded', text)
+        self.assertNotIn('not recorded', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import datetime
+import unittest
+
+import columnar
+import operating_dates
+from flight_classes import RecordThree
+from utils import make_record
+
+
+def make_legs(*legs):
+    """Build a LegTable from (flight, start, end, days, frequency,
+    date variation) tuples."""
+    lines = [make_record('3', RecordThree.LAYOUT, {
+        'carrier_code': 'XX',
+        'flight': flight.rjust(4),
+        'ivi': '01',
+        'leg_sequence': '01',
+        'period_of_operation_start': start,
+        'period_of_operation_end': end,
+        'days_of_operation': days,
+        'frequency_rate': frequency,
+        'departure_station': 'AAA',
+        'arrival_station': 'BBB',
+        'date_variation': variation,
+        }) for flight, start, end, days, frequency, variation in legs]
+    return columnar.LegTable(columnar.np.frombuffer(
+        ''.join(lines), columnar.record_three_dtype()))
+
+
+def dates(index, position):
+    return [str(day) for day in index.leg_dates(position)]
+
+
+@unittest.skipIf(columnar.np is None, 'NumPy is not installed')
+class OperatingIndexTests(unittest.TestCase):
+    def testSample(self):
+        index = operating_dates.OperatingIndex.from_file(
+            './sample_data/hr.ssim.dat.gz')
+        self.assertEqual(
+            operating_dates.flight_keys(index.flights_on('02JAN15')),
+            [('HR', '330'), ('HR', '331')])
+        self.assertEqual(len(index.flights_on(datetime.date(2015, 1, 3))), 0)
+        self.assertEqual(list(index.legs_on('2015-01-02')), [0, 9])
+        self.assertEqual(len(index.flights_on('2030-01-01')), 0)
+        # Every leg found by the index matches the LegTable date filter.
+        for day in ('2015-05-22', '2015-06-01', '2015-07-24'):
+            self.assertEqual(
+                list(index.legs_on(day)),
+                list(columnar.np.flatnonzero(
+                    index.legs.mask(operating_on=day))))
+
+    def testFortnightly(self):
+        legs = make_legs(('1', '05JAN15', '01FEB15', '1      ', '2', '00'),
+                         ('2', '07JAN15', '01FEB15', '1 3    ', '2', '00'),
+                         ('3', '05JAN15', '01FEB15', '1      ', ' ', '00'))
+        index = operating_dates.OperatingIndex(legs)
+        self.assertEqual(dates(index, 0), ['2015-01-05', '2015-01-19'])
+        self.assertEqual(dates(index, 1), ['2015-01-07', '2015-01-19',
+                                           '2015-01-21'])
+        self.assertEqual(len(dates(index, 2)), 4)
+        self.assertEqual(list(index.legs_on('2015-01-12')), [2])
+        self.assertTrue(legs.mask(operating_on='2015-01-19').all())
+
+    def testDateVariation(self):
+        legs = make_legs(('1', '05JAN15', '11JAN15', '1      ', ' ', '12'),
+                         ('2', '05JAN15', '11JAN15', '1      ', ' ', 'A0'))
+        index = operating_dates.OperatingIndex(legs)
+        self.assertEqual(dates(index, 0), ['2015-01-06'])
+        self.assertEqual(dates(index, 1), ['2015-01-04'])
+        self.assertEqual(str(index.first_day), '2015-01-04')
+        self.assertEqual(list(index.legs_on('2015-01-05')), [])
+        self.assertEqual(list(index.legs_between('2015-01-01',
+                                                 '2015-01-31')), [0, 1])
+        self.assertEqual(list(legs.mask(operating_on='2015-01-06')),
+                         [True, False])
+
+    def testFlightsBetween(self):
+        legs = make_legs(('1', '05JAN15', '05JAN15', '1      ', ' ', '00'),
+                         ('1', '12JAN15', '12JAN15', '1      ', ' ', '00'),
+                         ('2', '06JAN15', '06JAN15', '12     ', ' ', '00'))
+        index = operating_dates.OperatingIndex(legs)
+        self.assertEqual(
+            operating_dates.flight_keys(index.flights_between('2015-01-05',
+                                                              '2015-01-06')),
+            [('XX', '1'), ('XX', '2')])
+        self.assertEqual(operating_dates.flight_keys(
+            index.flights_on('2015-01-12')), [('XX', '1')])
+
+
+if __name__ == '__main__':
+    unittest.main()
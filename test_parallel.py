@@ -0,0 +1,67 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import parallel
+from ssim_pprint import create_flights, parse_records, update_flights
+
+
+def flight_legs(flights):
+    """Reduce a flights dict to plain data for comparisons."""
+    return dict((name, dict((ivi, variation.legs)
+                            for ivi, variation in flight.ivi.items()))
+                for name, flight in flights.items())
+
+
+class ParallelParseTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.ssim = os.path.join(self.tmpdir, 'hr.ssim.dat')
+        f_in = gzip.open('./sample_data/hr.ssim.dat.gz', 'rb')
+        with open(self.ssim, 'wb') as f_out:
+            f_out.writelines(f_in)
+        f_in.close()
+        r2s, r3s, r4s = parse_records('HR', self.ssim)
+        self.expected = {}
+        create_flights(r2s[0], r3s, self.expected)
+        update_flights(r3s, self.expected)
+        update_flights(r4s, self.expected)
+
+    def testChunkRanges(self):
+        ranges = parallel.chunk_ranges(self.ssim, 7)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(self.ssim))
+        with open(self.ssim, 'rb') as f:
+            for start, end in ranges:
+                f.seek(start)
+                self.assertIn(f.read(1), '12345')
+
+    def testSingleWorkerMatchesSerial(self):
+        flights = parallel.parse_flights(self.ssim, workers=1)
+        self.assertEqual(flight_legs(flights), flight_legs(self.expected))
+
+    def testMergeAcrossChunks(self):
+        # Every chunk boundary splits a variation's records.
+        lines = open(self.ssim, 'rb').readlines()
+        results = [parallel.build_flights(lines[i:i + 2])
+                   for i in range(0, len(lines), 2)]
+        flights = parallel.merge_results(results)
+        self.assertEqual(flight_legs(flights), flight_legs(self.expected))
+        self.assertEqual(flights['HR330'].valid_start, '01JAN15')
+
+    def testWorkerPool(self):
+        flights = parallel.parse_flights(self.ssim, workers=3, carrier='hr')
+        self.assertEqual(flight_legs(flights), flight_legs(self.expected))
+
+    def testCompressedWorkerPool(self):
+        flights = parallel.parse_flights('./sample_data/hr.ssim.dat.gz',
+                                         workers=2)
+        self.assertEqual(flight_legs(flights), flight_legs(self.expected))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib2
+
+import columnar
+import query_server
+import utils
+
+
+SAMPLE = './sample_data/hr.ssim.dat.gz'
+
+
+class QueryServerTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'hr.ssim.dat.gz')
+        shutil.copy(SAMPLE, self.filename)
+        self.store = query_server.ScheduleStore([self.filename], workers=1)
+        self.server = query_server.QueryServer(('127.0.0.1', 0), self.store)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def get(self, path):
+        url = 'http://127.0.0.1:{}{}'.format(self.server.server_address[1],
+                                             path)
+        try:
+            response = urllib2.urlopen(url)
+        except urllib2.HTTPError as e:
+            return e.code, json.load(e)
+        return response.getcode(), json.load(response)
+
+    def testFlight(self):
+        status, body = self.get('/flights/hr330')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['flight'], 'HR330')
+        self.assertEqual(set(leg['departure_station'] for leg in body['legs']),
+                         set(['DUS']))
+        self.assertEqual(self.get('/flights/HR999')[0], 404)
+        self.assertEqual(self.get('/nowhere')[0], 404)
+
+    def testMarketed(self):
+        status, body = self.get('/marketed/lg')
+        self.assertEqual(status, 200)
+        self.assertEqual(len(body['legs']), 18)
+        self.assertEqual(body['legs'][0]['marketing_flight'], 'LG1330')
+        self.assertEqual(body['legs'][0]['flight'], 'HR330')
+        self.assertEqual(self.get('/marketed/XX')[1]['legs'], [])
+
+    @unittest.skipIf(columnar.np is None, 'NumPy is not installed')
+    def testIndexedQueries(self):
+        status, body = self.get('/operating?date=2015-01-02')
+        self.assertEqual(body['flights'], ['HR330', 'HR331'])
+        status, body = self.get('/stations/lux?date=2015-01-02')
+        self.assertEqual([leg['flight'] for leg in body['legs']], ['331'])
+        status, body = self.get(
+            '/connections?origin=DUS&destination=LUX&date=2015-01-02')
+        self.assertEqual(len(body['itineraries']), 1)
+        self.assertEqual(self.get('/operating')[0], 400)
+        self.assertEqual(self.get('/operating?date=someday')[0], 400)
+
+    def testStatsAndReload(self):
+        self.get('/flights/HR330')
+        status, body = self.get('/stats')
+        self.assertEqual(body['latency_ms']['flights']['requests'], 1)
+        self.assertEqual(self.store.refresh(), [])
+        before = self.store.current()[0]
+        # Replace the file with one holding only flight 331.
+        os.remove(self.filename)
+        with open(self.filename, 'wb') as f:
+            for line in utils.read_lines(SAMPLE):
+                if not (line[0] in '34' and line[5:9] == ' 330'):
+                    f.write(line)
+        self.assertEqual(self.store.refresh(), [self.filename])
+        self.assertIsNot(self.store.current()[0], before)
+        self.assertEqual(self.get('/flights/HR330')[0], 404)
+        self.assertEqual(self.get('/flights/HR331')[0], 200)
+        self.assertEqual(len(self.store.current('hr.ssim.dat.gz')), 1)
+
+    def testTruncatedFileKeepsOldCopy(self):
+        before = self.store.current()[0]
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        with open(self.filename, 'wb') as f:
+            f.write(data[:5])
+        self.assertEqual(self.store.refresh(), [])
+        self.assertIs(self.store.current()[0], before)
+        self.assertEqual(self.get('/flights/HR330')[0], 200)
+        # A later complete write is picked up.
+        with open(self.filename, 'wb') as f:
+            for line in utils.read_lines(SAMPLE):
+                if not (line[0] in '34' and line[5:9] == ' 330'):
+                    f.write(line)
+        self.assertEqual(self.store.refresh(), [self.filename])
+        self.assertEqual(self.get('/flights/HR330')[0], 404)
+
+    def testUnexpectedErrorAnswered(self):
+        def broken(store, params):
+            raise KeyError('schedules')
+        original = query_server.query_schedules
+        query_server.query_schedules = broken
+        try:
+            status, body = self.get('/schedules')
+        finally:
+            query_server.query_schedules = original
+        self.assertEqual(status, 500)
+        self.assertIn('schedules', body['error'])
+        status, body = self.get('/stats')
+        self.assertEqual(body['latency_ms']['schedules']['requests'], 1)
+
+
+class PercentileTests(unittest.TestCase):
+    def testPercentile(self):
+        samples = range(1, 101)
+        self.assertEqual(query_server.percentile(samples, 50), 50)
+        self.assertEqual(query_server.percentile(samples, 99), 99)
+        self.assertEqual(query_server.percentile([7], 90), 7)
+        self.assertIsNone(query_server.percentile([], 50))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import parallel
+import render
+import utils
+from ssim_pprint import iter_flights
+
+
+class RenderTests(unittest.TestCase):
+    ssim = './sample_data/hr.ssim.dat.gz'
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmpdir, 'out')
+
+    def render(self, output_format):
+        flights = iter_flights(utils.read_lines(self.ssim))
+        render.write_flights(flights, output_format, self.output)
+        with open(self.output, 'rb') as f:
+            return f.read()
+
+    def testIterFlightsMatchesFullParse(self):
+        expected = parallel.parse_flights(self.ssim, workers=1)
+        flights = list(iter_flights(utils.read_lines(self.ssim)))
+        self.assertEqual([f.name for f in flights], ['HR330', 'HR331'])
+        for flight in flights:
+            self.assertEqual(sorted(flight.ivi), sorted(expected[flight.name].ivi))
+            self.assertEqual(flight.ivi['01'].legs,
+                             expected[flight.name].ivi['01'].legs)
+            self.assertEqual(flight.valid_start, '01JAN15')
+
+    def testText(self):
+        output = self.render('text')
+        self.assertEqual(output.count('Record Variation: '), 18)
+        self.assertIn('departure_station : DUS\n', output)
+
+    def testJsonLines(self):
+        rows = [json.loads(line) for line in self.render('jsonl').splitlines()]
+        self.assertEqual(len(rows), 18)
+        self.assertEqual(rows[0]['flight'], '330')
+        self.assertEqual(rows[0]['deis'],
+                         {'DUSLUX': {'10': ['LG 1330'], '505': ['ET']}})
+
+    def testCsv(self):
+        rows = list(csv.reader(self.render('csv').splitlines()))
+        self.assertEqual(rows[0][:4],
+                         ['carrier_code', 'flight', 'ivi', 'leg_sequence'])
+        self.assertEqual(len(rows), 19)
+        self.assertEqual(rows[1][-1], 'DUSLUX/10=LG 1330;DUSLUX/505=ET')
+
+    def testTableAligned(self):
+        lines = self.render('table').splitlines()
+        self.assertEqual(len(lines), 19)
+        start = lines[0].index('departure_station')
+        self.assertEqual(set(line[start:start + 4] for line in lines[1:]),
+                         set(['DUS ', 'LUX ']))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import parallel
+import schedule_diff
+import snapshot
+import utils
+
+
+def flight_legs(flights):
+    """Reduce a flights dict to plain data for comparisons."""
+    return dict((name, dict((ivi, variation.legs)
+                            for ivi, variation in flight.ivi.items()))
+                for name, flight in flights.items())
+
+
+class ScheduleDiffTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.lines = list(utils.read_lines('./sample_data/hr.ssim.dat.gz'))
+        self.old = self.write('old.dat', self.lines)
+
+    def write(self, name, lines):
+        filename = os.path.join(self.tmpdir, name)
+        with open(filename, 'wb') as f:
+            f.writelines(lines)
+        return filename
+
+    def changed_schedule(self):
+        lines = list(self.lines)
+        # Retime HR330 variation 01 and drop variation 02 (record 3 and 4s).
+        lines[2] = lines[2].replace('08350835', '09000900')
+        del lines[5:8]
+        # Add HR332 as a copy of HR331 variation 01.
+        lines[-1:-1] = [l.replace('HR  331', 'HR  332') for l in self.lines
+                        if l[1:13] == ' HR  3310101']
+        return self.write('new.dat', lines)
+
+    def testIdenticalSchedules(self):
+        renumbered = [l[:194] + '999999' + l[200:] if l[:1] in '34' else l
+                      for l in self.lines]
+        diff = schedule_diff.diff_schedules(
+            self.old, self.write('same.dat', renumbered))
+        self.assertEqual(len(diff), 0)
+
+    def testDiff(self):
+        diff = schedule_diff.diff_schedules(self.old, self.changed_schedule())
+        self.assertEqual(diff.added_flights, set([('HR', '332')]))
+        self.assertEqual(diff.removed_flights, set())
+        self.assertEqual(diff.changed_flights, set([('HR', '330')]))
+        self.assertEqual(list(diff.changed_legs), [('HR', '330', '01', '01')])
+        self.assertEqual(diff.removed_legs, set([('HR', '330', '02', '01')]))
+        self.assertEqual(list(diff.added_legs), [('HR', '332', '01', '01')])
+
+    def testApplyMatchesFullParse(self):
+        new = self.changed_schedule()
+        flights = parallel.parse_flights(self.old, workers=1)
+        schedule_diff.apply_diff(flights,
+                                 schedule_diff.diff_schedules(self.old, new))
+        expected = parallel.parse_flights(new, workers=1)
+        self.assertEqual(flight_legs(flights), flight_legs(expected))
+        self.assertEqual(flights['HR332'].valid_end, '31DEC16')
+
+    def testReloadSnapshot(self):
+        new = self.changed_schedule()
+        cache = snapshot.SnapshotCache(os.path.join(self.tmpdir, 'cache'))
+        # The first load has no digests to diff against.
+        flights, diff, old_key = schedule_diff.reload_flights(
+            self.old, self.old, cache, workers=1)
+        self.assertIsNone(diff)
+        self.assertEqual(old_key, cache.key(self.old))
+        # The old file is no longer needed once its snapshot is saved.
+        os.remove(self.old)
+        flights, diff, key = schedule_diff.reload_flights(old_key, new, cache)
+        self.assertEqual(len(diff.added_legs), 1)
+        self.assertEqual(key, cache.key(new))
+        self.assertEqual(flight_legs(cache.load(key)),
+                         flight_legs(parallel.parse_flights(new, workers=1)))
+        # An unchanged day diffs to nothing against the saved digests.
+        flights, diff, same = schedule_diff.reload_flights(key, new, cache)
+        self.assertEqual((len(diff), same), (0, key))
+
+    def testReloadReadsNewFileOnce(self):
+        cache = snapshot.SnapshotCache(os.path.join(self.tmpdir, 'cache'))
+        read_lines = utils.read_lines
+        def fail(filename):
+            self.fail('{!r} read a second time'.format(filename))
+        utils.read_lines = fail
+        try:
+            flights, diff, key = schedule_diff.reload_flights(
+                self.old, self.old, cache, workers=1)
+        finally:
+            utils.read_lines = read_lines
+        self.assertEqual(flight_legs(flights),
+                         flight_legs(parallel.parse_flights(self.old, 1)))
+        self.assertEqual(cache.load_entry(key)[1],
+                         schedule_diff.schedule_digests(self.old))
+
+    def split_schedule(self, name, extra=()):
+        """Move the record 4s of HR330 variation 01 to the end of the file."""
+        lines = self.lines[:3] + self.lines[5:-1] + self.lines[3:5]
+        return self.write(name, lines + list(extra) + self.lines[-1:])
+
+    def testSplitLegKeepsEveryGroup(self):
+        key = ('HR', '330', '01', '01')
+        split = self.split_schedule('split.dat')
+        diff = schedule_diff.diff_schedules(self.old, split)
+        self.assertEqual(list(diff.changed_legs), [key])
+        self.assertEqual(diff.changed_legs[key], self.lines[2:5])
+        flights = parallel.parse_flights(self.old, workers=1)
+        schedule_diff.apply_diff(flights, diff)
+        self.assertEqual(flight_legs(flights),
+                         flight_legs(parallel.parse_flights(split, 1)))
+        # The same split in both versions is no change.
+        again = schedule_diff.diff_schedules(
+            split, self.split_schedule('again.dat'))
+        self.assertEqual(len(again), 0)
+
+    def testSplitLegAfterUnchangedGroup(self):
+        # The record 3 and 4s of HR330 01 are unchanged, then one more
+        # record 4 for the leg follows later in the file.
+        extra = self.lines[4].replace('LUXET', 'LUXEN')
+        self.assertNotEqual(extra, self.lines[4])
+        new = self.write('new.dat', self.lines[:-1] + [extra] +
+                         self.lines[-1:])
+        self.assertRaises(schedule_diff.RepeatedLegError,
+                          schedule_diff.diff_schedules, self.old, new)
+        cache = snapshot.SnapshotCache(os.path.join(self.tmpdir, 'cache'))
+        flights, diff, old_key = schedule_diff.reload_flights(
+            self.old, self.old, cache, workers=1)
+        flights, diff, key = schedule_diff.reload_flights(
+            old_key, new, cache, workers=1)
+        self.assertIsNone(diff)
+        self.assertEqual(flight_legs(flights),
+                         flight_legs(parallel.parse_flights(new, 1)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+if __name__ == "__main__":
+    unittest.main()
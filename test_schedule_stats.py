@@ -0,0 +1,120 @@
+import collections
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import columnar
+import operating_dates
+import schedule_stats
+from flight_classes import RecordThree
+from ssim_generator import generate_ssim
+from utils import make_record
+
+
+def leg(start, end, days, frequency=' ', variation='00', std='0800',
+        sta='0930', departure_utc='+0000', arrival_utc='+0100'):
+    return make_record('3', RecordThree.LAYOUT, {
+        'carrier_code': 'XX',
+        'flight': '   1',
+        'ivi': '01',
+        'leg_sequence': '01',
+        'period_of_operation_start': start,
+        'period_of_operation_end': end,
+        'days_of_operation': days,
+        'frequency_rate': frequency,
+        'departure_station': 'AAA',
+        'passenger_std': std,
+        'departure_utc_variation': departure_utc,
+        'arrival_station': 'BBB',
+        'passenger_sta': sta,
+        'arrival_utc_variation': arrival_utc,
+        'aircraft_type': '320',
+        'date_variation': variation,
+        })
+
+
+def dates(stats, station='AAA'):
+    return [(str(day), count) for code, day, count
+            in stats.station_days(station)]
+
+
+class ScheduleStatsTests(unittest.TestCase):
+    def testWeeklyRuns(self):
+        stats = schedule_stats.ScheduleStats().update(
+            [leg('05JAN15', '18JAN15', '1 3    ')])
+        self.assertEqual(dates(stats), [('2015-01-05', 1), ('2015-01-07', 1),
+                                        ('2015-01-12', 1), ('2015-01-14', 1)])
+        self.assertEqual(stats.departures, 4)
+        self.assertEqual(list(stats.route_weeks()),
+                         [('AAA', 'BBB', datetime.date(2015, 1, 5), 2),
+                          ('AAA', 'BBB', datetime.date(2015, 1, 12), 2)])
+        self.assertEqual(list(stats.aircraft()), [('320', 1, 4)])
+
+    def testFortnightlyAndDateVariation(self):
+        stats = schedule_stats.ScheduleStats().update([
+            leg('07JAN15', '01FEB15', '1 3    ', frequency='2'),
+            leg('05JAN15', '11JAN15', '1      ', variation='A0')])
+        self.assertEqual(dates(stats), [('2015-01-04', 1), ('2015-01-07', 1),
+                                        ('2015-01-19', 1), ('2015-01-21', 1)])
+
+    def testBlockTimes(self):
+        # 0800 UTC to 0830 UTC, then an overnight 2300 to 0100 next day.
+        stats = schedule_stats.ScheduleStats().update([
+            leg('05JAN15', '05JAN15', '1      '),
+            leg('05JAN15', '05JAN15', '1      ', std='2300', sta='0100',
+                variation='01', arrival_utc='+0000')])
+        self.assertEqual(stats.block_time_distribution(), [(30, 1), (120, 1)])
+        self.assertEqual(stats.block_time_percentile(50), 30)
+        self.assertEqual(stats.block_time_percentile(100), 120)
+        # In a UTC schedule the UTC variations are not applied again.
+        line = leg('05JAN15', '05JAN15', '1      ')
+        self.assertEqual(schedule_stats.ScheduleStats.block_time(line, 'U'),
+                         90)
+
+    def testOpenEndedAndInvalid(self):
+        stats = schedule_stats.ScheduleStats().update([
+            leg('05JAN15', '00XXX00', '1      '),
+            leg('XXXXXXX', '11JAN15', '1      ')])
+        self.assertEqual(stats.legs, 1)
+        self.assertEqual(stats.skipped, 1)
+        self.assertEqual(stats.departures, 53)
+
+
+@unittest.skipIf(columnar.np is None, 'NumPy is not installed')
+class OperatingIndexAgreementTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assertAgrees(self, filename):
+        stats = schedule_stats.schedule_stats(filename)
+        index = operating_dates.OperatingIndex.from_file(filename)
+        stations = index.legs.column('departure_station')
+        expected = collections.Counter()
+        departures = 0
+        for position in range(len(index.legs)):
+            for day in index.leg_dates(position):
+                expected[(stations[position],
+                          str(day.astype(datetime.date)))] += 1
+                departures += 1
+        counted = dict(((code, str(day)), count)
+                       for code, day, count in stats.station_days())
+        self.assertEqual(counted, dict(expected))
+        self.assertEqual(stats.departures, departures)
+
+    def testSample(self):
+        self.assertAgrees('./sample_data/hr.ssim.dat.gz')
+
+    def testSynthetic(self):
+        filename = os.path.join(self.tmpdir, 'synthetic.ssim.dat.gz')
+        generate_ssim(filename, compress=True, carriers=2, flights=30,
+                      variations=3, legs=2, deis=1, seed=5)
+        self.assertAgrees(filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import snapshot
+
+
+class SnapshotCacheTests(unittest.TestCase):
+    ssim = './sample_data/hr.ssim.dat.gz'
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = snapshot.SnapshotCache(self.tmpdir)
+
+    def testLoadFlightsUsesSnapshot(self):
+        flights = snapshot.load_flights(self.ssim, workers=1,
+                                        cache=self.cache)
+        key = self.cache.key(self.ssim)
+        self.assertTrue(os.path.exists(self.cache.path(key)))
+        cached = self.cache.load(key)
+        self.assertEqual(sorted(cached), sorted(flights))
+        self.assertEqual(cached['HR330'].ivi['01'].legs,
+                         flights['HR330'].ivi['01'].legs)
+        self.assertEqual(cached['HR330'].time_mode, 'L')
+
+    def testKeyDependsOnContentAndCarrier(self):
+        other = os.path.join(self.tmpdir, 'other.dat')
+        with open(other, 'wb') as f:
+            f.write('1AIRLINE STANDARD SCHEDULE DATA SET')
+        self.assertNotEqual(self.cache.key(self.ssim), self.cache.key(other))
+        self.assertNotEqual(self.cache.key(self.ssim),
+                            self.cache.key(self.ssim, 'HR'))
+        self.assertTrue(self.cache.key(self.ssim).endswith(
+            '-v{}'.format(snapshot.PARSER_VERSION)))
+
+    def testMiss(self):
+        self.assertEqual(self.cache.load('missing'), None)
+
+    def testEvictLeastRecentlyUsed(self):
+        for i, key in enumerate(['a', 'b', 'c']):
+            self.cache.save(key, {'flight': 'x' * 100})
+            os.utime(self.cache.path(key), (i, i))
+        self.cache.load('a')
+        size = os.path.getsize(self.cache.path('a'))
+        self.cache.max_bytes = size * 2
+        self.cache.evict()
+        remaining = [os.path.basename(p) for m, s, p in self.cache.snapshots()]
+        self.assertEqual(sorted(remaining), ['a.snap', 'c.snap'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+if __name__ == "__main__":
+    unittest.main()
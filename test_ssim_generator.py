@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import parallel
+import utils
+from ssim_generator import SsimGenerator, generate_ssim
+
+
+class SsimGeneratorTests(unittest.TestCase):
+    options = dict(carriers=3, flights=4, variations=2, legs=3, deis=2,
+                   seed=7)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testDeterministic(self):
+        first = list(SsimGenerator(**self.options).lines())
+        self.assertEqual(first, list(SsimGenerator(**self.options).lines()))
+        options = dict(self.options, seed=8)
+        self.assertNotEqual(first, list(SsimGenerator(**options).lines()))
+
+    def testRecordLayout(self):
+        lines = list(SsimGenerator(**self.options).lines())
+        for serial, line in enumerate(lines, 1):
+            self.assertEqual(len(line.rstrip('\n')), 200)
+            self.assertEqual(int(line[194:200]), serial)
+        types = [line[0] for line in lines]
+        self.assertEqual(types[0], '1')
+        self.assertEqual(types.count('2'), 3)
+        self.assertEqual(types.count('3'), 3 * 4 * 2 * 3)
+        self.assertEqual(types.count('4'), 3 * 4 * 2 * 3 * 2)
+        self.assertEqual(types.count('5'), 3)
+
+    def testParses(self):
+        ssim = os.path.join(self.tmpdir, 'synthetic.ssim.dat.gz')
+        count = generate_ssim(ssim, compress=True, **self.options)
+        self.assertEqual(count, len(list(utils.read_lines(ssim))))
+        flights = parallel.parse_flights(ssim, workers=1)
+        self.assertEqual(len(flights), 3 * 4)
+        for flight in flights.values():
+            self.assertEqual(sorted(flight.ivi), ['01', '02'])
+            for variation in flight.ivi.values():
+                self.assertEqual(sorted(variation.legs), ['01', '02', '03'])
+                legs = [variation.legs[seq] for seq in sorted(variation.legs)]
+                for leg, next_leg in zip(legs, legs[1:]):
+                    self.assertEqual(leg.arrival_station,
+                                     next_leg.departure_station)
+                for leg in legs:
+                    self.assertEqual(len(leg.segments), 1)
+            self.assertEqual(flight.time_mode, 'L')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+
+import utils
+from flight_classes import (Flight, RecordThree, RecordFour,
+                            classify_record)
+from ssim_pprint import (build_batch_flights, create_flights,
+                         parse_batch_records, parse_records, update_flights)
+
+
+class BatchLookupTests(unittest.TestCase):
+    ssim = './sample_data/hr.ssim.dat.gz'
+
+    def testParseFlightKey(self):
+        self.assertEqual(utils.parse_flight_key('hr330'), ('HR', '330'))
+        self.assertEqual(utils.parse_flight_key('HR/330'), ('HR', '330'))
+        self.assertEqual(utils.parse_flight_key(' HR 330 '), ('HR', '330'))
+
+    def testBatchMatchesSingleParse(self):
+        r2s, r3s, r4s = parse_records('HR', self.ssim)
+        expected = {}
+        create_flights(r2s[0], r3s, expected)
+        update_flights(r3s, expected)
+        update_flights(r4s, expected)
+
+        carrier_records, b3s, b4s = parse_batch_records(
+            [('HR', '330'), ('hr', '331')], self.ssim)
+        flights = build_batch_flights(carrier_records, b3s, b4s)
+        self.assertEqual(sorted(flights), sorted(expected))
+        for name in flights:
+            self.assertEqual(sorted(flights[name].ivi),
+                             sorted(expected[name].ivi))
+
+    def testBatchSkipsUnrequested(self):
+        carrier_records, b3s, b4s = parse_batch_records(
+            [('HR', '330'), ('XX', '1')], self.ssim)
+        self.assertEqual(list(carrier_records), ['HR'])
+        self.assertEqual(set(r.flight for r in b3s + b4s), set(['330']))
+        flights = build_batch_flights(carrier_records, b3s, b4s)
+        self.assertEqual(list(flights), ['HR330'])
+
+
+class ClassifyRecordTests(unittest.TestCase):
+    def testClassify(self):
+        self.assertEqual(classify_record('2LHR      ', 'HR'), '2')
+        self.assertEqual(classify_record('3 HR  330', 'HR'), '3')
+        self.assertEqual(classify_record('5 HR     ', 'HR'), '5')
+        self.assertEqual(classify_record('3 HRX 330', 'HR'), None)
+        self.assertEqual(classify_record('3 AB  330', 'HR'), None)
+        self.assertEqual(classify_record('1AIRLINE STANDARD', 'HR'), None)
+
+    def testParseRecordsCounts(self):
+        r2s, r3s, r4s = parse_records('hr', './sample_data/hr.ssim.dat.gz')
+        self.assertEqual((len(r2s), len(r3s), len(r4s)), (1, 18, 36))
+
+
+class LazyRecordTests(unittest.TestCase):
+    def setUp(self):
+        lines = list(utils.read_lines('./sample_data/hr.ssim.dat.gz'))
+        self.leg = RecordThree(lines[2])
+        self.seg = RecordFour(lines[3])
+
+    def testFieldsDecodedOnAccess(self):
+        self.assertEqual(self.leg._fields, None)
+        self.assertEqual(self.leg.departure_station, 'DUS')
+        self.assertEqual(self.leg._fields, {'departure_station': 'DUS'})
+
+    def testRecordFields(self):
+        self.assertEqual(self.leg.name, 'HR33001_r3')
+        self.assertEqual(self.leg.passenger_std, '0835')
+        self.assertEqual(self.leg.record_serial_number, '000003')
+        self.assertEqual(self.seg.dei, '010')
+        self.assertEqual(self.seg.segment, 'DUSLUX')
+        self.assertEqual(self.seg.dei_data, 'LG 1330')
+
+    def testAsDict(self):
+        fields = self.seg.as_dict()
+        self.assertEqual(fields['name'], 'HR33001_r4')
+        self.assertEqual(fields['board_point'], 'DUS')
+        self.assertNotIn('original_record', fields)
+
+
+class FlightVariationTests(unittest.TestCase):
+    def setUp(self):
+        lines = list(utils.read_lines('./sample_data/hr.ssim.dat.gz'))
+        self.flight = Flight('HR', '330', None)
+        for line in lines[2:5]:
+            record_class = RecordThree if line[0] == '3' else RecordFour
+            self.flight.create_variation('01', record_class(line))
+        # A second codeshare on the same segment.
+        self.flight.create_variation('01', RecordFour(
+            lines[3].replace('LG 1330', 'LX 4711')))
+        self.variation = self.flight.ivi['01']
+
+    def testLegFields(self):
+        leg = self.variation.legs['01']
+        self.assertEqual(leg.departure_station, 'DUS')
+        self.assertEqual(leg.arrival_station, 'LUX')
+        self.assertEqual(sorted(leg.segments), [('DUS', 'LUX')])
+
+    def testAllDeisKept(self):
+        self.assertEqual(self.variation.dei('DUS', 'LUX', 10),
+                         ['LG 1330', 'LX 4711'])
+        self.assertEqual(self.variation.dei('DUS', 'LUX', 505), ['ET'])
+        self.assertEqual(self.variation.dei('LUX', 'DUS', 10), [])
+        segment = self.variation.legs['01'].segments[('DUS', 'LUX')]
+        self.assertEqual(segment.deis[10], ['LG 1330', 'LX 4711'])
+
+    def testRemoveLeg(self):
+        self.variation.remove_leg('01')
+        self.assertEqual(self.variation.legs, {})
+        self.assertEqual(self.variation.deis, {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import utils
+from ssim_generator import generate_ssim
+from ssim_pprint import parse_records
+from ssim_split import WriterPool, split_ssim
+
+
+class SplitTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.ssim = os.path.join(self.tmpdir, 'multi.ssim.dat.gz')
+        generate_ssim(self.ssim, compress=True, carriers=4, flights=5,
+                      variations=2, legs=2, deis=1, seed=3)
+        self.lines = list(utils.read_lines(self.ssim))
+        self.output = os.path.join(self.tmpdir, 'out')
+        os.mkdir(self.output)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testSplitEveryCarrier(self):
+        outputs = split_ssim(self.ssim, self.output, max_open=1)
+        carriers = [line[2:5].strip() for line in self.lines
+                    if line[0] == '2']
+        self.assertEqual(list(outputs), carriers)
+        for carrier, (filename, records) in outputs.items():
+            lines = list(utils.read_lines(filename))
+            self.assertEqual(len(lines), records)
+            self.assertEqual(lines[0], self.lines[0][:194] + '000001\n')
+            self.assertEqual([int(line[194:200]) for line in lines],
+                             range(1, records + 1))
+            # Everything between the header and trailer is the carrier's
+            # records, unchanged apart from the serial number.
+            expected = [line[:194] for line in
+                        utils.carrier_lines(self.lines, carrier)
+                        if line[0] != '5']
+            self.assertEqual([line[:194] for line in lines[1:-1]], expected)
+            trailer = lines[-1]
+            self.assertEqual(trailer[:5], '5 {:<3}'.format(carrier))
+            self.assertEqual(trailer[187:194],
+                             '{:06d}E'.format(records - 1))
+            r2s, r3s, r4s = parse_records(carrier, filename)
+            self.assertEqual(len(r2s), 1)
+
+    def testSelectedCarriersCompressed(self):
+        carrier = self.lines[1][2:5].strip()
+        outputs = split_ssim(self.ssim, self.output, carriers=[carrier.lower()],
+                             compress=True, workers=2)
+        self.assertEqual(list(outputs), [carrier])
+        filename = outputs[carrier][0]
+        self.assertTrue(filename.endswith('.gz'))
+        self.assertEqual(utils.is_file_compressed(filename), (True, 'gz'))
+        self.assertEqual(os.listdir(self.output),
+                         [os.path.basename(filename)])
+        self.assertEqual(len(list(utils.read_lines(filename))),
+                         outputs[carrier][1])
+
+    def testWriterPoolCapsHandles(self):
+        pool = WriterPool(max_open=2, flush_size=1)
+        names = [os.path.join(self.output, name) for name in 'abc']
+        for round in range(3):
+            for name in names:
+                pool.write(name, str(round))
+                self.assertLessEqual(len(pool.handles), 2)
+        pool.close()
+        for name in names:
+            with open(name) as f:
+                self.assertEqual(f.read(), '012')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,14 @@
+import bz2
+import hashlib
 import os
+import shutil
+import tempfile
 import unittest
+import zipfile
 
-from utils import is_file_compressed, uncompress
+from utils import (carrier_lines, flight_lines, hash_file,
+                   is_file_compressed, isolateFlight, makeSingleCarrierSSIM,
+                   read_lines, read_lines_hashed, tee_lines, uncompress)
 
 class UncompressTests(unittest.TestCase):
     def testUncompressFile(self):
@@ -27,5 +34,97 @@ class UncompressTests(unittest.TestCase):
         if os.path.exists(file):
             os.remove(file)
 
+
+class ReadLinesTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.expected = list(read_lines('./sample_data/hr.ssim.dat.gz'))
+        self.plain = os.path.join(self.tmpdir, 'hr.ssim.dat')
+        with open(self.plain, 'wb') as f:
+            f.writelines(self.expected)
+
+    def testReadGzip(self):
+        self.assertEqual(len(self.expected), 57)
+        self.assertTrue(self.expected[0].startswith('1AIRLINE'))
+        self.assertTrue(self.expected[-1].startswith('5 HR'))
+
+    def testReadPlain(self):
+        self.assertEqual(list(read_lines(self.plain)), self.expected)
+
+    def testReadBz2(self):
+        filename = self.plain + '.bz2'
+        f = bz2.BZ2File(filename, 'wb')
+        f.writelines(self.expected)
+        f.close()
+        self.assertEqual(is_file_compressed(filename), (True, 'bz2'))
+        self.assertEqual(list(read_lines(filename)), self.expected)
+
+    def testReadZipMembers(self):
+        filename = self.plain + '.zip'
+        with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.write(self.plain, 'first.dat')
+            z.write(self.plain, 'second.dat')
+        self.assertEqual(is_file_compressed(filename), (True, 'zip'))
+        self.assertEqual(list(read_lines(filename)), self.expected * 2)
+
+    def testReadHashed(self):
+        bz2_name = self.plain + '.bz2'
+        f = bz2.BZ2File(bz2_name, 'wb')
+        f.writelines(self.expected)
+        f.close()
+        zip_name = self.plain + '.zip'
+        with zipfile.ZipFile(zip_name, 'w') as z:
+            z.write(self.plain, 'only.dat')
+        for filename in ('./sample_data/hr.ssim.dat.gz', self.plain,
+                         bz2_name, zip_name):
+            digest = hashlib.sha1()
+            self.assertEqual(list(read_lines_hashed(filename, digest)),
+                             self.expected)
+            expected = hashlib.sha1()
+            hash_file(filename, expected)
+            self.assertEqual(digest.hexdigest(), expected.hexdigest())
+
+    def testNoFilesWritten(self):
+        list(read_lines('./sample_data/hr.ssim.dat.gz'))
+        self.assertFalse(os.path.exists('./sample_data/hr.ssim.dat'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+class PipelineTests(unittest.TestCase):
+    ssim = './sample_data/hr.ssim.dat.gz'
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def testFlightLines(self):
+        lines = list(flight_lines(read_lines(self.ssim), 'hr', '330'))
+        self.assertEqual(lines[0][0], '2')
+        self.assertEqual(set(line[5:9] for line in lines[1:]), set([' 330']))
+        self.assertEqual(len(lines), 28)
+        self.assertEqual(list(flight_lines(lines, 'XX', '330')), [])
+
+    def testCarrierLines(self):
+        lines = list(read_lines(self.ssim))
+        self.assertEqual(list(carrier_lines(lines, 'HR')), lines[1:])
+        self.assertEqual(list(carrier_lines(lines, 'XX')), [])
+
+    def testFilesOnlyWhenAsked(self):
+        output = os.path.join(self.tmpdir, 'hr330.dat')
+        expected = list(flight_lines(read_lines(self.ssim), 'HR', '330'))
+        self.assertEqual(isolateFlight('HR', '330', self.ssim, output),
+                         output)
+        self.assertEqual(list(read_lines(output)), expected)
+        output = os.path.join(self.tmpdir, 'hr.dat')
+        makeSingleCarrierSSIM('HR', self.ssim, output)
+        self.assertEqual(len(list(read_lines(output))), 56)
+        output = os.path.join(self.tmpdir, 'tee.dat')
+        self.assertEqual(list(tee_lines(iter(expected), output)), expected)
+        self.assertEqual(list(read_lines(output)), expected)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,27 +1,46 @@
+import bz2
 import gzip
-import re
+import io
+import os
+import zipfile
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+import instrumentation
+import render
+from flight_classes import classify_record
+
+
+# Size of the reads issued against SSIM files and decompressors.
+READ_BUFFER_SIZE = 1024 * 1024
+RECORD_LENGTH = 200
 
 
 def is_file_compressed(filename):
-    """ Determine if the file is compressed with gzip or zip.
+    """ Determine if the file is compressed, and with what.
 
-    Only supporting gz and zip currently - we don't receive anything
-    else at this time.
+    Recognises gzip, zip, bzip2 and xz by their magic numbers.
 
     Args:
       filename: name of the file to check.
     Returns:
-      A string indicating the type of file.
+      A tuple of (True, filetype) for compressed files, False otherwise.
     """
 
     magic_dict = {
         "\x1f\x8b\x08": "gz",
-        "\x50\x4b\x03\x04": "zip"
+        "\x50\x4b\x03\x04": "zip",
+        "\x42\x5a\x68": "bz2",
+        "\xfd\x37\x7a\x58\x5a\x00": "xz"
         }
 
     max_len = max(len(x) for x in magic_dict)
 
-    with open(filename) as f:
+    with open(filename, 'rb') as f:
         file_start = f.read(max_len)
         for magic, filetype in magic_dict.items():
             if file_start.startswith(magic):
@@ -29,6 +48,176 @@ def is_file_compressed(filename):
         return False
 
 
+def open_ssim(filename):
+    """Open an SSIM file for buffered reading, decompressing on the fly.
+
+    Zip archives may hold several members, so use read_lines for those.
+
+    Args:
+      filename: str.  Plain, gzip, bzip2 or xz compressed SSIM file.
+    Returns:
+      A binary file object yielding the uncompressed SSIM data.
+    """
+    compressed = is_file_compressed(filename)
+    if not compressed:
+        return io.open(filename, 'rb', buffering=READ_BUFFER_SIZE)
+    filetype = compressed[1]
+    if filetype == 'gz':
+        return _buffered(gzip.GzipFile(filename, 'rb'))
+    if filetype == 'bz2':
+        if instrumentation.ENABLED:
+            return _buffered(bz2.BZ2File(filename, 'rb'))
+        return bz2.BZ2File(filename, 'rb', READ_BUFFER_SIZE)
+    if filetype == 'xz' and lzma is not None:
+        return _buffered(lzma.LZMAFile(filename, 'rb'))
+    raise IOError('Cannot stream {} file {!r}'.format(filetype, filename))
+
+
+def _buffered(f):
+    """Buffer reads from a decompressor, timing them under --stats."""
+    if instrumentation.ENABLED:
+        f = instrumentation.DecompressTimer(f)
+    return io.BufferedReader(f, READ_BUFFER_SIZE)
+
+
+def read_lines(filename):
+    """Yield every line of an SSIM file without writing anything to disk.
+
+    Compressed input is decompressed as it is read.  Every member of a zip
+    archive is read, in archive order.
+
+    Args:
+      filename: str.  The SSIM file to read.
+    Yields:
+      Each line of the uncompressed file, line endings included.
+    """
+    if instrumentation.ENABLED:
+        return instrumentation.counted_lines(_read_lines(filename))
+    return _read_lines(filename)
+
+
+def _read_lines(filename):
+    compressed = is_file_compressed(filename)
+    if compressed and compressed[1] == 'zip':
+        with zipfile.ZipFile(filename) as archive:
+            for member in archive.infolist():
+                if member.filename.endswith('/'):
+                    continue
+                f = _buffered(archive.open(member))
+                try:
+                    for line in f:
+                        yield line
+                finally:
+                    f.close()
+        return
+    f = open_ssim(filename)
+    try:
+        for line in f:
+            yield line
+    finally:
+        f.close()
+
+
+def hash_file(filename, digest):
+    """Feed the raw bytes of a file to a hashlib object."""
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(READ_BUFFER_SIZE)
+            if not block:
+                break
+            digest.update(block)
+
+
+# Streaming decompressors by is_file_compressed type; None reads plain.
+STREAM_DECOMPRESSORS = {
+    None: None,
+    'gz': lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    'bz2': bz2.BZ2Decompressor,
+    }
+
+
+def read_lines_hashed(filename, digest):
+    """Yield every line of an SSIM file while hashing its raw bytes.
+
+    Plain, gzip and bzip2 files are hashed in the same pass that reads
+    them; other formats are hashed after their last line, in a second
+    pass over the file.  Once every line has been read, digest holds the
+    hash of the whole file, as hash_file would give.
+
+    Args:
+      filename: str.  The SSIM file to read.
+      digest: hashlib object.  Updated with the file's raw bytes.
+    Yields:
+      Each line of the uncompressed file, line endings included.
+    """
+    lines = _read_lines_hashed(filename, digest)
+    if instrumentation.ENABLED:
+        return instrumentation.counted_lines(lines)
+    return lines
+
+
+def _read_lines_hashed(filename, digest):
+    compressed = is_file_compressed(filename)
+    filetype = compressed[1] if compressed else None
+    if filetype not in STREAM_DECOMPRESSORS:
+        for line in _read_lines(filename):
+            yield line
+        hash_file(filename, digest)
+        return
+    pending = ''
+    for chunk in _hashed_chunks(filename, digest,
+                                STREAM_DECOMPRESSORS[filetype]):
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    if pending:
+        yield pending
+
+
+def _hashed_chunks(filename, digest, make_decompressor):
+    """Yield the uncompressed data of a file, hashing what is read.
+
+    Concatenated members of a gzip or bzip2 file are each decompressed.
+    """
+    decompressor = make_decompressor() if make_decompressor else None
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(READ_BUFFER_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            if decompressor is None:
+                yield block
+                continue
+            while block:
+                yield decompressor.decompress(block)
+                block = decompressor.unused_data
+                if block:
+                    decompressor = make_decompressor()
+    if decompressor is not None and hasattr(decompressor, 'flush'):
+        yield decompressor.flush()
+
+
+def make_record(record_type, layout, values):
+    """Lay values out at their LAYOUT offsets in a blank 200 column record.
+
+    Args:
+      record_type: str.  The record type character for column 1.
+      layout: tuple.  (name, start, end) entries, e.g. RecordThree.LAYOUT.
+      values: dict.  Field name to value; values are left justified and
+        truncated to the field width.
+    Returns:
+      The record as a str of exactly RECORD_LENGTH characters.
+    """
+    line = [' '] * RECORD_LENGTH
+    line[0] = record_type
+    for name, start, end in layout:
+        if name in values:
+            line[start:end] = str(values[name]).ljust(end - start)[:end - start]
+    return ''.join(line)
+
+
 def uncompress(filename):
     """Uncompress the gzipped file, return the uncompressed file name.
 
@@ -38,106 +227,146 @@ def uncompress(filename):
     args: gzfilename - the name of the gzipped file you want to uncompress.
     """
 
-    print('Uncompressing file {!r}'.format(filename))
     if is_file_compressed(filename):
         new_name = filename.rstrip('.gz')
-        f_in = gzip.open(filename, 'rb')
+        # Keep an up to date copy so indexes built against it stay valid.
+        if (os.path.exists(new_name) and
+                os.path.getmtime(new_name) >= os.path.getmtime(filename)):
+            return new_name
+        print('Uncompressing file {!r}'.format(filename))
         f_out = open(new_name, 'wb')
-        f_out.writelines(f_in)
+        f_out.writelines(read_lines(filename))
         f_out.close()
-        f_in.close()
         return new_name
     else:
         return filename
 
 
-def makeSingleCarrierSSIM(carrier_code, filename):
+def carrier_lines(lines, carrier):
+    """Keep only the records belonging to one carrier.
+
+    Args:
+      lines: iterable of SSIM records, e.g. from read_lines.
+      carrier: str.  Two character IATA carrier code.
+    Yields:
+      The carrier's record 2, 3, 4 and 5 lines.
+    """
+    carrier = carrier.upper()
+    for line in lines:
+        if classify_record(line, carrier) is not None:
+            yield line
+
+
+def flight_lines(lines, carrier, flight_num):
+    """Keep a carrier's record 2 and the record 3s and 4s of one flight.
+
+    Args:
+      lines: iterable of SSIM records, e.g. from read_lines.
+      carrier: str.  Two character IATA carrier code.
+      flight_num: str.  The number of the flight to keep.
+    Yields:
+      The matching lines, in file order.
+    """
+    carrier = carrier.upper()
+    flight_num = flight_num.strip()
+    for line in lines:
+        record_type = classify_record(line, carrier)
+        if record_type == '2':
+            yield line
+        elif record_type == '3' or record_type == '4':
+            if line[5:9].strip() == flight_num:
+                yield line
+
+
+def tee_lines(lines, filename):
+    """Pass lines through unchanged while also writing them to filename.
+
+    Use this to keep a copy of an intermediate stage on disk; the file is
+    complete once the lines have been consumed.
+    """
+    with open(filename, 'wb') as f_out:
+        for line in lines:
+            f_out.write(line)
+            yield line
+
+
+def makeSingleCarrierSSIM(carrier_code, filename, output=None):
     """Create a single carrier SSIM file from a multiple carrier SSIM.
 
     Some SSIM files contain data for multiple airline carriers.  Create an
-    SSIM consisting of only a single requested carrier.
-    down to the single requested carrier.
+    SSIM consisting of only a single requested carrier.  Use carrier_lines
+    to filter in memory without writing a file.
 
+    Args:
+      carrier_code: str.  Two character IATA carrier code.
+      filename: str.  The name of the file to pull records out of.
+      output: str.  File to write, <carrier>_only.ssim.dat by default.
+    Returns:
+      The name of the file written.
     """
 
-    carrier_regex = '^[2345].' + carrier_code
-    single_carrier_ssim = carrier_code + "_only.ssim.dat"
-    f_out = open(single_carrier_ssim, 'wb')
-
-    if is_file_compressed(filename):
-        filename = uncompress(filename)
-    with open(filename, 'rb') as f_in:
-        for line in f_in:
-            if re.search(carrier_regex, line):
-                f_out.writelines(line)
-        f_out.close()
-        f_in.close()
+    single_carrier_ssim = output or carrier_code + "_only.ssim.dat"
+    with open(single_carrier_ssim, 'wb') as f_out:
+        f_out.writelines(carrier_lines(read_lines(filename), carrier_code))
     return single_carrier_ssim
 
 
-def isolateFlight(carrier, flight_num, filename):
+def isolateFlight(carrier, flight_num, filename, output=None):
     """Pull a single flight out of an SSIM file for parsing.
 
     Pull all record 3 and 4 entries pertaining to a single flight from
     an SSIM file, and keep the record 2 as it also has relevant info.
+    Use flight_lines to filter in memory without writing a file.
 
     Args:
       carrier: Str.  Two character IATA carrier code.
       flight_num: str.  The number for the flight we care about.
       filename: str.  The name of the file to pull records out of.
+      output: str.  File to write, <carrier>_<flight>.ssim.dat by default.
     Returns:
       single_flight_ssim: SSIM file on disk that contains one flight.
     """
 
     print('Isolating {} from file {!r}'.format(flight_num, filename))
-    print carrier, flight_num, filename
-    single_flight_ssim = carrier + "_" + flight_num + ".ssim.dat"
-    # Because the whitespace is variable depeding on the flight number, adapt
-    # the flight_num to account for that.
-    if len(flight_num) == 1:
-        flight_num = '    ' + flight_num
-    if len(flight_num) == 2:
-        flight_num = '   ' + flight_num
-    if len(flight_num) == 3:
-        flight_num = '  ' + flight_num
-    if len(flight_num) == 4:
-        flight_num = ' ' + flight_num
-    carrier_regex = '^2.' + carrier.upper()
-    flight_regex = '^[34].' + carrier.upper() + flight_num
-    f_out = open(single_flight_ssim, 'wb')
-
-    if is_file_compressed(filename):
-        filename = uncompress(filename)
-    with open(filename, 'rb') as f_in:
-        for line in f_in:
-            if re.match(carrier_regex, line):
-                f_out.writelines(line)
-            if re.match(flight_regex, line):
-                f_out.writelines(line)
-        f_out.close()
-        f_in.close()
+    single_flight_ssim = output or carrier + "_" + flight_num + ".ssim.dat"
+    with open(single_flight_ssim, 'wb') as f_out:
+        f_out.writelines(flight_lines(read_lines(filename), carrier,
+                                      flight_num))
     return single_flight_ssim
 
 
-def pprint_flight(flights):
+def parse_flight_key(key):
+    """Split a flight such as 'HR330', 'HR/330' or 'HR 330' into parts.
+
+    Without a separator the first two characters are the carrier code.
+
+    Args:
+      key: str.  The flight as typed by the user.
+    Returns:
+      A tuple of (carrier code, flight number), both upper cased strings.
+    """
+
+    key = key.strip().upper()
+    for separator in '/ -':
+        if separator in key:
+            carrier, flight_num = key.split(separator, 1)
+            return carrier.strip(), flight_num.strip()
+    return key[:2], key[2:].strip()
+
+
+def pprint_flight(flights, output_format='text', out=None):
     """Pretty print information for all flights present in the dictionary.
 
     Args:
       flights: dict - dictionary of flights to pretty print info for.
+      output_format: str - one of render.OUTPUT_FORMATS.
+      out: str - file to write to instead of standard output.
     Returns:
       ??? - what do you do with functions whose whole point is to print?
 
     """
-    for flight in flights:
-        flight = flights[flight]
-        for iv in sorted(flight.ivi):
-            print("Record Variation: {}".format(flight.ivi[iv].name))
-            legs = flight.ivi[iv].legs
-            for leg in sorted(legs):
-                leg = legs[leg]
-                for record in leg:
-                    print("{} : {}".format(record, leg[record]))
-
+    render.write_flights((flights[flight] for flight in flights),
+                         output_format, out)
 
 
 def make_recordtwo_dict(line):